@@ -8,7 +8,7 @@ from flask import Flask, render_template, request, session, redirect, url_for, j
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
-import sqlite3
+import hmac
 import uuid
 import os
 from pathlib import Path
@@ -20,13 +20,65 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+import database
+from database import DB_TYPE, get_db, pool_stats
+import search as search_index
+import pagination
+import ratings
+import seller_stats
+import sales_rollups
+import inventory
+import order_writer
+import stripe_orders
+import jobs
+import paynow_poller
+import paynow_inbox
+import bnpl_installments
+import bnpl_reminders
+import credit_profile
+import credit_scoring
+import cache
+import http_cache
+import view_counter
+import image_pipeline
+import uploads
+import assets
+import compression
+import streaming
+import facets
+
 app = Flask(__name__)
 app.secret_key = 'zim-ecommerce-secret-key-change-in-production'
-DATABASE = 'zimclassifieds.db'
+
+# Pooled, request-scoped DB connections (returned to the pool on teardown)
+database.init_app(app)
+
+# Conditional GET helpers and the cached_fragment template block
+http_cache.init_app(app)
+
+# picture()/image_url() template globals for product image variants
+image_pipeline.init_app(app)
+
+# Multipart uploads stream to hashed temp files (content-addressed image blobs)
+uploads.init_app(app)
+
+# Fingerprinted, precompressed static files (built by scripts/build_assets.py)
+assets.init_app(app)
+
+# gzip/br for HTML and JSON responses (WSGI middleware around the app)
+compression.init_app(app)
+
+# stream_flush() marker for templates sent with streaming.render()
+streaming.init_app(app)
 
 # Stripe Configuration
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY') or 'sk_test_placeholder'
 STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY') or 'pk_test_placeholder'
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+STRIPE_SHIPPING = 50  # ZWL, flat rate per order
+
+# Bearer token for /api/metrics (internal counters); without one the endpoint is off
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 serializer = URLSafeTimedSerializer(app.secret_key)
 
@@ -39,13 +91,10 @@ def ensure_schema():
     global schema_initialized
     if schema_initialized:
         return
-    try:
-        db = get_db()
-        # Check a core table; if missing, create full schema
-        db.execute('SELECT 1 FROM products LIMIT 1')
-        db.close()
-    except Exception:
-        init_db()
+    # Every statement is CREATE ... IF NOT EXISTS, so this also adds
+    # tables/indexes introduced since an existing database was created
+    # (on PostgreSQL only the module hooks run; see init_db)
+    init_db()
     schema_initialized = True
 
 # Image upload configuration
@@ -145,6 +194,19 @@ PRODUCT_CATEGORIES = [
     'Furniture', 'Tools & Hardware', 'Automotive', 'Pet Supplies'
 ]
 
+# Listing page sizes (keyset paginated)
+PRODUCTS_PER_PAGE = 24
+ORDERS_PER_PAGE = 20
+
+# Product sort modes -> (unique keyset sort key, descending)
+PRODUCT_SORTS = {
+    'newest': ([('p.created_at', 'created_at'), ('p.id', 'id')], True),
+    'price_asc': ([('p.price', 'price'), ('p.id', 'id')], False),
+    'price_desc': ([('p.price', 'price'), ('p.id', 'id')], True),
+    'rating': ([('p.rating', 'rating'), ('p.id', 'id')], True),
+    'relevance': ([('fts.rank', 'search_rank'), ('p.id', 'id')], False),
+}
+
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -155,20 +217,15 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def save_uploaded_file(file):
-    """Save uploaded file and return relative path."""
+def save_uploaded_file(db, file):
+    """Store an uploaded image as a shared blob (see uploads.store); returns the blob row."""
     if not file or file.filename == '':
         return None
     
     if not allowed_file(file.filename):
         return None
     
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"{uuid.uuid4()}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    file.save(filepath)
-    return f"uploads/{filename}"
+    return uploads.store(db, file)
 
 
 def delete_image(image_path):
@@ -183,16 +240,8 @@ def delete_image(image_path):
         print(f"Error deleting image: {e}")
 
 
-def get_db():
-    """Get database connection."""
-    db = sqlite3.connect(DATABASE)
-    db.row_factory = sqlite3.Row
-    return db
-
-
-def init_db():
-    """Initialize database with schema."""
-    db = get_db()
+def _create_sqlite_schema(db):
+    """SQLite tables and indices (every statement is IF NOT EXISTS)."""
     db.executescript('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -244,6 +293,7 @@ def init_db():
             status TEXT DEFAULT 'active',
             rating REAL DEFAULT 0,
             review_count INTEGER DEFAULT 0,
+            rating_sum INTEGER DEFAULT 0,
             views INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -273,6 +323,64 @@ def init_db():
             FOREIGN KEY (product_id) REFERENCES products(id)
         );
 
+        CREATE TABLE IF NOT EXISTS inventory_reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reservation_id TEXT UNIQUE NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            order_id INTEGER,
+            user_id TEXT,
+            status TEXT DEFAULT 'held',
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS stripe_checkouts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE NOT NULL,
+            user_id TEXT NOT NULL,
+            lines TEXT NOT NULL,
+            shipping_cost REAL DEFAULT 0,
+            status TEXT DEFAULT 'open',
+            order_id TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finalised_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id TEXT UNIQUE NOT NULL,
+            session_id TEXT UNIQUE,
+            type TEXT NOT NULL,
+            status TEXT DEFAULT 'received',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task TEXT NOT NULL,
+            args TEXT NOT NULL,
+            priority INTEGER DEFAULT 100,
+            status TEXT DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            max_attempts INTEGER DEFAULT 5,
+            run_at TIMESTAMP NOT NULL,
+            locked_by TEXT,
+            locked_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+
         CREATE TABLE IF NOT EXISTS cart (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             cart_id TEXT UNIQUE NOT NULL,
@@ -328,6 +436,80 @@ def init_db():
             FOREIGN KEY (seller_id) REFERENCES sellers(id)
         );
 
+        CREATE TABLE IF NOT EXISTS seller_stats (
+            seller_id INTEGER PRIMARY KEY,
+            product_count INTEGER DEFAULT 0,
+            order_count INTEGER DEFAULT 0,
+            pending_count INTEGER DEFAULT 0,
+            gross_sales REAL DEFAULT 0,
+            last_order_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (seller_id) REFERENCES sellers(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS seller_sales_daily (
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (seller_id, period_start),
+            FOREIGN KEY (seller_id) REFERENCES sellers(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS seller_sales_weekly (
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (seller_id, period_start),
+            FOREIGN KEY (seller_id) REFERENCES sellers(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS seller_sales_monthly (
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (seller_id, period_start),
+            FOREIGN KEY (seller_id) REFERENCES sellers(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS product_sales_daily (
+            product_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (product_id, period_start),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS product_sales_weekly (
+            product_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (product_id, period_start),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS product_sales_monthly (
+            product_id INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL,
+            period_start DATE NOT NULL,
+            order_count INTEGER DEFAULT 0,
+            units INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            PRIMARY KEY (product_id, period_start),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        );
+
         CREATE TABLE IF NOT EXISTS product_reviews (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             review_id TEXT UNIQUE NOT NULL,
@@ -482,15 +664,90 @@ def init_db():
             payment_method TEXT,
             status TEXT DEFAULT 'pending',
             payment_date TIMESTAMP,
+            reference TEXT,
+            poll_url TEXT,
+            paynow_status TEXT,
+            poll_attempts INTEGER DEFAULT 0,
+            next_poll_at TIMESTAMP,
+            last_polled_at TIMESTAMP,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (agreement_id) REFERENCES bnpl_agreements(agreement_id)
         );
 
+        CREATE TABLE IF NOT EXISTS bnpl_installments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agreement_id INTEGER NOT NULL,
+            installment_number INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            due_date DATE NOT NULL,
+            status TEXT DEFAULT 'pending',
+            paid_at TIMESTAMP,
+            reminded_at TIMESTAMP,
+            overdue_notified_at TIMESTAMP,
+            late_fee REAL DEFAULT 0,
+            late_fee_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(agreement_id, installment_number),
+            FOREIGN KEY (agreement_id) REFERENCES bnpl_agreements(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS paynow_inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reference TEXT NOT NULL,
+            agreement_id TEXT NOT NULL,
+            installment_number INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            outcome TEXT,
+            attempts INTEGER DEFAULT 0,
+            UNIQUE(reference, status)
+        );
+
+        CREATE TABLE IF NOT EXISTS credit_profiles (
+            user_id TEXT PRIMARY KEY,
+            profile TEXT NOT NULL,
+            computed_at TIMESTAMP NOT NULL
+        );
+        
+        CREATE TABLE IF NOT EXISTS product_view_buckets (
+            product_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            views INTEGER NOT NULL,
+            PRIMARY KEY (product_id, bucket)
+        );
+        
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            content_hash TEXT PRIMARY KEY,
+            image_path TEXT NOT NULL,
+            byte_size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            variants TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS product_facets (
+            category TEXT NOT NULL,
+            price_bucket INTEGER NOT NULL,
+            product_count INTEGER NOT NULL DEFAULT 0,
+            in_stock_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (category, price_bucket)
+        );
+
         -- Indices for performance
         CREATE INDEX IF NOT EXISTS idx_products_seller ON products(seller_id);
         CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
         CREATE INDEX IF NOT EXISTS idx_products_status ON products(status);
         CREATE INDEX IF NOT EXISTS idx_inventory_product ON inventory(product_id);
+        CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images(product_id);
+        CREATE INDEX IF NOT EXISTS idx_reservations_expiry ON inventory_reservations(status, expires_at);
+        CREATE INDEX IF NOT EXISTS idx_reservations_order ON inventory_reservations(order_id, status);
+        CREATE INDEX IF NOT EXISTS idx_reservations_user ON inventory_reservations(user_id, status);
+        CREATE INDEX IF NOT EXISTS idx_stripe_events_status ON stripe_events(status, received_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, run_at, id);
+        CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(status, finished_at);
         CREATE INDEX IF NOT EXISTS idx_cart_user ON cart(user_id);
         CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);
         CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
@@ -502,11 +759,70 @@ def init_db():
         CREATE INDEX IF NOT EXISTS idx_bnpl_agreements_user ON bnpl_agreements(user_id);
         CREATE INDEX IF NOT EXISTS idx_bnpl_agreements_status ON bnpl_agreements(status);
         CREATE INDEX IF NOT EXISTS idx_bnpl_payments_agreement ON bnpl_payments(agreement_id);
+        CREATE INDEX IF NOT EXISTS idx_bnpl_installments_due ON bnpl_installments(status, due_date);
+        CREATE INDEX IF NOT EXISTS idx_paynow_inbox_agreement ON paynow_inbox(agreement_id, processed_at, id);
+        CREATE INDEX IF NOT EXISTS idx_product_view_buckets_bucket ON product_view_buckets(bucket);
         CREATE INDEX IF NOT EXISTS idx_payment_transactions_order ON payment_transactions(order_id);
         CREATE INDEX IF NOT EXISTS idx_seller_commissions_seller ON seller_commissions(seller_id);
+        
+        -- Keyset pagination (one index per listing sort order)
+        CREATE INDEX IF NOT EXISTS idx_products_status_created ON products(status, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_products_status_price ON products(status, price, id);
+        CREATE INDEX IF NOT EXISTS idx_products_status_rating ON products(status, rating, id);
+        CREATE INDEX IF NOT EXISTS idx_products_category_created ON products(category, status, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_products_seller_created ON products(seller_id, status, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_order_items_seller_created ON order_items(seller_id, created_at, id);
+        
+        -- Sales rollups: a seller's products per bucket
+        CREATE INDEX IF NOT EXISTS idx_product_sales_daily_seller ON product_sales_daily(seller_id, period_start);
+        CREATE INDEX IF NOT EXISTS idx_product_sales_weekly_seller ON product_sales_weekly(seller_id, period_start);
+        CREATE INDEX IF NOT EXISTS idx_product_sales_monthly_seller ON product_sales_monthly(seller_id, period_start);
     ''')
-    
     db.commit()
+
+
+def init_db():
+    """Initialize database with schema."""
+    db = get_db()
+    # PostgreSQL tables come from scripts/create_postgres_schema.py (executescript is
+    # SQLite-only); the hooks below add columns and backfills on either database
+    if DB_TYPE != 'postgresql':
+        _create_sqlite_schema(db)
+    
+    # Full-text product search index (populated from existing rows on first run)
+    search_index.init_search_index(db)
+    
+    # Denormalised product rating aggregates (backfilled when the column is added)
+    ratings.init_rating_aggregates(db)
+    
+    # Seller dashboard read model (backfilled while empty)
+    seller_stats.init_seller_stats(db)
+    
+    # Time-bucketed sales rollups for seller analytics (backfilled while empty)
+    sales_rollups.init_sales_rollups(db)
+    
+    # Server-side Paynow polling columns on bnpl_payments
+    paynow_poller.init_paynow_poller(db)
+    
+    # One row per BNPL installment (migrated from JSON payment schedules)
+    bnpl_installments.init_bnpl_installments(db)
+    
+    # Reminder and late-fee columns on bnpl_installments
+    bnpl_reminders.init_bnpl_reminders(db)
+    
+    # Resized WebP/JPEG variants recorded on product_images
+    image_pipeline.init_image_pipeline(db)
+    
+    # Content hashes linking product_images to shared image_blobs
+    uploads.init_uploads(db)
+    
+    # Browse facet counts per category and price bucket (backfilled while empty)
+    facets.init_facets(db)
+    
+    # Per-job dedupe keys for work that must be queued at most once
+    jobs.init_jobs(db)
+    
     db.close()
 
 
@@ -534,55 +850,86 @@ def login_required(f):
     return decorated_function
 
 
+def metrics_token_required(f):
+    """Decorator for internal endpoints: requires `Authorization: Bearer <METRICS_TOKEN>`."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not METRICS_TOKEN or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return jsonify({'error': 'Not found'}), 404
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 # ============================================================================
 # CORE ECOMMERCE ROUTES
 # ============================================================================
 
+def home_page_data():
+    """Featured, top seller and popular-now lists for the home page, cached for every visitor."""
+    def load():
+        db = get_db()
+        
+        # Get featured products (random, recently added)
+        featured_products = db.execute(f'''
+            SELECT p.*, s.store_name, s.store_slug, {image_pipeline.PRIMARY_IMAGE_COLUMNS}
+            FROM products p
+            JOIN sellers s ON p.seller_id = s.id
+            {image_pipeline.PRIMARY_IMAGE_JOIN}
+            WHERE p.status = 'active' AND p.stock_quantity > 0
+            ORDER BY p.created_at DESC
+            LIMIT 12
+        ''').fetchall()
+        
+        # Get top sellers (by sales)
+        top_sellers = db.execute('''
+            SELECT seller_id, store_name, store_slug, rating, total_sales
+            FROM sellers
+            WHERE is_verified = 1
+            ORDER BY total_sales DESC
+            LIMIT 8
+        ''').fetchall()
+        
+        # Most viewed in the last hour
+        popular_products = view_counter.trending(db, limit=8)
+        
+        db.close()
+        return ([dict(row) for row in featured_products], [dict(row) for row in top_sellers],
+                [dict(row) for row in popular_products])
+    
+    return cache.get_or_set('home', load, tags=('products', 'sellers'))
+
+
 @app.route('/')
+@http_cache.conditional(home_page_data)
 def index():
     """Home page with featured products and sellers."""
-    db = get_db()
-    
-    # Get featured products (random, recently added)
-    featured_products = db.execute('''
-        SELECT p.*, s.store_name, s.store_slug
-        FROM products p
-        JOIN sellers s ON p.seller_id = s.id
-        WHERE p.status = 'active' AND p.stock_quantity > 0
-        ORDER BY p.created_at DESC
-        LIMIT 12
-    ''').fetchall()
-    
-    # Get top sellers (by sales)
-    top_sellers = db.execute('''
-        SELECT seller_id, store_name, store_slug, rating, total_sales
-        FROM sellers
-        WHERE is_verified = 1
-        ORDER BY total_sales DESC
-        LIMIT 8
-    ''').fetchall()
-    
-    db.close()
+    featured_products, top_sellers, popular_products = home_page_data()
     
     return render_template('index.html',
                          featured_products=featured_products,
                          top_sellers=top_sellers,
+                         popular_products=popular_products,
+                         grid_key=http_cache.version_key(featured_products),
                          categories=PRODUCT_CATEGORIES)
 
 
 @app.route('/privacy')
+@http_cache.static_page
 def privacy():
     """Privacy policy page."""
     return render_template('privacy.html')
 
 
 @app.route('/terms')
+@http_cache.static_page
 def terms():
     """Terms & Conditions page."""
     return render_template('terms.html')
 
 
 @app.route('/about')
+@http_cache.static_page
 def about():
     """About / How It Works page."""
     return render_template('about.html')
@@ -697,57 +1044,127 @@ def dashboard():
 def products():
     """Browse products with filtering."""
     category = request.args.get('category', '')
-    search = request.args.get('search', '')
-    sort = request.args.get('sort', 'newest')
+    price_bucket = facets.parse_bucket(request.args.get('price'))
+    search = request.args.get('search') or request.args.get('q', '')
+    sort = request.args.get('sort', 'relevance' if search else 'newest')
+    cursor = request.args.get('cursor')
     
-    db = get_db()
+    # Full-text match (ranked) instead of LIKE scans
+    search_join, params = search_index.match_join(search) if search else ('', [])
+    search_params = list(params)
+    
+    if sort not in PRODUCT_SORTS or (sort == 'relevance' and not search_join):
+        sort = 'newest'
+    sort_columns, descending = PRODUCT_SORTS[sort]
     
     where_conditions = ['p.status = ?']
-    params = ['active']
+    params.append('active')
     
     if category:
         where_conditions.append('p.category = ?')
         params.append(category)
     
-    if search:
-        where_conditions.append('(p.name LIKE ? OR p.description LIKE ?)')
-        search_term = f'%{search}%'
-        params.extend([search_term, search_term])
+    if price_bucket is not None:
+        price_sql, price_params = facets.price_condition(price_bucket)
+        where_conditions.append(price_sql)
+        params.extend(price_params)
+    
+    # Seek past the previous page's last row
+    after, after_params = pagination.keyset_condition(sort_columns, descending, cursor)
+    if after:
+        where_conditions.append(after)
+        params.extend(after_params)
     
     query = f'''
         SELECT p.*, s.store_name, s.store_slug,
                (p.stock_quantity > 0) as in_stock,
-               COALESCE(AVG(pr.rating), 0) as avg_rating,
-               COUNT(DISTINCT pr.id) as review_count
+               {'fts.rank' if search_join else 'NULL'} as search_rank,
+               p.rating as avg_rating,
+               {image_pipeline.PRIMARY_IMAGE_COLUMNS}
         FROM products p
         JOIN sellers s ON p.seller_id = s.id
-        LEFT JOIN product_reviews pr ON p.id = pr.product_id AND pr.status = 'active'
+        {image_pipeline.PRIMARY_IMAGE_JOIN}
+        {search_join}
         WHERE {' AND '.join(where_conditions)}
-        GROUP BY p.id
+        {pagination.order_clause(sort_columns, descending)}
+        LIMIT ?
     '''
+    params.append(PRODUCTS_PER_PAGE + 1)
     
-    # Sorting
-    if sort == 'price_asc':
-        query += ' ORDER BY p.price ASC'
-    elif sort == 'price_desc':
-        query += ' ORDER BY p.price DESC'
-    elif sort == 'rating':
-        query += ' ORDER BY p.rating DESC'
-    else:  # newest
-        query += ' ORDER BY p.created_at DESC'
-    
-    products = db.execute(query, params).fetchall()
+    def load():
+        db = get_db()
+        rows = db.execute(query, params).fetchall()
+        products, next_cursor = pagination.split_page(rows, sort_columns, PRODUCTS_PER_PAGE)
+        db.close()
+        return [dict(row) for row in products], next_cursor
+    
+    # Facet counts come from the product_facets summary; a search's from its matches, once per search
+    if search_join:
+        facet_rows = cache.get_or_set(f'facets:search:{search}',
+                                      lambda: facets.search_rows(get_db(), search_join, search_params),
+                                      tags=('products',))
+    else:
+        facet_rows = facets.table_rows(get_db())
+    facet_counts = facets.summarize(facet_rows, category, price_bucket)
+    
+    # Category browse pages are shared by every visitor; searches are not cached
+    if not search_join:
+        rows, next_cursor = cache.get_or_set(f'browse:{category}:{price_bucket}:{sort}:{cursor or ""}', load,
+                                             tags=('products',))
+        if pagination.wants_json():
+            return pagination.json_page('products', rows, next_cursor, facets=facet_counts)
+        products, grid_key = streaming.Page.loaded(rows, next_cursor), http_cache.version_key(rows)
+    elif pagination.wants_json():
+        return pagination.json_page('products', *load(), facets=facet_counts)
+    else:
+        # Search results stream off the cursor while the page renders
+        products, grid_key = streaming.Page(get_db().iterate(query, params), sort_columns, PRODUCTS_PER_PAGE), None
+    
+    return streaming.render('products/browse.html',
+                            products=products,
+                            grid_key=grid_key,
+                            facets=facet_counts,
+                            categories=PRODUCT_CATEGORIES,
+                            current_category=category,
+                            current_price=price_bucket,
+                            search_term=search,
+                            search_q=search,
+                            sort=sort)
+
+
+def product_version(product_id):
+    """What the product page shows that can change (views aside), or None if there is no such product."""
+    row = get_db().execute('''
+        SELECT p.updated_at, p.status, p.price, p.stock_quantity, p.review_count, p.rating,
+               s.store_name, s.rating as seller_rating
+        FROM products p
+        JOIN sellers s ON p.seller_id = s.id
+        WHERE p.product_id = ?
+    ''', (product_id,)).fetchone()
+    return tuple(dict(row).items()) if row else None
+
+
+def record_product_view(product_id):
+    """Count a product page view (also when the browser's copy is still fresh); buffered, see view_counter."""
+    view_counter.record(product_id)
+
+
+def product_reviews(product_pk):
+    """Active reviews of a product (internal id), newest first."""
+    db = get_db()
+    reviews = db.execute('''
+        SELECT r.*, u.full_name
+        FROM product_reviews r
+        JOIN users u ON r.user_id = u.user_id
+        WHERE r.product_id = ? AND r.status = 'active'
+        ORDER BY r.created_at DESC
+    ''', (product_pk,)).fetchall()
     db.close()
-    
-    return render_template('products/browse.html',
-                         products=products,
-                         categories=PRODUCT_CATEGORIES,
-                         current_category=category,
-                         search_term=search,
-                         sort=sort)
+    return reviews
 
 
 @app.route('/product/<product_id>')
+@http_cache.conditional(product_version, not_modified=record_product_view)
 def product_detail(product_id):
     """Product detail page."""
     db = get_db()
@@ -770,68 +1187,87 @@ def product_detail(product_id):
         ORDER BY is_primary DESC, display_order ASC
     ''', (product['id'],)).fetchall()
     
-    # Increment views
-    db.execute('UPDATE products SET views = views + 1 WHERE product_id = ?', (product_id,))
-    
-    # Get reviews
-    reviews = db.execute('''
-        SELECT r.*, u.full_name
-        FROM product_reviews r
-        JOIN users u ON r.user_id = u.user_id
-        WHERE r.product_id = ? AND r.status = 'active'
-        ORDER BY r.created_at DESC
-    ''', (product['id'],)).fetchall()
-    
-    db.commit()
     db.close()
     
+    record_product_view(product_id)
+    
+    # Reviews are only queried when their rendered fragment is not cached
     return render_template('products/detail.html',
                          product=product,
                          product_images=product_images,
-                         reviews=reviews)
+                         load_reviews=lambda: product_reviews(product['id']),
+                         reviews_key=f"reviews:{product['id']}:{product['review_count']}:{product['rating_sum']}")
 
 
 # ============================================================================
 # SELLER STORES
 # ============================================================================
 
+def seller_store_page(store_slug, cursor=None):
+    """A store's seller, product page (at cursor) and latest ratings, or None if there is no such store."""
+    def load():
+        db = get_db()
+        seller = db.execute('''
+            SELECT s.*, u.full_name
+            FROM sellers s
+            JOIN users u ON s.user_id = u.user_id
+            WHERE s.store_slug = ?
+        ''', (store_slug,)).fetchone()
+        
+        if not seller:
+            db.close()
+            return None
+        
+        # Get seller products (newest first, keyset paginated)
+        sort_columns = [('p.created_at', 'created_at'), ('p.id', 'id')]
+        after, after_params = pagination.keyset_condition(sort_columns, True, cursor)
+        rows = db.execute(f'''
+            SELECT p.*, {image_pipeline.PRIMARY_IMAGE_COLUMNS}
+            FROM products p
+            {image_pipeline.PRIMARY_IMAGE_JOIN}
+            WHERE p.seller_id = ? AND p.status = 'active' {'AND ' + after if after else ''}
+            {pagination.order_clause(sort_columns, True)}
+            LIMIT ?
+        ''', (seller['id'], *after_params, PRODUCTS_PER_PAGE + 1)).fetchall()
+        products, next_cursor = pagination.split_page(rows, sort_columns, PRODUCTS_PER_PAGE)
+        
+        # Get seller ratings
+        ratings = db.execute('''
+            SELECT * FROM seller_ratings
+            WHERE seller_id = ?
+            ORDER BY created_at DESC
+            LIMIT 5
+        ''', (seller['id'],)).fetchall()
+        db.close()
+        
+        return {
+            'seller': dict(seller),
+            'products': [dict(row) for row in products],
+            'next_cursor': next_cursor,
+            'ratings': [dict(row) for row in ratings]
+        }
+    
+    return cache.get_or_set(f'store:{store_slug}:{cursor or ""}', load, tags=(f'store:{store_slug}',))
+
+
 @app.route('/seller/<store_slug>')
+@http_cache.conditional(lambda store_slug: seller_store_page(store_slug, request.args.get('cursor')))
 def seller_store(store_slug):
     """View seller store."""
-    db = get_db()
-    
-    seller = db.execute('''
-        SELECT s.*, u.full_name
-        FROM sellers s
-        JOIN users u ON s.user_id = u.user_id
-        WHERE s.store_slug = ?
-    ''', (store_slug,)).fetchone()
+    page = seller_store_page(store_slug, request.args.get('cursor'))
     
-    if not seller:
-        db.close()
+    if not page:
         return render_template('error.html', message='Store not found'), 404
     
-    # Get seller products
-    products = db.execute('''
-        SELECT * FROM products
-        WHERE seller_id = ? AND status = 'active'
-        ORDER BY created_at DESC
-    ''', (seller['id'],)).fetchall()
-    
-    # Get seller ratings
-    ratings = db.execute('''
-        SELECT * FROM seller_ratings
-        WHERE seller_id = ?
-        ORDER BY created_at DESC
-        LIMIT 5
-    ''', (seller['id'],)).fetchall()
-    
-    db.close()
+    if pagination.wants_json():
+        return pagination.json_page('products', page['products'], page['next_cursor'])
     
     return render_template('sellers/store.html',
-                         seller=seller,
-                         products=products,
-                         ratings=ratings)
+                         seller=page['seller'],
+                         products=page['products'],
+                         ratings=page['ratings'],
+                         grid_key=http_cache.version_key(page['products']),
+                         next_url=pagination.next_page_url(page['next_cursor']))
 
 
 # ============================================================================
@@ -893,17 +1329,22 @@ def stripe_checkout():
     db = get_db()
     
     # Get cart items
-    cart_items = db.execute('''
-        SELECT c.*, p.name, p.price, p.product_id
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    ''', (user_id,)).fetchall()
+    cart_items = order_writer.cart_snapshot(db, user_id)
     
     if not cart_items:
         db.close()
         return jsonify({'error': 'Cart is empty'}), 400
     
+    # Hold stock while the customer pays (replaces any earlier abandoned hold)
+    try:
+        inventory.release_user_holds(db, user_id)
+        inventory.reserve(db, [(item['product_id'], item['quantity']) for item in cart_items], user_id=user_id)
+        db.commit()
+    except inventory.InsufficientStock:
+        db.rollback()
+        db.close()
+        return jsonify({'error': 'Some items in your cart are no longer in stock'}), 409
+    
     # Build line items for Stripe
     line_items = []
     for item in cart_items:
@@ -913,7 +1354,7 @@ def stripe_checkout():
                 'unit_amount': int(item['price'] * 100),
                 'product_data': {
                     'name': item['name'],
-                    'metadata': {'product_id': item['product_id']}
+                    'metadata': {'product_id': item['public_product_id']}
                 },
             },
             'quantity': item['quantity'],
@@ -923,7 +1364,7 @@ def stripe_checkout():
     line_items.append({
         'price_data': {
             'currency': 'zwd',
-            'unit_amount': 5000,  # 50 ZWL
+            'unit_amount': STRIPE_SHIPPING * 100,
             'product_data': {'name': 'Shipping'}
         },
         'quantity': 1,
@@ -934,11 +1375,15 @@ def stripe_checkout():
             payment_method_types=['card'],
             line_items=line_items,
             mode='payment',
-            success_url=url_for('stripe_success', _external=True),
+            # Stripe fills in {CHECKOUT_SESSION_ID}; it must not be URL-encoded
+            success_url=url_for('stripe_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
             cancel_url=url_for('checkout', _external=True),
             metadata={'user_id': user_id}
         )
         
+        # The webhook creates the order from this snapshot once payment completes
+        stripe_orders.open_checkout(db, session_obj.id, user_id, cart_items, shipping_cost=STRIPE_SHIPPING)
+        db.commit()
         db.close()
         return jsonify({
             'sessionId': session_obj.id,
@@ -946,67 +1391,68 @@ def stripe_checkout():
         })
     
     except Exception as e:
+        inventory.release_user_holds(db, user_id)
+        db.commit()
         db.close()
         return jsonify({'error': str(e)}), 400
 
 
+@app.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Stripe webhook: record checkout.session.completed once and queue the order's finalisation."""
+    # Without the signing secret no event can be verified, so none is accepted
+    if not STRIPE_WEBHOOK_SECRET:
+        app.logger.error('STRIPE_WEBHOOK_SECRET is not set; refusing Stripe webhook')
+        return jsonify({'error': 'Webhook not configured'}), 503
+    
+    try:
+        event = stripe.Webhook.construct_event(request.get_data(),
+                                               request.headers.get('Stripe-Signature', ''),
+                                               STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return jsonify({'error': 'Invalid payload or signature'}), 400
+    
+    if event['type'] != stripe_orders.COMPLETED_EVENT:
+        return jsonify({'received': True})
+    
+    checkout_session = event['data']['object']
+    if checkout_session.get('payment_status') != 'paid':
+        return jsonify({'received': True})
+    
+    # Retries and duplicate deliveries are acknowledged without touching the order;
+    # a new event and its finalise job are committed together
+    db = get_db()
+    is_new = stripe_orders.record_event(db, event['id'], checkout_session['id'], event['type'])
+    if is_new:
+        stripe_orders.finalise.enqueue(db, checkout_session['id'])
+    db.commit()
+    db.close()
+    
+    return jsonify({'received': True, 'duplicate': not is_new})
+
+
 @app.route('/stripe-success')
 @login_required
 def stripe_success():
-    """Handle successful Stripe payment."""
+    """Return page after Stripe payment: shows the order once the webhook has created it."""
     user_id = session['user_id']
+    session_id = request.args.get('session_id', '')
     db = get_db()
     
-    # Get cart items
-    cart_items = db.execute('''
-        SELECT c.*, p.product_id as pid
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    ''', (user_id,)).fetchall()
+    checkout_session = stripe_orders.checkout_status(db, session_id, user_id)
+    db.close()
     
-    if not cart_items:
-        db.close()
+    if not checkout_session:
         return redirect(url_for('products'))
     
-    # Create order
-    order_id = str(uuid.uuid4())
-    order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-    subtotal = sum(item['price'] * item['quantity'] for item in cart_items)
-    total = subtotal + 50  # +50 ZWL shipping
-    
-    db.execute('''
-        INSERT INTO orders (order_id, user_id, order_number, total_amount, 
-                           payment_method, payment_status, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (order_id, user_id, order_number, total, 'stripe', 'paid', 'confirmed'))
+    if checkout_session['status'] == stripe_orders.FINALISED:
+        return redirect(url_for('order_confirmation', order_id=checkout_session['order_id']))
     
-    order = db.execute('SELECT id FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+    if checkout_session['status'] == stripe_orders.FAILED:
+        return render_template('error.html', message='Some items sold out before your payment completed. Please contact support for a refund.'), 409
     
-    # Create order items
-    for item in cart_items:
-        order_item_id = str(uuid.uuid4())
-        db.execute('''
-            INSERT INTO order_items (order_item_id, order_id, product_id, 
-                                    seller_id, quantity, unit_price, subtotal)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (order_item_id, order[0], item['product_id'], item['seller_id'],
-              item['quantity'], item['price'], item['price'] * item['quantity']))
-        
-        # Reserve inventory
-        db.execute('''
-            UPDATE inventory 
-            SET quantity_reserved = quantity_reserved + ?
-            WHERE product_id = ?
-        ''', (item['quantity'], item['product_id']))
-    
-    # Clear cart
-    db.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
-    
-    db.commit()
-    db.close()
-    
-    return redirect(url_for('order_confirmation', order_id=order_id))
+    # Webhook not processed yet: the page refreshes itself until it is
+    return render_template('checkout/payment_processing.html', session_id=session_id)
 
 
 @app.route('/order-confirmation/<order_id>')
@@ -1080,18 +1526,26 @@ def order_history():
     db = get_db()
     user_id = session['user_id']
     
-    orders = db.execute('''
-        SELECT o.*, COUNT(oi.id) as item_count
+    sort_columns = [('o.created_at', 'created_at'), ('o.id', 'id')]
+    after, after_params = pagination.keyset_condition(sort_columns, True, request.args.get('cursor'))
+    rows = db.execute(f'''
+        SELECT o.*,
+               (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id) as item_count
         FROM orders o
-        LEFT JOIN order_items oi ON o.id = oi.order_id
-        WHERE o.user_id = ?
-        GROUP BY o.id
-        ORDER BY o.created_at DESC
-    ''', (user_id,)).fetchall()
+        WHERE o.user_id = ? {'AND ' + after if after else ''}
+        {pagination.order_clause(sort_columns, True)}
+        LIMIT ?
+    ''', (user_id, *after_params, ORDERS_PER_PAGE + 1)).fetchall()
+    orders, next_cursor = pagination.split_page(rows, sort_columns, ORDERS_PER_PAGE)
     
     db.close()
     
-    return render_template('checkout/order_history.html', orders=orders)
+    if pagination.wants_json():
+        return pagination.json_page('orders', orders, next_cursor)
+    
+    return render_template('checkout/order_history.html',
+                         orders=orders,
+                         next_url=pagination.next_page_url(next_cursor))
 
 
 @app.route('/api/product-review', methods=['POST'])
@@ -1115,7 +1569,10 @@ def product_review():
     db = get_db()
     
     # Check if user purchased this product
-    product = db.execute('SELECT id FROM products WHERE product_id = ?', (product_id,)).fetchone()
+    product = db.execute('''
+        SELECT p.id, s.store_slug FROM products p JOIN sellers s ON p.seller_id = s.id
+        WHERE p.product_id = ?
+    ''', (product_id,)).fetchone()
     purchase = db.execute('''
         SELECT oi.id FROM order_items oi
         JOIN orders o ON oi.order_id = o.id
@@ -1134,25 +1591,49 @@ def product_review():
         VALUES (?, ?, ?, ?, ?, ?, 1)
     ''', (review_id, product[0], user_id, rating, title, comment))
     
-    # Update product rating
-    reviews = db.execute('''
-        SELECT AVG(rating) as avg_rating, COUNT(*) as count
-        FROM product_reviews
-        WHERE product_id = ?
-    ''', (product[0],)).fetchone()
-    
-    db.execute('''
-        UPDATE products 
-        SET rating = ?, review_count = ?
-        WHERE id = ?
-    ''', (reviews['avg_rating'], reviews['count'], product[0]))
+    # Update product rating aggregate (same transaction as the review)
+    ratings.review_added(db, product[0], rating)
     
     db.commit()
     db.close()
+    cache.invalidate('products', f"store:{product['store_slug']}")
     
     return jsonify({'success': True, 'message': 'Review submitted successfully'})
 
 
+# ============================================================================
+# OPERATIONS
+# ============================================================================
+
+@app.route('/api/metrics')
+@metrics_token_required
+def metrics():
+    """Runtime counters for this worker process."""
+    db = get_db()
+    job_stats = jobs.stats(db)
+    poller_stats = paynow_poller.stats(db)
+    inbox_stats = paynow_inbox.stats(db)
+    credit_stats = credit_profile.stats(db)
+    upload_stats = uploads.stats(db)
+    db.close()
+    return jsonify({
+        'db_pool': pool_stats(),
+        'jobs': job_stats,
+        'paynow_poller': poller_stats,
+        'paynow_inbox': inbox_stats,
+        'credit_profiles': credit_stats,
+        'bnpl_reminders': bnpl_reminders.stats(),
+        'cache': cache.stats(),
+        'http_cache': http_cache.stats(),
+        'product_views': view_counter.stats(),
+        'images': image_pipeline.stats(),
+        'uploads': upload_stats,
+        'static': assets.stats(),
+        'compression': compression.stats(),
+        'streaming': streaming.stats()
+    })
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
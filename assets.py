@@ -0,0 +1,207 @@
+"""
+Static Assets - Fingerprinted, precompressed static files with long-lived caching.
+build() (run by scripts/build_assets.py before gunicorn starts) copies every file
+under static/ except uploads to static/dist/<name>.<hash><ext>, writes .gz and,
+when the brotli package is installed, .br siblings for text files, and records
+logical -> fingerprinted names in static/dist/manifest.json.
+Templates call url_for('static', filename=...) as usual; the url_for registered
+here swaps in the fingerprinted name when the manifest has one. serve_static()
+replaces Flask's static view: it answers with a precompressed sibling the client
+accepts and gives fingerprinted files and upload blobs (named by the SHA-256 of
+their bytes) a year-long immutable Cache-Control. Other uploads (variants, which
+are re-rendered under the same names, and files from before blobs) revalidate, and
+in-progress uploads under uploads/tmp are not served at all.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+
+from flask import abort, current_app, request, send_from_directory, url_for as flask_url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Top-level folders under static/ that are not build inputs
+SKIP_FOLDERS = {DIST_FOLDER, 'uploads'}
+
+# Text types worth precompressing, and the smallest file worth it
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico', '.webmanifest'}
+MIN_COMPRESS_BYTES = 256
+
+# Accept-Encoding token -> precompressed file suffix, preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_MAX_AGE = 31536000
+# Fingerprinted build output, and upload blobs at uploads/<hash[:2]>/<hash>.<ext>
+IMMUTABLE_PATTERN = re.compile(rf'{DIST_FOLDER}/.+|uploads/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}\.[a-z]+')
+PRIVATE_PREFIXES = ('uploads/tmp/',)
+
+_manifest = {'mtime': None, 'entries': {}, 'version': ''}
+_manifest_lock = threading.Lock()
+
+_counters = {'immutable': 0, 'revalidated': 0, 'br': 0, 'gzip': 0, 'identity': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key):
+    with _counters_lock:
+        _counters[key] += 1
+
+
+def _write(path, data):
+    """Write atomically, so workers starting together never serve half a file."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _precompress(path, data):
+    """Write .gz/.br siblings of a text file when they come out smaller."""
+    written = []
+    if os.path.splitext(path)[1] not in COMPRESSIBLE or len(data) < MIN_COMPRESS_BYTES:
+        return written
+    # mtime=0 keeps the .gz byte-identical across builds
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            _write(path + suffix, compressed)
+            written.append(suffix)
+    return written
+
+
+def build(static_folder):
+    """
+    Fingerprint and precompress every asset under static_folder; returns the manifest.
+    Files from the previous build stay (pages rendered before a deploy still link
+    them); older ones are deleted.
+    """
+    dist = os.path.join(static_folder, DIST_FOLDER)
+    os.makedirs(dist, exist_ok=True)
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [name for name in dirs if name not in SKIP_FOLDERS]
+        dirs.sort()
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, extension = os.path.splitext(logical)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+            target = os.path.join(dist, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                _write(target, data)
+                _precompress(target, data)
+            manifest[logical] = f"{DIST_FOLDER}/{hashed}"
+
+    keep = {MANIFEST_NAME} | {
+        os.path.relpath(path, DIST_FOLDER) + suffix
+        for path in list(manifest.values()) + list(previous.values())
+        for suffix in ('', '.gz', '.br')
+    }
+    for root, _, files in os.walk(dist):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), dist).replace(os.sep, '/')
+            if relative not in keep:
+                os.remove(os.path.join(root, name))
+
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def manifest():
+    """Logical name -> fingerprinted name, reloaded when manifest.json changes ({} before a build)."""
+    path = os.path.join(current_app.static_folder, DIST_FOLDER, MANIFEST_NAME)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if mtime != _manifest['mtime']:
+        with _manifest_lock:
+            if mtime != _manifest['mtime']:
+                entries, raw = {}, b''
+                if mtime is not None:
+                    with open(path, 'rb') as f:
+                        raw = f.read()
+                    entries = json.loads(raw)
+                _manifest.update(entries=entries, mtime=mtime,
+                                 version=hashlib.sha1(raw).hexdigest()[:12] if raw else '')
+    return _manifest['entries']
+
+
+def version():
+    """Short digest of the manifest ('' without one); part of page ETags, since pages link assets."""
+    manifest()
+    return _manifest['version']
+
+
+def url_for(endpoint, **values):
+    """flask.url_for, with static filenames mapped to their fingerprinted copies."""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = manifest().get(values['filename'], values['filename'])
+    return flask_url_for(endpoint, **values)
+
+
+def serve_static(filename):
+    """Flask's static view with precompressed variants and immutable caching of fingerprinted files."""
+    if posixpath.normpath(filename).startswith(PRIVATE_PREFIXES):
+        abort(404)
+    folder = current_app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, suffix = 'identity', ''
+    has_variants = False
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        for token, candidate in ENCODINGS:
+            path = safe_join(folder, filename + candidate)
+            if path and os.path.isfile(path):
+                has_variants = True
+                if request.accept_encodings[token] and encoding == 'identity':
+                    encoding, suffix = token, candidate
+
+    immutable = IMMUTABLE_PATTERN.fullmatch(filename) is not None
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+    response = send_from_directory(folder, filename + suffix, mimetype=mimetype, max_age=max_age)
+    if suffix:
+        response.headers['Content-Encoding'] = encoding
+    if has_variants:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    _count(encoding)
+    _count('immutable' if immutable else 'revalidated')
+    return response
+
+
+def stats():
+    """This process's static response counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    return {'manifest_entries': len(manifest()), 'brotli': brotli is not None, 'this_process': process}
+
+
+def init_app(app):
+    app.view_functions['static'] = serve_static
+    app.jinja_env.globals['url_for'] = url_for
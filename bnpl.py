@@ -6,17 +6,27 @@ Strategy: Massive penetration through installment plans
 
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from functools import wraps
-import sqlite3
 import uuid
 from datetime import datetime, timedelta
 import json
-import hashlib
+import hmac
 import os
+from urllib.parse import parse_qsl
+
+from database import get_db
+import inventory
+import order_writer
+import bnpl_installments
+import bnpl_payments
+import credit_profile
+import paynow_inbox
+import paynow_poller
 
 bnpl_bp = Blueprint('bnpl', __name__, url_prefix='/bnpl')
 
 # Initialize Paynow
 PAYNOW_AVAILABLE = False
+PAYNOW_INTEGRATION_KEY = ''
 paynow = None
 
 try:
@@ -41,6 +51,11 @@ try:
                     return_url=PAYNOW_RETURN_URL,
                     result_url=PAYNOW_RESULT_URL
                 )
+                # Point at another Paynow-compatible host (e.g. scripts/fake_paynow.py)
+                api_url = os.environ.get('PAYNOW_API_URL')
+                if api_url:
+                    paynow.URL_INITIATE_TRANSACTION = api_url.rstrip('/') + '/interface/initiatetransaction'
+                    paynow.URL_INITIATE_MOBILE_TRANSACTION = api_url.rstrip('/') + '/interface/remotetransaction'
                 PAYNOW_AVAILABLE = True
                 print("✅ Paynow initialized successfully")
             else:
@@ -54,13 +69,6 @@ except Exception as e:
     print(f"⚠️ Error initializing Paynow: {e}")
 
 
-def get_db():
-    """Local DB helper to avoid circular import."""
-    db = sqlite3.connect('zimclassifieds.db')
-    db.row_factory = sqlite3.Row
-    return db
-
-
 def login_required(f):
     """Decorator to require user login."""
     @wraps(f)
@@ -205,95 +213,11 @@ def get_user_bnpl_eligibility(user_id):
     - Purchase history
     - Payment history
     - Verification status
-    """
-    db = get_db()
-    
-    # Get user info
-    user = db.execute('''
-        SELECT created_at, location, phone, email
-        FROM users WHERE user_id = ?
-    ''', (user_id,)).fetchone()
-    
-    if not user:
-        db.close()
-        return None
-    
-    # Check if diaspora (simple heuristic: non-Zimbabwean phone or location)
-    is_diaspora = False
-    location = (user['location'] or '').lower()
-    phone = (user['phone'] or '')
-    
-    diaspora_indicators = ['uk', 'united kingdom', 'usa', 'south africa', 'sa', 'canada', 'australia']
-    if any(indicator in location for indicator in diaspora_indicators):
-        is_diaspora = True
-    elif phone.startswith('+44') or phone.startswith('+1') or phone.startswith('+27'):
-        is_diaspora = True
-    
-    # Get purchase history
-    orders = db.execute('''
-        SELECT COUNT(*) as order_count, 
-               SUM(CASE WHEN payment_status = 'paid' THEN 1 ELSE 0 END) as paid_count,
-               MAX(created_at) as last_order
-        FROM orders
-        WHERE user_id = ?
-    ''', (user_id,)).fetchone()
-    
-    # Get BNPL history
-    bnpl_history = db.execute('''
-        SELECT COUNT(*) as bnpl_count,
-               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_count,
-               SUM(CASE WHEN status = 'defaulted' THEN 1 ELSE 0 END) as defaulted_count
-        FROM bnpl_agreements
-        WHERE user_id = ?
-    ''', (user_id,)).fetchone()
-    
-    db.close()
-    
-    # Determine tier
-    tier = 'basic'
-    order_count = orders['order_count'] or 0
-    paid_count = orders['paid_count'] or 0
-    bnpl_completed = bnpl_history['completed_count'] or 0
-    bnpl_defaulted = bnpl_history['defaulted_count'] or 0
-    
-    # Calculate credit score (simple version)
-    credit_score = 50  # Base score
     
-    # Positive factors
-    credit_score += min(paid_count * 5, 25)  # +5 per successful order, max +25
-    credit_score += min(bnpl_completed * 10, 30)  # +10 per completed BNPL, max +30
-    
-    # Diaspora bonus
-    if is_diaspora:
-        credit_score += 20
-    
-    # Negative factors
-    credit_score -= bnpl_defaulted * 30  # -30 per defaulted BNPL
-    
-    # Determine tier based on score
-    if credit_score >= 85:
-        tier = 'premium'
-    elif credit_score >= 65:
-        tier = 'verified'
-    else:
-        tier = 'basic'
-    
-    # If has defaults, downgrade
-    if bnpl_defaulted > 0:
-        tier = 'basic'
-    
-    return {
-        'user_id': user_id,
-        'tier': tier,
-        'credit_score': credit_score,
-        'is_diaspora': is_diaspora,
-        'order_count': order_count,
-        'paid_count': paid_count,
-        'bnpl_completed': bnpl_completed,
-        'bnpl_defaulted': bnpl_defaulted,
-        'eligible': bnpl_defaulted == 0,  # Not eligible if has defaults
-        'reason': 'Outstanding defaulted payment' if bnpl_defaulted > 0 else None
-    }
+    Served from the credit profile cache (see credit_profile.py). A recomputed
+    profile is written in the request's transaction, which the caller commits.
+    """
+    return credit_profile.get_profile(get_db(), user_id)
 
 
 @bnpl_bp.route('/check-eligibility', methods=['POST'])
@@ -305,6 +229,8 @@ def check_eligibility():
     
     user_id = session['user_id']
     eligibility = get_user_bnpl_eligibility(user_id)
+    # Nothing else is written by this request: keep a recomputed profile cached
+    get_db().commit()
     
     if not eligibility['eligible']:
         return jsonify({
@@ -367,21 +293,22 @@ def create_agreement():
     db = get_db()
     agreement_id = str(uuid.uuid4())
     
-    db.execute('''
+    agreement_pk = db.execute('''
         INSERT INTO bnpl_agreements (
             agreement_id, user_id, order_id, 
             principal_amount, fee_amount, total_amount,
             installment_amount, installments, duration_weeks,
             fee_percent, is_diaspora, user_tier,
-            payment_schedule, status, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', CURRENT_TIMESTAMP)
+            status, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', CURRENT_TIMESTAMP)
+        RETURNING id
     ''', (
         agreement_id, user_id, order_id,
         plan['order_amount'], plan['fee_amount'], plan['total_amount'],
         plan['installment_amount'], plan['installments'], plan['duration_weeks'],
-        plan['fee_percent'], 1 if plan['is_diaspora'] else 0, eligibility['tier'],
-        json.dumps(plan['payment_schedule'])
-    ))
+        plan['fee_percent'], 1 if plan['is_diaspora'] else 0, eligibility['tier']
+    )).fetchone()['id']
+    bnpl_installments.create_schedule(db, agreement_pk, plan['payment_schedule'])
     
     db.commit()
     db.close()
@@ -408,11 +335,12 @@ def my_agreements():
         ORDER BY ba.created_at DESC
     ''', (user_id,)).fetchall()
     
-    # Parse payment schedules
+    # Payment schedules for every agreement in one query
+    schedules = bnpl_installments.schedules(db, [agreement['id'] for agreement in agreements])
     agreements_data = []
     for agreement in agreements:
         agreement_dict = dict(agreement)
-        agreement_dict['payment_schedule'] = json.loads(agreement['payment_schedule'])
+        agreement_dict['payment_schedule'] = schedules[agreement['id']]
         agreements_data.append(agreement_dict)
     
     db.close()
@@ -439,14 +367,14 @@ def agreement_detail(agreement_id):
         return 'Agreement not found', 404
     
     agreement_dict = dict(agreement)
-    agreement_dict['payment_schedule'] = json.loads(agreement['payment_schedule'])
+    agreement_dict['payment_schedule'] = bnpl_installments.schedule(db, agreement['id'])
     
     # Get payments made
     payments = db.execute('''
         SELECT * FROM bnpl_payments
         WHERE agreement_id = ?
         ORDER BY payment_date ASC
-    ''', (agreement_id,)).fetchall()
+    ''', (agreement['id'],)).fetchall()
     
     db.close()
     
@@ -479,6 +407,14 @@ def pay_installment(agreement_id):
         db.close()
         return jsonify({'success': False, 'error': 'Agreement not found'}), 404
     
+    # The installment plus any late fee; paid or defaulted installments can't be paid again
+    amount = bnpl_installments.amount_due(db, agreement['id'], installment_number,
+                                          agreement['installment_amount'])
+    if not bnpl_installments.mark_paid(db, agreement['id'], installment_number):
+        db.rollback()
+        db.close()
+        return jsonify({'success': False, 'error': 'Installment is not open for payment'}), 400
+    
     # Create payment record
     payment_id = str(uuid.uuid4())
     
@@ -487,22 +423,22 @@ def pay_installment(agreement_id):
             payment_id, agreement_id, installment_number,
             amount, payment_method, status, payment_date
         ) VALUES (?, ?, ?, ?, ?, 'completed', CURRENT_TIMESTAMP)
-    ''', (payment_id, agreement_id, installment_number, 
-          agreement['installment_amount'], payment_method))
+    ''', (payment_id, agreement['id'], installment_number, amount, payment_method))
     
     # Check if all installments paid
     payments_made = db.execute('''
-        SELECT COUNT(*) as count FROM bnpl_payments
+        SELECT COUNT(DISTINCT installment_number) as count FROM bnpl_payments
         WHERE agreement_id = ? AND status = 'completed'
-    ''', (agreement_id,)).fetchone()['count']
+    ''', (agreement['id'],)).fetchone()['count']
     
     if payments_made >= agreement['installments']:
         # Mark agreement as completed
         db.execute('''
             UPDATE bnpl_agreements
             SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-            WHERE agreement_id = ?
+            WHERE agreement_id = ? AND status IN ('pending', 'active')
         ''', (agreement_id,))
+        credit_profile.invalidate(db, user_id)
     
     db.commit()
     db.close()
@@ -510,6 +446,7 @@ def pay_installment(agreement_id):
     return jsonify({
         'success': True,
         'payment_id': payment_id,
+        'amount': amount,
         'remaining': agreement['installments'] - payments_made
     })
 
@@ -592,22 +529,16 @@ def create_agreement_checkout():
     db = get_db()
     
     # Get cart items
-    cart_items = db.execute('''
-        SELECT c.*, p.name, p.price, p.seller_id
-        FROM cart c
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?
-    ''', (session['user_id'],)).fetchall()
+    cart_items = order_writer.cart_snapshot(db, session['user_id'])
     
     if not cart_items:
         db.close()
         return jsonify({'success': False, 'error': 'Cart is empty'}), 400
     
     # Calculate totals
-    subtotal = sum(item['price'] * item['quantity'] for item in cart_items)
+    subtotal = order_writer.cart_subtotal(cart_items)
     shipping = 10.00
     tax = subtotal * 0.10
-    total = subtotal + shipping + tax
     
     # Get BNPL plan
     plan = data.get('bnpl_plan')
@@ -615,28 +546,17 @@ def create_agreement_checkout():
         db.close()
         return jsonify({'success': False, 'error': 'Invalid BNPL plan'}), 400
     
-    # Create order
-    order_id = str(uuid.uuid4())
-    db.execute('''
-        INSERT INTO orders 
-        (order_id, user_id, total_amount, shipping_address, shipping_city, 
-         payment_method, payment_status, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (order_id, session['user_id'], total, 
-          data.get('shipping_address', ''), data.get('shipping_city', ''),
-          'bnpl', 'pending', 'pending'))
-    
-    # Get order internal ID
-    order = db.execute('SELECT id FROM orders WHERE order_id = ?', (order_id,)).fetchone()
-    
-    # Add order items
-    for item in cart_items:
-        db.execute('''
-            INSERT INTO order_items
-            (order_id, product_id, seller_id, quantity, price_at_purchase)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (order['id'], item['product_id'], item['seller_id'], 
-              item['quantity'], item['price']))
+    # Create order, holding stock until the first installment is paid
+    try:
+        order = order_writer.create_order(db, session['user_id'], cart_items, 'bnpl',
+                                          shipping_cost=shipping, tax=tax,
+                                          shipping_address=data.get('shipping_address', ''),
+                                          shipping_city=data.get('shipping_city', ''))
+    except inventory.InsufficientStock:
+        db.rollback()
+        db.close()
+        return jsonify({'success': False, 'error': 'Some items in your cart are no longer in stock'}), 409
+    order_id = order['order_id']
     
     # Create BNPL agreement
     agreement_id = str(uuid.uuid4())
@@ -650,19 +570,18 @@ def create_agreement_checkout():
     tier = get_user_credit_tier(session['user_id'])
     
     # Create agreement
-    db.execute('''
+    agreement_pk = db.execute('''
         INSERT INTO bnpl_agreements
         (agreement_id, user_id, order_id, principal_amount, fee_amount, 
          total_amount, installment_amount, installments, duration_weeks,
-         fee_percent, is_diaspora, user_tier, payment_schedule, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+         fee_percent, is_diaspora, user_tier, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        RETURNING id
     ''', (agreement_id, session['user_id'], order['id'], 
-          plan['principal_amount'], plan['fee_amount'], plan['total_amount'],
+          plan['order_amount'], plan['fee_amount'], plan['total_amount'],
           plan['installment_amount'], plan['installments'], plan['duration_weeks'],
-          plan['fee_percent'], is_diaspora, tier, json.dumps(plan['schedule']), 'pending'))
-    
-    # Clear cart
-    db.execute('DELETE FROM cart WHERE user_id = ?', (session['user_id'],))
+          plan['fee_percent'], is_diaspora, tier, 'pending')).fetchone()['id']
+    bnpl_installments.create_schedule(db, agreement_pk, plan['payment_schedule'])
     
     db.commit()
     db.close()
@@ -728,14 +647,17 @@ def process_first_payment():
         db.close()
         return jsonify({'success': False, 'error': 'Agreement is not in valid state'}), 400
     
+    # Includes the late fee if the first installment has gone overdue
+    amount = bnpl_installments.amount_due(db, agreement['id'], 1, agreement['installment_amount'])
+    
     try:
         # Create Paynow payment
-        reference = f"BNPL-{agreement_id}-1"
+        reference = bnpl_payments.make_reference(agreement_id, 1)
         
         payment = paynow.create_payment(reference, agreement['email'])
         payment.add(
             f"BNPL First Payment (1 of {agreement['installments']})",
-            float(agreement['installment_amount'])
+            float(amount)
         )
         
         # Send mobile payment request
@@ -753,16 +675,20 @@ def process_first_payment():
                 (payment_id, agreement_id, installment_number, amount,
                  payment_method, status, created_at)
                 VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (payment_id, agreement['id'], 1, agreement['installment_amount'],
+            ''', (payment_id, agreement['id'], 1, amount,
                   payment_method_type, 'pending'))
             
+            # The worker polls Paynow from here on; the browser reads the cached result
+            paynow_poller.register(db, payment_id, reference, response.poll_url)
+            
             db.commit()
             db.close()
             
             return jsonify({
                 'success': True,
-                'poll_url': response.poll_url,
                 'payment_id': payment_id,
+                'status_url': url_for('bnpl.payment_status', payment_id=payment_id),
+                'retry_after': paynow_poller.FIRST_POLL_SECONDS + 1,
                 'reference': reference,
                 'message': 'Check your phone to approve payment'
             })
@@ -776,162 +702,75 @@ def process_first_payment():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@bnpl_bp.route('/payment-status/<payment_id>')
+@login_required
+def payment_status(payment_id):
+    """Cached payment status (kept current by the worker's Paynow poller)"""
+    db = get_db()
+    status = paynow_poller.payment_status(db, session['user_id'], payment_id=payment_id)
+    db.close()
+    
+    if not status:
+        return jsonify({'success': False, 'error': 'Payment not found'}), 404
+    
+    response = jsonify({'success': True, **status})
+    response.headers['Retry-After'] = str(status['retry_after'])
+    return response
+
+
 @bnpl_bp.route('/check-payment-status', methods=['POST'])
 @login_required
 def check_payment_status():
-    """Check payment status via Paynow polling"""
-    if not PAYNOW_AVAILABLE:
-        return jsonify({'success': False, 'error': 'Payment system unavailable'}), 503
-    
-    data = request.json
+    """Payment status by poll URL (older pages); reads the poller's cached result"""
+    data = request.json or {}
     poll_url = data.get('poll_url')
     
     if not poll_url:
         return jsonify({'success': False, 'error': 'Poll URL required'}), 400
     
-    try:
-        status = paynow.check_transaction_status(poll_url)
-        
-        return jsonify({
-            'success': True,
-            'paid': status.paid,
-            'status': status.status,
-            'amount': str(status.amount) if hasattr(status, 'amount') else None
-        })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    db = get_db()
+    status = paynow_poller.payment_status(db, session['user_id'], poll_url=poll_url)
+    db.close()
+    
+    if not status:
+        return jsonify({'success': False, 'error': 'Payment not found'}), 404
+    
+    return jsonify({'success': True, **status})
 
 
 @bnpl_bp.route('/payment-webhook', methods=['POST'])
 def payment_webhook():
     """Handle Paynow payment status updates (webhook callback)"""
-    print("📥 Webhook received from Paynow")
-    print(f"Data: {request.form.to_dict()}")
+    # Raw body: the hash covers the values in the order Paynow sent them
+    payload = request.get_data(as_text=True)
+    fields = parse_qsl(payload, keep_blank_values=True)
+    data = dict(fields)
+    print(f"📥 Webhook received from Paynow: {data.get('reference')} {data.get('status')}")
     
-    data = request.form.to_dict()
-    
-    # Extract reference
+    # Parse reference: BNPL-{agreement_id}-{installment}
     reference = data.get('reference', '')
-    
-    if not reference or not reference.startswith('BNPL-'):
+    parsed = bnpl_payments.parse_reference(reference)
+    if not parsed:
         print(f"⚠️ Invalid reference: {reference}")
         return 'Invalid reference', 400
     
-    # Parse reference: BNPL-{agreement_id}-{installment}
-    parts = reference.split('-')
-    if len(parts) < 3:
-        print(f"⚠️ Malformed reference: {reference}")
-        return 'Malformed reference', 400
-    
-    agreement_id = parts[1]
-    installment_number = int(parts[2])
+    agreement_id, installment_number = parsed
     
     # Verify webhook authenticity (important for security!)
-    if not verify_paynow_webhook(data):
+    if not verify_paynow_webhook(fields):
         print("⚠️ Webhook verification failed!")
         return 'Unauthorized', 403
     
-    status_text = data.get('status', '')
+    # Append to the inbox and return; a worker job applies it in order per agreement
+    db = get_db()
+    is_new = paynow_inbox.append(db, reference, agreement_id, installment_number,
+                                 data.get('status', ''), payload)
+    db.commit()
+    db.close()
     
-    try:
-        db = get_db()
-        
-        if status_text == 'Paid':
-            print(f"✅ Payment confirmed for {reference}")
-            
-            # Get agreement internal ID
-            agreement = db.execute('''
-                SELECT id, installments, order_id FROM bnpl_agreements 
-                WHERE agreement_id = ?
-            ''', (agreement_id,)).fetchone()
-            
-            if not agreement:
-                db.close()
-                return 'Agreement not found', 404
-            
-            # Update payment status
-            db.execute('''
-                UPDATE bnpl_payments
-                SET status = 'completed', 
-                    payment_date = CURRENT_TIMESTAMP
-                WHERE agreement_id = ?
-                AND installment_number = ?
-            ''', (agreement['id'], installment_number))
-            
-            # If first payment, activate agreement and order
-            if installment_number == 1:
-                print(f"🎉 Activating agreement {agreement_id}")
-                
-                db.execute('''
-                    UPDATE bnpl_agreements
-                    SET status = 'active'
-                    WHERE agreement_id = ?
-                ''', (agreement_id,))
-                
-                # Update order status
-                db.execute('''
-                    UPDATE orders
-                    SET status = 'confirmed', 
-                        payment_status = 'partial'
-                    WHERE id = ?
-                ''', (agreement['order_id'],))
-            
-            # Check if all payments completed
-            total_paid = db.execute('''
-                SELECT COUNT(*) as count FROM bnpl_payments
-                WHERE agreement_id = ? AND status = 'completed'
-            ''', (agreement['id'],)).fetchone()['count']
-            
-            if total_paid >= agreement['installments']:
-                print(f"🎊 All payments complete for {agreement_id}")
-                
-                db.execute('''
-                    UPDATE bnpl_agreements
-                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-                    WHERE agreement_id = ?
-                ''', (agreement_id,))
-                
-                # Mark order as fully paid
-                db.execute('''
-                    UPDATE orders
-                    SET payment_status = 'paid'
-                    WHERE id = ?
-                ''', (agreement['order_id'],))
-            
-            db.commit()
-            db.close()
-            
-            print(f"✅ Webhook processed successfully for {reference}")
-            return 'OK', 200
-            
-        elif status_text in ['Failed', 'Cancelled']:
-            print(f"❌ Payment failed/cancelled for {reference}")
-            
-            # Update payment status
-            agreement = db.execute('''
-                SELECT id FROM bnpl_agreements WHERE agreement_id = ?
-            ''', (agreement_id,)).fetchone()
-            
-            if agreement:
-                db.execute('''
-                    UPDATE bnpl_payments
-                    SET status = 'failed'
-                    WHERE agreement_id = ? AND installment_number = ?
-                ''', (agreement['id'], installment_number))
-                
-                db.commit()
-            
-            db.close()
-            return 'OK', 200
-            
-        else:
-            print(f"ℹ️ Payment pending for {reference}")
-            db.close()
-            return 'OK', 200
-            
-    except Exception as e:
-        print(f"❌ Webhook error: {e}")
-        return 'Error', 500
+    if not is_new:
+        print(f"ℹ️ Duplicate notification for {reference}")
+    return 'OK', 200
 
 
 @bnpl_bp.route('/payment-return')
@@ -940,52 +779,27 @@ def payment_return():
     reference = request.args.get('reference', '')
     
     # Extract agreement ID
-    agreement_id = ''
-    if reference and reference.startswith('BNPL-'):
-        parts = reference.split('-')
-        if len(parts) >= 2:
-            agreement_id = parts[1]
+    parsed = bnpl_payments.parse_reference(reference)
+    agreement_id = parsed[0] if parsed else ''
     
     return render_template('bnpl/payment_return.html',
                          agreement_id=agreement_id,
                          reference=reference)
 
 
-def verify_paynow_webhook(data):
-    """Verify webhook is authentic from Paynow"""
-    if not PAYNOW_AVAILABLE:
+def verify_paynow_webhook(fields):
+    """Verify webhook is authentic from Paynow (fields: ordered (key, value) pairs)"""
+    if not PAYNOW_INTEGRATION_KEY:
         return False
     
-    try:
-        # Get hash from webhook
-        received_hash = data.get('hash', '').upper()
-        
-        # Build verification string
-        verify_string = ""
-        for key in sorted(data.keys()):
-            if key != 'hash':
-                verify_string += str(data[key])
-        
-        # Add integration key
-        verify_string += PAYNOW_INTEGRATION_KEY
-        
-        # Calculate hash
-        import hashlib
-        calculated_hash = hashlib.sha512(verify_string.encode()).hexdigest().upper()
-        
-        # Compare
-        is_valid = calculated_hash == received_hash
-        
-        if not is_valid:
-            print(f"⚠️ Hash mismatch!")
-            print(f"Expected: {calculated_hash}")
-            print(f"Received: {received_hash}")
-        
-        return is_valid
-        
-    except Exception as e:
-        print(f"Error verifying webhook: {e}")
+    received_hash = dict(fields).get('hash', '').upper()
+    calculated_hash = bnpl_payments.paynow_hash(fields, PAYNOW_INTEGRATION_KEY)
+    
+    if not hmac.compare_digest(calculated_hash, received_hash):
+        print(f"⚠️ Hash mismatch!")
         return False
+    
+    return True
 
 
 def detect_diaspora_status(phone, location):
@@ -1013,27 +827,9 @@ def detect_diaspora_status(phone, location):
 
 
 def get_user_credit_tier(user_id):
-    """Get user's credit tier based on history"""
-    db = get_db()
-    
-    # Check completed agreements
-    completed = db.execute('''
-        SELECT COUNT(*) as count FROM bnpl_agreements
-        WHERE user_id = ? AND status = 'completed'
-    ''', (user_id,)).fetchone()['count']
-    
-    # Check verification
-    user = db.execute('SELECT verification_status FROM users WHERE user_id = ?',
-                     (user_id,)).fetchone()
-    
-    db.close()
-    
-    if completed >= 5 or (user and user['verification_status'] == 'verified'):
-        return 'premium'
-    elif completed >= 2:
-        return 'verified'
-    else:
-        return 'basic'
+    """Get user's credit tier based on history (same cached profile as eligibility)"""
+    profile = credit_profile.get_profile(get_db(), user_id)
+    return profile['tier'] if profile else 'basic'
 
 
 # Admin routes (for managing BNPL)
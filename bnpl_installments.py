@@ -0,0 +1,135 @@
+"""
+BNPL Installments - One bnpl_installments row per scheduled installment.
+Replaces decoding bnpl_agreements.payment_schedule (JSON) on every read: schedule
+pages load an agreement's rows by (agreement_id, installment_number), and jobs find
+what falls due on a given day through the (status, due_date) index. An installment
+still unpaid after the grace period turns `overdue` with a late_fee (bnpl_reminders),
+which is part of its amount_due from then on.
+"""
+
+import json
+
+# Installment lifecycle
+PENDING, OVERDUE, PAID = 'pending', 'overdue', 'paid'
+
+
+def create_schedule(db, agreement_pk, payment_schedule):
+    """Store a plan's payment_schedule (from calculate_bnpl_plan) for a new agreement (caller commits)."""
+    db.executemany('''
+        INSERT INTO bnpl_installments (agreement_id, installment_number, amount, due_date, status)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (agreement_id, installment_number) DO NOTHING
+    ''', [(agreement_pk, item['installment_number'], item['amount'], item['due_date'], PENDING)
+          for item in payment_schedule])
+
+
+def _as_schedule_item(row):
+    late_fee = row['late_fee'] or 0
+    return {
+        'installment_number': row['installment_number'],
+        'amount': row['amount'],
+        'late_fee': late_fee,
+        'amount_due': round(row['amount'] + late_fee, 2),
+        'due_date': str(row['due_date']),
+        'status': row['status'],
+        'paid_at': row['paid_at'],
+    }
+
+
+def schedules(db, agreement_pks):
+    """{agreement pk: [installment dicts in order]} for several agreements in one query."""
+    agreement_pks = list(agreement_pks)
+    result = {pk: [] for pk in agreement_pks}
+    if not agreement_pks:
+        return result
+    placeholders = ', '.join('?' * len(agreement_pks))
+    rows = db.execute(f'''
+        SELECT agreement_id, installment_number, amount, late_fee, due_date, status, paid_at
+        FROM bnpl_installments
+        WHERE agreement_id IN ({placeholders})
+        ORDER BY agreement_id, installment_number
+    ''', agreement_pks).fetchall()
+    for row in rows:
+        result[row['agreement_id']].append(_as_schedule_item(row))
+    return result
+
+
+def schedule(db, agreement_pk):
+    """One agreement's installments, in order."""
+    return schedules(db, [agreement_pk])[agreement_pk]
+
+
+def amount_due(db, agreement_pk, installment_number, default=None):
+    """What paying an installment costs: its amount plus any late fee (`default` without a row)."""
+    row = db.execute('''
+        SELECT amount, late_fee FROM bnpl_installments
+        WHERE agreement_id = ? AND installment_number = ?
+    ''', (agreement_pk, installment_number)).fetchone()
+    if not row:
+        return default
+    return round(row['amount'] + (row['late_fee'] or 0), 2)
+
+
+def status_of(db, agreement_pk, installment_number):
+    """An installment's status, or None if the agreement has no row for it."""
+    row = db.execute('''
+        SELECT status FROM bnpl_installments WHERE agreement_id = ? AND installment_number = ?
+    ''', (agreement_pk, installment_number)).fetchone()
+    return row['status'] if row else None
+
+
+def mark_paid(db, agreement_pk, installment_number):
+    """
+    Record a pending or overdue installment as paid (caller commits). Returns False
+    if it is not open (already paid, or its agreement defaulted).
+    """
+    return db.execute('''
+        UPDATE bnpl_installments SET status = ?, paid_at = CURRENT_TIMESTAMP
+        WHERE agreement_id = ? AND installment_number = ? AND status IN (?, ?)
+    ''', (PAID, agreement_pk, installment_number, PENDING, OVERDUE)).rowcount > 0
+
+
+def due_on(db, due_date, status=PENDING):
+    """Installments of live agreements in `status` falling due on `due_date` ('YYYY-MM-DD')."""
+    return db.execute('''
+        SELECT bi.id, bi.agreement_id, bi.installment_number, bi.amount, bi.due_date,
+               ba.agreement_id AS agreement_ref, ba.user_id
+        FROM bnpl_installments bi
+        JOIN bnpl_agreements ba ON ba.id = bi.agreement_id
+        WHERE bi.status = ? AND bi.due_date = ? AND ba.status IN ('pending', 'active')
+        ORDER BY bi.id
+    ''', (status, due_date)).fetchall()
+
+
+def init_bnpl_installments(db):
+    """Migrate JSON payment schedules of agreements that have no installment rows yet."""
+    agreements = db.execute('''
+        SELECT ba.id, ba.agreement_id, ba.payment_schedule FROM bnpl_agreements ba
+        WHERE ba.payment_schedule IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM bnpl_installments bi WHERE bi.agreement_id = ba.id)
+    ''').fetchall()
+    if not agreements:
+        return 0
+
+    for agreement in agreements:
+        try:
+            payment_schedule = json.loads(agreement['payment_schedule'])
+        except (TypeError, ValueError):
+            continue
+        create_schedule(db, agreement['id'], payment_schedule)
+        # Payments were recorded against either the internal or the public agreement id
+        db.execute('''
+            UPDATE bnpl_installments SET status = ?, paid_at = (
+                SELECT MAX(COALESCE(bp.payment_date, bp.created_at)) FROM bnpl_payments bp
+                WHERE bp.agreement_id IN (?, ?) AND bp.installment_number = bnpl_installments.installment_number
+                  AND bp.status = 'completed'
+            )
+            WHERE agreement_id = ? AND EXISTS (
+                SELECT 1 FROM bnpl_payments bp
+                WHERE bp.agreement_id IN (?, ?) AND bp.installment_number = bnpl_installments.installment_number
+                  AND bp.status = 'completed'
+            )
+        ''', (PAID, str(agreement['id']), agreement['agreement_id'], agreement['id'],
+              str(agreement['id']), agreement['agreement_id']))
+    db.commit()
+    return len(agreements)
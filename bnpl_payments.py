@@ -0,0 +1,136 @@
+"""
+BNPL Payment Transitions - Applies a Paynow transaction status to an installment.
+Shared by the Paynow result webhook and the server-side status poller, so a payment
+reported by both (or reported twice) is only applied once.
+"""
+
+import hashlib
+import uuid
+
+import bnpl_installments
+import credit_profile
+import inventory
+
+# Paynow statuses (lower-cased) that mean the money has arrived / will not arrive
+PAID_STATUSES = {'paid', 'awaiting delivery', 'delivered'}
+FAILED_STATUSES = {'cancelled', 'failed'}
+
+REFERENCE_PREFIX = 'BNPL-'
+
+
+def make_reference(agreement_id, installment_number):
+    return f'{REFERENCE_PREFIX}{agreement_id}-{installment_number}'
+
+
+def parse_reference(reference):
+    """BNPL-{agreement_id}-{installment} -> (agreement_id, installment), or None."""
+    if not reference or not reference.startswith(REFERENCE_PREFIX):
+        return None
+    # Agreement ids are UUIDs (they contain '-'), so split from the right
+    agreement_id, _, installment = reference[len(REFERENCE_PREFIX):].rpartition('-')
+    if not agreement_id or not installment.isdigit():
+        return None
+    return agreement_id, int(installment)
+
+
+def paynow_hash(fields, integration_key):
+    """
+    Paynow's SHA-512 signature over (key, value) pairs: the values in the order
+    sent (hash excluded), then the integration key - lower-cased, as the SDK does.
+    """
+    signed = ''.join(str(value) for key, value in fields if key.lower() != 'hash') + integration_key.lower()
+    return hashlib.sha512(signed.encode('utf-8')).hexdigest().upper()
+
+
+def find_agreement(db, agreement_id):
+    return db.execute('''
+        SELECT id, agreement_id, user_id, installments, installment_amount, order_id FROM bnpl_agreements
+        WHERE agreement_id = ?
+    ''', (agreement_id,)).fetchone()
+
+
+def _installment_paid(db, agreement, installment_number):
+    return db.execute('''
+        SELECT 1 FROM bnpl_payments
+        WHERE agreement_id = ? AND installment_number = ? AND status = 'completed'
+    ''', (agreement['id'], installment_number)).fetchone() is not None
+
+
+def apply_status(db, agreement, installment_number, status_text):
+    """
+    Move installment `installment_number` of `agreement` (from find_agreement) to
+    the state implied by Paynow's `status_text`, inside the caller's transaction.
+
+    Returns 'paid', 'failed', 'pending', 'duplicate' (already in that state) or
+    'not_open': money arrived for an installment that can no longer be paid (its
+    agreement defaulted), recorded as a completed payment for reconciliation
+    without moving the agreement or order.
+    """
+    status = (status_text or '').strip().lower()
+
+    if status in PAID_STATUSES:
+        if _installment_paid(db, agreement, installment_number):
+            return 'duplicate'
+        # A retried payment leaves one row per attempt under the same reference:
+        # the latest attempt is the one Paynow is reporting on
+        updated = db.execute('''
+            UPDATE bnpl_payments
+            SET status = 'completed', payment_date = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT MAX(id) FROM bnpl_payments WHERE agreement_id = ? AND installment_number = ?
+            ) AND status != 'completed'
+        ''', (agreement['id'], installment_number)).rowcount
+        if not updated:
+            # Paid without an initiated attempt on record (e.g. paid from the Paynow site)
+            db.execute('''
+                INSERT INTO bnpl_payments
+                (payment_id, agreement_id, installment_number, amount, status, payment_date)
+                VALUES (?, ?, ?, ?, 'completed', CURRENT_TIMESTAMP)
+            ''', (str(uuid.uuid4()), agreement['id'], installment_number,
+                  bnpl_installments.amount_due(db, agreement['id'], installment_number,
+                                               agreement['installment_amount'])))
+
+        if (not bnpl_installments.mark_paid(db, agreement['id'], installment_number)
+                and bnpl_installments.status_of(db, agreement['id'], installment_number) is not None):
+            return 'not_open'
+
+        # First payment: activate the agreement and order; held stock is now sold
+        activated = installment_number == 1 and db.execute('''
+            UPDATE bnpl_agreements SET status = 'active'
+            WHERE id = ? AND status = 'pending'
+        ''', (agreement['id'],)).rowcount
+        if activated:
+            db.execute('''
+                UPDATE orders SET status = 'confirmed', payment_status = 'partial'
+                WHERE id = ?
+            ''', (agreement['order_id'],))
+            inventory.commit_order(db, agreement['order_id'])
+
+        total_paid = db.execute('''
+            SELECT COUNT(DISTINCT installment_number) AS count FROM bnpl_payments
+            WHERE agreement_id = ? AND status = 'completed'
+        ''', (agreement['id'],)).fetchone()['count']
+
+        completed = total_paid >= agreement['installments'] and db.execute('''
+            UPDATE bnpl_agreements SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('pending', 'active')
+        ''', (agreement['id'],)).rowcount
+        if completed:
+            db.execute('UPDATE orders SET payment_status = ? WHERE id = ?', ('paid', agreement['order_id']))
+            credit_profile.invalidate(db, agreement['user_id'])
+        return 'paid'
+
+    if status in FAILED_STATUSES:
+        updated = db.execute('''
+            UPDATE bnpl_payments SET status = 'failed'
+            WHERE agreement_id = ? AND installment_number = ? AND status = 'pending'
+        ''', (agreement['id'], installment_number)).rowcount
+        if not updated:
+            return 'duplicate'
+
+        # First payment failed: give the held stock back
+        if installment_number == 1:
+            inventory.release_order(db, agreement['order_id'])
+        return 'failed'
+
+    return 'pending'
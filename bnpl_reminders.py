@@ -0,0 +1,246 @@
+"""
+BNPL Reminders - Payment reminders, late fees and defaults for installments.
+The worker runs run_once() on a timer. Each run reads every open installment due
+within the reminder window (or already overdue) in one query over the
+bnpl_installments (status, due_date) index. It then applies late fees and
+`defaulted` transitions with bulk updates and texts customers in batches (sms.py),
+one message per due date so many recipients share each API call.
+Installments are claimed before a text is sent, so concurrent workers never
+double-send, and claims for undelivered texts are released for the next run.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import credit_profile
+import sms
+from database import DB_TYPE, connection
+
+logger = logging.getLogger(__name__)
+
+
+def _load_settings():
+    config_path = os.path.join(os.path.dirname(__file__), 'config.json')
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config = json.load(f).get('bnpl', {})
+    return {
+        'reminder_days_before': int(config.get('reminder_days_before', 2)),
+        'grace_period_days': int(config.get('grace_period_days', 3)),
+        'late_fee': float(config.get('late_fee_zwl', 10)),
+        # Days past due after which the agreement is defaulted
+        'default_after_days': int(config.get('default_after_days', 30)),
+    }
+
+
+SETTINGS = _load_settings()
+
+# Seconds between runs in the worker
+RUN_INTERVAL_SECONDS = int(os.environ.get('BNPL_REMINDER_INTERVAL', 900))
+
+# Ids per IN (...) list in bulk updates
+ID_CHUNK = 500
+
+REMINDER_TEXT = ('ZimClassifieds: your BNPL installment is due on {due}. '
+                 'Pay on time under My Agreements to keep your credit tier.')
+OVERDUE_TEXT = ('ZimClassifieds: your BNPL installment due on {due} is overdue and a late fee '
+                'of ZWL {fee:g} has been added. Please pay under My Agreements.')
+
+_counters = {'runs': 0, 'reminders': 0, 'overdue_notices': 0, 'late_fees': 0, 'defaulted': 0,
+             'undelivered': 0, 'no_phone': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), ID_CHUNK):
+        yield ids[i:i + ID_CHUNK]
+
+
+def _bulk(db, sql, ids, *params):
+    """Run `sql` (with an {ids} placeholder list) over ids in chunks. Returns any RETURNING rows."""
+    rows = []
+    for chunk in _chunks(ids):
+        cursor = db.execute(sql.format(ids=', '.join('?' * len(chunk))), (*params, *chunk))
+        if 'RETURNING' in sql:
+            rows += cursor.fetchall()
+    return rows
+
+
+def select_open(db, today):
+    """Open installments of active agreements due by the end of the reminder window."""
+    horizon = today + timedelta(days=SETTINGS['reminder_days_before'])
+    return db.execute('''
+        SELECT bi.id, bi.agreement_id, bi.due_date, bi.status, bi.reminded_at, bi.overdue_notified_at,
+               ba.user_id, u.phone
+        FROM bnpl_installments bi
+        JOIN bnpl_agreements ba ON ba.id = bi.agreement_id AND ba.status = 'active'
+        JOIN users u ON u.user_id = ba.user_id
+        WHERE bi.status IN ('pending', 'overdue') AND bi.due_date <= ?
+        ORDER BY bi.due_date, bi.id
+    ''', (horizon.isoformat(),)).fetchall()
+
+
+def plan(rows, today):
+    """Split selected installments into (reminders, late fees, overdue notices, agreements to default)."""
+    reminders, late_fees, notices, defaults = [], [], [], set()
+    for row in rows:
+        days_late = (today - _as_date(row['due_date'])).days
+        if days_late > SETTINGS['default_after_days']:
+            defaults.add(row['agreement_id'])
+        elif days_late > SETTINGS['grace_period_days']:
+            if row['status'] == 'pending':
+                late_fees.append(row)
+            if row['overdue_notified_at'] is None:
+                notices.append(row)
+        elif days_late <= 0 and row['status'] == 'pending' and row['reminded_at'] is None:
+            reminders.append(row)
+    return reminders, late_fees, notices, defaults
+
+
+def _default_agreements(db, agreement_pks):
+    """Mark agreements defaulted and take their open installments out of the due index."""
+    defaulted = _bulk(db, '''
+        UPDATE bnpl_agreements SET status = 'defaulted'
+        WHERE status = 'active' AND id IN ({ids})
+        RETURNING id, user_id
+    ''', agreement_pks)
+    _bulk(db, '''
+        UPDATE bnpl_installments SET status = 'defaulted'
+        WHERE status IN ('pending', 'overdue') AND agreement_id IN ({ids})
+    ''', [row['id'] for row in defaulted])
+    credit_profile.invalidate_many(db, {row['user_id'] for row in defaulted})
+    return len(defaulted)
+
+
+def _claim(db, column, rows):
+    """Stamp `column` on rows not yet stamped; returns the ids this run now owns."""
+    claimed = _bulk(db, f'''
+        UPDATE bnpl_installments SET {column} = CURRENT_TIMESTAMP
+        WHERE {column} IS NULL AND id IN ({{ids}})
+        RETURNING id
+    ''', [row['id'] for row in rows])
+    return {row['id'] for row in claimed}
+
+
+def _text(db, column, rows, template, send):
+    """Text each claimed installment's customer, grouped by due date. Returns (sent, undelivered)."""
+    by_message = {}
+    for row in rows:
+        number = sms.normalise_number(row['phone'])
+        if not number:
+            _count('no_phone')
+            continue
+        message = template.format(due=_as_date(row['due_date']).strftime('%d %b %Y'), fee=SETTINGS['late_fee'])
+        by_message.setdefault(message, {}).setdefault(number, []).append(row['id'])
+
+    delivered, undelivered_ids = 0, []
+    for message, installments_by_number in by_message.items():
+        sent, failed = send(message, list(installments_by_number))
+        delivered += len(sent)
+        for number in failed:
+            undelivered_ids += installments_by_number[number]
+
+    # Release claims for texts that did not go out so the next run tries again
+    _bulk(db, f'UPDATE bnpl_installments SET {column} = NULL WHERE id IN ({{ids}})', undelivered_ids)
+    db.commit()
+    return delivered, len(undelivered_ids)
+
+
+def run_once(db, today=None, send=None):
+    """
+    One scheduler pass. `send(message, numbers) -> (sent, failed)` defaults to
+    sms.send_bulk; without SMS credentials only fees and defaults are applied.
+    Returns a summary dict.
+    """
+    today = today or date.today()
+    send = send or (sms.send_bulk if sms.configured() else None)
+    start = time.perf_counter()
+
+    rows = select_open(db, today)
+    reminders, late_fees, notices, defaults = plan(rows, today)
+
+    # Fees, defaults and text claims commit together before any text is sent
+    charged = _bulk(db, '''
+        UPDATE bnpl_installments SET status = 'overdue', late_fee = ?, late_fee_at = CURRENT_TIMESTAMP
+        WHERE status = 'pending' AND id IN ({ids})
+        RETURNING id
+    ''', [row['id'] for row in late_fees], SETTINGS['late_fee'])
+    defaulted = _default_agreements(db, defaults) if defaults else 0
+    if send:
+        claimed = _claim(db, 'reminded_at', reminders)
+        reminders = [row for row in reminders if row['id'] in claimed]
+        claimed = _claim(db, 'overdue_notified_at', notices)
+        notices = [row for row in notices if row['id'] in claimed]
+    db.commit()
+
+    summary = {'selected': len(rows), 'late_fees': len(charged), 'defaulted': defaulted,
+               'reminders': 0, 'overdue_notices': 0, 'undelivered': 0}
+    send_start = time.perf_counter()
+    if send:
+        summary['reminders'], undelivered = _text(db, 'reminded_at', reminders, REMINDER_TEXT, send)
+        summary['undelivered'] += undelivered
+        summary['overdue_notices'], undelivered = _text(db, 'overdue_notified_at', notices, OVERDUE_TEXT, send)
+        summary['undelivered'] += undelivered
+    send_seconds = time.perf_counter() - send_start
+
+    texts = summary['reminders'] + summary['overdue_notices']
+    summary['messages_per_second'] = round(texts / send_seconds, 1) if texts else 0
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    for key in ('late_fees', 'defaulted', 'reminders', 'overdue_notices', 'undelivered'):
+        _count(key, summary[key])
+    _count('runs')
+    return summary
+
+
+def run(stop):
+    """Scheduler thread loop for worker.py: a pass every RUN_INTERVAL_SECONDS until `stop` is set."""
+    while not stop.is_set():
+        try:
+            with connection() as db:
+                summary = run_once(db)
+            if summary['selected']:
+                logger.info('BNPL reminders: %s', summary)
+        except Exception:
+            logger.exception('BNPL reminder run failed')
+        stop.wait(RUN_INTERVAL_SECONDS)
+
+
+def stats():
+    """This process's scheduler and SMS counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    return {'settings': SETTINGS, 'this_process': process, 'sms': sms.stats()}
+
+
+def init_bnpl_reminders(db):
+    """Add the reminder and late-fee columns to existing bnpl_installments tables."""
+    columns = {
+        'reminded_at': 'TIMESTAMP',
+        'overdue_notified_at': 'TIMESTAMP',
+        'late_fee': 'REAL DEFAULT 0',
+        'late_fee_at': 'TIMESTAMP',
+    }
+    if DB_TYPE == 'postgresql':
+        for name, sql_type in columns.items():
+            db.execute(f'ALTER TABLE bnpl_installments ADD COLUMN IF NOT EXISTS {name} {sql_type}')
+    else:
+        existing = {row[1] for row in db.execute('PRAGMA table_info(bnpl_installments)').fetchall()}
+        for name, sql_type in columns.items():
+            if name not in existing:
+                db.execute(f'ALTER TABLE bnpl_installments ADD COLUMN {name} {sql_type}')
+    db.commit()
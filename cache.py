@@ -0,0 +1,333 @@
+"""
+Page Data Cache - TTL cache for the query results behind hot public pages.
+Backends: an in-process LRU per worker (default) or a SQLite file shared by every
+gunicorn worker on the host (CACHE_BACKEND=sqlite). Entries carry tags; writers call
+invalidate(*tags) after committing, which bumps the tags' versions so every entry
+computed before the write is ignored. Each key is recomputed by one caller at a time:
+concurrent callers are served the just-expired value (for up to STALE_SECONDS) or
+wait for the result, so an expiring home page does not stampede the database.
+
+With the memory backend invalidation only reaches the worker that made the write;
+other workers pick the change up within their TTL. Use the sqlite backend when that
+window matters. Cached values are shared between requests and must not be mutated.
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'zimclassifieds-cache.db'))
+MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1000))
+DEFAULT_TTL = float(os.environ.get('CACHE_TTL', 60))
+
+# How long an expired value may still be served while one caller recomputes it
+STALE_SECONDS = float(os.environ.get('CACHE_STALE_SECONDS', 30))
+
+# How long a caller waits for another's recomputation before computing itself
+LOCK_WAIT_SECONDS = float(os.environ.get('CACHE_LOCK_WAIT', 5))
+POLL_SECONDS = 0.02
+
+_counters = {'hits': 0, 'stale_hits': 0, 'coalesced': 0, 'misses': 0, 'computes': 0,
+             'compute_s': 0.0, 'invalidations': 0, 'errors': 0}
+_counters_lock = threading.Lock()
+
+# key -> lock held by the caller recomputing it in this process
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+class MemoryBackend:
+    """Per-process LRU of key -> (value, expires_at, {tag: version})."""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def get(self, key):
+        """(value, expires_at) if present and no tag was invalidated since, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, versions = entry
+            if any(self._versions.get(tag, 0) != version for tag, version in versions.items()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, expires_at
+
+    def set(self, key, value, expires_at, versions):
+        with self._lock:
+            self._entries[key] = (value, expires_at, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def acquire(self, key, seconds):
+        # The in-process flight lock already serialises recomputation
+        return True
+
+    def release(self, key):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Entries, tag versions and recompute leases in a SQLite file shared across processes."""
+
+    name = 'sqlite'
+
+    # Expired entries are purged (and the table trimmed to max_entries) every this many sets
+    PURGE_EVERY = 200
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        with self._conn() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    versions TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_tags (
+                    tag TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_leases (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                );
+            ''')
+
+    def _conn(self):
+        # One autocommit connection per thread, reopened in forked workers
+        conn, pid = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=LOCK_WAIT_SECONDS, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        rows = self._conn().execute(f'''
+            SELECT tag, version FROM cache_tags WHERE tag IN ({', '.join('?' * len(tags))})
+        ''', tags).fetchall()
+        return {**dict.fromkeys(tags, 0), **dict(rows)}
+
+    def get(self, key):
+        row = self._conn().execute('''
+            SELECT value, expires_at, versions FROM cache_entries WHERE key = ?
+        ''', (key,)).fetchone()
+        if row is None:
+            return None
+        versions = json.loads(row[2])
+        if self.tag_versions(versions) != versions:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at, versions):
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO cache_entries (key, value, expires_at, versions) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value, expires_at = excluded.expires_at, versions = excluded.versions
+        ''', (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, json.dumps(versions)))
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM cache_entries WHERE expires_at < ?', (time.time() - STALE_SECONDS,))
+            conn.execute('''
+                DELETE FROM cache_entries WHERE key NOT IN (
+                    SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT ?
+                )
+            ''', (self.max_entries,))
+
+    def invalidate(self, tags):
+        self._conn().executemany('''
+            INSERT INTO cache_tags (tag, version) VALUES (?, 1)
+            ON CONFLICT (tag) DO UPDATE SET version = cache_tags.version + 1
+        ''', [(tag,) for tag in tags])
+
+    def acquire(self, key, seconds):
+        """Take the cross-process recompute lease on key unless another live one exists."""
+        now = time.time()
+        return self._conn().execute('''
+            INSERT INTO cache_leases (key, expires_at) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at
+            WHERE cache_leases.expires_at < ?
+        ''', (key, now + seconds, now)).rowcount == 1
+
+    def release(self, key):
+        self._conn().execute('DELETE FROM cache_leases WHERE key = ?', (key,))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache_entries')
+
+    def size(self):
+        return self._conn().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+def _make_backend(name):
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name in ('none', 'off'):
+        return None
+    return MemoryBackend()
+
+
+_backend = _make_backend(BACKEND)
+
+
+def configure(backend):
+    """Swap the backend (a MemoryBackend, SQLiteBackend or None to disable caching)."""
+    global _backend
+    _backend = backend
+
+
+def _lookup(key):
+    try:
+        return _backend.get(key)
+    except sqlite3.Error:
+        _count('errors')
+        return None
+
+
+def _compute(key, compute, ttl, tags):
+    # Versions are read before computing: a write committed meanwhile makes the result stale at once
+    versions = _backend.tag_versions(tags)
+    start = time.perf_counter()
+    value = compute()
+    _count('computes')
+    _count('compute_s', time.perf_counter() - start)
+    try:
+        _backend.set(key, value, time.time() + ttl, versions)
+    except sqlite3.Error:
+        _count('errors')
+    return value
+
+
+def _wait_for(key, flight):
+    """Wait for another caller's recomputation of key; the fresh value or None on timeout."""
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    if flight.acquire(timeout=LOCK_WAIT_SECONDS):
+        flight.release()
+    while True:
+        entry = _lookup(key)
+        if entry and entry[1] > time.time():
+            return entry
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_SECONDS)
+
+
+def get_or_set(key, compute, ttl=DEFAULT_TTL, tags=()):
+    """
+    The cached value for key, or compute() stored for ttl seconds under tags.
+    compute must return something picklable (e.g. dicts, not database rows).
+    """
+    if _backend is None:
+        return compute()
+
+    entry = _lookup(key)
+    now = time.time()
+    if entry and entry[1] > now:
+        _count('hits')
+        return entry[0]
+    stale = entry if entry and entry[1] + STALE_SECONDS > now else None
+
+    with _flights_lock:
+        flight = _flights.setdefault(key, threading.Lock())
+    if flight.acquire(blocking=False):
+        try:
+            if _backend.acquire(key, LOCK_WAIT_SECONDS):
+                try:
+                    _count('misses')
+                    return _compute(key, compute, ttl, tags)
+                finally:
+                    _backend.release(key)
+        finally:
+            flight.release()
+            with _flights_lock:
+                if _flights.get(key) is flight:
+                    del _flights[key]
+
+    # Someone else (in this process or another worker) is recomputing key
+    if stale:
+        _count('stale_hits')
+        return stale[0]
+    entry = _wait_for(key, flight)
+    if entry:
+        _count('coalesced')
+        return entry[0]
+    _count('misses')
+    return _compute(key, compute, ttl, tags)
+
+
+def invalidate(*tags):
+    """Drop every entry tagged with any of tags. Call after the write has committed."""
+    if _backend is None or not tags:
+        return
+    try:
+        _backend.invalidate(tags)
+    except sqlite3.Error:
+        _count('errors')
+        return
+    _count('invalidations', len(tags))
+
+
+def clear():
+    if _backend is not None:
+        _backend.clear()
+
+
+def stats():
+    """Backend, size and this process's hit/miss counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    served = process['hits'] + process['stale_hits'] + process['coalesced']
+    lookups = served + process['misses']
+    return {
+        'backend': _backend.name if _backend else 'none',
+        'entries': _backend.size() if _backend else 0,
+        'ttl_s': DEFAULT_TTL,
+        'hit_rate': round(served / lookups, 3) if lookups else None,
+        'this_process': {key: round(value, 3) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
@@ -5,17 +5,12 @@ Handles adding/removing products from cart and checkout flow.
 
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from functools import wraps
-import sqlite3
 import uuid
 
-cart_bp = Blueprint('cart', __name__, url_prefix='/cart')
-
+from database import get_db
+import inventory
 
-def get_db():
-    """Local DB helper to avoid circular import."""
-    db = sqlite3.connect('zimclassifieds.db')
-    db.row_factory = sqlite3.Row
-    return db
+cart_bp = Blueprint('cart', __name__, url_prefix='/cart')
 
 
 def login_required(f):
@@ -85,7 +80,10 @@ def add_to_cart():
         db.close()
         return jsonify({'success': False, 'message': 'Product not found'}), 404
     
-    if product['stock_quantity'] < quantity:
+    # Unreserved stock, counting this shopper's own abandoned checkout hold as free
+    in_stock = inventory.available(db, product['id'], user_id)
+    
+    if in_stock < quantity:
         db.close()
         return jsonify({'success': False, 'message': 'Insufficient stock'}), 400
     
@@ -97,7 +95,7 @@ def add_to_cart():
     if existing:
         # Update quantity
         new_qty = existing['quantity'] + quantity
-        if product['stock_quantity'] < new_qty:
+        if in_stock < new_qty:
             db.close()
             return jsonify({'success': False, 'message': 'Insufficient stock'}), 400
         
@@ -166,7 +164,7 @@ def update_cart():
         db.close()
         return jsonify({'success': False, 'message': 'Product not found'}), 404
     
-    if product['stock_quantity'] < quantity:
+    if inventory.available(db, product['id'], user_id) < quantity:
         db.close()
         return jsonify({'success': False, 'message': 'Insufficient stock'}), 400
     
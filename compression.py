@@ -0,0 +1,271 @@
+"""
+Response Compression - WSGI middleware compressing HTML, JSON and other text bodies.
+Negotiates Accept-Encoding (br when the brotli package is installed, else gzip) and
+compresses responses of COMPRESSIBLE_TYPES of at least MIN_SIZE bytes that are not
+already encoded. Bodies with a Content-Length are compressed in one piece; streamed
+bodies are compressed chunk by chunk and flushed after each, so early HTML still
+reaches the browser early. Bodies of responses with a strong ETag (conditional
+pages, see http_cache.py) are precomputed: the compressed bytes are kept per
+(URL, ETag, encoding) so repeat requests for an unchanged page are not recompressed.
+Compressed responses carry Vary: Accept-Encoding and a weak ETag.
+"""
+
+import gzip
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from itertools import chain
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENABLED = os.environ.get('COMPRESS_ENABLED', '1') != '0'
+
+# Bodies smaller than this are sent as they are (headers would eat the saving)
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+
+# zlib level 1-9 and brotli quality 0-11; the defaults favour CPU over the last few bytes
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+# Compressed bodies kept for strong ETags, and the largest body worth keeping
+PRECOMPUTED_ENTRIES = int(os.environ.get('COMPRESS_CACHE_ENTRIES', 256))
+PRECOMPUTED_MAX_BYTES = 1024 * 1024
+
+_precomputed = OrderedDict()
+_precomputed_lock = threading.Lock()
+
+_counters = {'compressed': 0, 'streamed': 0, 'precomputed_hits': 0, 'not_accepted': 0,
+             'skipped_type': 0, 'skipped_small': 0, 'skipped_encoded': 0, 'skipped_status': 0,
+             'skipped_larger': 0, 'bytes_in': 0, 'bytes_out': 0, 'compress_s': 0.0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def negotiate(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value."""
+    accepted = parse_accept_header(accept_encoding or '')
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """Incremental gzip or brotli compressor."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data, flush=False):
+        if self.encoding == 'br':
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def compress(data, encoding):
+    """Whole-body compression at the configured level."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _skip_reason(status, headers):
+    """Why a response must go out as it is, or None if it may be compressed."""
+    code = int(status.split(' ', 1)[0])
+    if code < 200 or code in (204, 206, 304):
+        return 'skipped_status'
+    if headers.get('Content-Encoding') or 'no-transform' in headers.get('Cache-Control', ''):
+        return 'skipped_encoded'
+    if headers.get('Content-Type', '').split(';')[0].strip().lower() not in COMPRESSIBLE_TYPES:
+        return 'skipped_type'
+    length = headers.get('Content-Length')
+    if length is not None and int(length) < MIN_SIZE:
+        return 'skipped_small'
+    return None
+
+
+def _precomputed_get(key):
+    with _precomputed_lock:
+        body = _precomputed.get(key)
+        if body is not None:
+            _precomputed.move_to_end(key)
+        return body
+
+
+def _precomputed_set(key, body):
+    if len(body) > PRECOMPUTED_MAX_BYTES or not PRECOMPUTED_ENTRIES:
+        return
+    with _precomputed_lock:
+        _precomputed[key] = body
+        _precomputed.move_to_end(key)
+        while len(_precomputed) > PRECOMPUTED_ENTRIES:
+            _precomputed.popitem(last=False)
+
+
+def _closing(iterable, body):
+    """Yield from iterable, then close the app's body (Flask runs teardown on close)."""
+    try:
+        yield from iterable
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+class CompressionMiddleware:
+    """Wraps a WSGI app (app.wsgi_app) with response compression."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if not ENABLED or encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            if ENABLED and encoding is None:
+                _count('not_accepted')
+            return self.wsgi_app(environ, start_response)
+
+        captured, written = {}, []
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=Headers(headers), exc_info=exc_info)
+            return written.append
+
+        body = self.wsgi_app(environ, capture)
+        chunks = iter(body)
+        head = list(written)
+        if not captured:
+            # start_response is called by the first chunk at the latest
+            head += [next(chunks, b'')]
+        status, headers = captured['status'], captured['headers']
+
+        reason = _skip_reason(status, headers)
+        if reason:
+            _count(reason)
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return _closing(chain(head, chunks), body)
+
+        if headers.get('Content-Length') is not None:
+            data = b''.join(chain(head, chunks))
+            return self._whole(environ, start_response, status, headers, data, body, encoding)
+
+        # Streamed: hold back chunks until MIN_SIZE is reached or the body ends
+        buffered, size = head, sum(map(len, head))
+        for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= MIN_SIZE:
+                break
+        else:
+            _count('skipped_small')
+            headers['Content-Length'] = str(size)
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return _closing(buffered, body)
+
+        self._compressed_headers(headers, encoding)
+        start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+        _count('streamed')
+        return _closing(self._stream(chain(buffered, chunks), encoding), body)
+
+    @staticmethod
+    def _compressed_headers(headers, encoding):
+        headers['Content-Encoding'] = encoding
+        headers.pop('Content-Length', None)
+        vary = [value.strip() for value in headers.get('Vary', '').split(',') if value.strip()]
+        if 'accept-encoding' not in (value.lower() for value in vary):
+            headers['Vary'] = ', '.join(vary + ['Accept-Encoding'])
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+
+    def _whole(self, environ, start_response, status, headers, data, body, encoding):
+        etag = headers.get('ETag')
+        key = None
+        if etag and not etag.startswith('W/'):
+            key = (environ.get('PATH_INFO'), environ.get('QUERY_STRING'), etag, encoding)
+        compressed = _precomputed_get(key) if key else None
+        if compressed is not None:
+            _count('precomputed_hits')
+        else:
+            start = time.perf_counter()
+            compressed = compress(data, encoding)
+            _count('compress_s', time.perf_counter() - start)
+            if key:
+                _precomputed_set(key, compressed)
+
+        if len(compressed) >= len(data):
+            _count('skipped_larger')
+            start_response(status, headers.to_wsgi_list(), None)
+            return _closing([data], body)
+
+        self._compressed_headers(headers, encoding)
+        headers['Content-Length'] = str(len(compressed))
+        start_response(status, headers.to_wsgi_list(), None)
+        _count('compressed')
+        _count('bytes_in', len(data))
+        _count('bytes_out', len(compressed))
+        return _closing([compressed], body)
+
+    def _stream(self, chunks, encoding):
+        compressor = _Compressor(encoding)
+        for chunk in chunks:
+            if not chunk:
+                continue
+            start = time.perf_counter()
+            out = compressor.compress(chunk, flush=True)
+            _count('compress_s', time.perf_counter() - start)
+            _count('bytes_in', len(chunk))
+            _count('bytes_out', len(out))
+            yield out
+        out = compressor.finish()
+        _count('bytes_out', len(out))
+        yield out
+
+
+def stats():
+    """This process's compression counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'enabled': ENABLED,
+        'encodings': ['br', 'gzip'] if brotli is not None else ['gzip'],
+        'gzip_level': GZIP_LEVEL,
+        'brotli_quality': BROTLI_QUALITY if brotli is not None else None,
+        'min_size': MIN_SIZE,
+        'ratio': round(process['bytes_out'] / process['bytes_in'], 3) if process['bytes_in'] else None,
+        'bytes_saved': process['bytes_in'] - process['bytes_out'],
+        'this_process': {key: round(value, 3) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
+
+
+def init_app(app):
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
@@ -0,0 +1,174 @@
+"""
+Credit Profile Service - Cached BNPL eligibility, credit score and tier per user.
+A profile is computed from the user's order and BNPL history in one query and kept
+in credit_profiles. Events that change that history (order paid, agreement completed
+or defaulted) call invalidate() in the same transaction, and anything older than
+PROFILE_TTL_SECONDS is recomputed, so web and worker processes share one cache.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+# Upper bound on staleness for changes that do not invalidate (e.g. a new phone number).
+# The nightly batch rescore (credit_scoring.py) refreshes every profile well within it.
+PROFILE_TTL_SECONDS = int(os.environ.get('CREDIT_PROFILE_TTL', 26 * 3600))
+
+DIASPORA_LOCATIONS = ['uk', 'united kingdom', 'usa', 'south africa', 'sa', 'canada', 'australia']
+DIASPORA_PHONE_PREFIXES = ('+44', '+1', '+27')
+
+# Score = base + capped history bonuses + diaspora bonus - default penalty
+BASE_SCORE = 50
+PAID_ORDER_POINTS, PAID_ORDER_CAP = 5, 25
+COMPLETED_BNPL_POINTS, COMPLETED_BNPL_CAP = 10, 30
+DIASPORA_POINTS = 20
+DEFAULT_PENALTY = 30
+PREMIUM_SCORE = 85
+VERIFIED_SCORE = 65
+
+# Everything the score needs, in one round trip
+PROFILE_SQL = '''
+    SELECT u.location, u.phone,
+           COALESCE(o.order_count, 0) AS order_count,
+           COALESCE(o.paid_count, 0) AS paid_count,
+           COALESCE(b.completed_count, 0) AS bnpl_completed,
+           COALESCE(b.defaulted_count, 0) AS bnpl_defaulted
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS order_count,
+               SUM(CASE WHEN payment_status = 'paid' THEN 1 ELSE 0 END) AS paid_count
+        FROM orders WHERE user_id = ? GROUP BY user_id
+    ) o ON o.user_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id,
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) AS completed_count,
+               SUM(CASE WHEN status = 'defaulted' THEN 1 ELSE 0 END) AS defaulted_count
+        FROM bnpl_agreements WHERE user_id = ? GROUP BY user_id
+    ) b ON b.user_id = u.user_id
+    WHERE u.user_id = ?
+'''
+
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key):
+    with _counters_lock:
+        _counters[key] += 1
+
+
+def _timestamp(moment=None):
+    return (moment or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def is_diaspora(location, phone):
+    """Simple heuristic: non-Zimbabwean location or phone number."""
+    location = (location or '').lower()
+    phone = phone or ''
+    return (any(indicator in location for indicator in DIASPORA_LOCATIONS)
+            or phone.startswith(DIASPORA_PHONE_PREFIXES))
+
+
+def score(user_id, facts):
+    """Eligibility, credit score and tier from a PROFILE_SQL row."""
+    diaspora = is_diaspora(facts['location'], facts['phone'])
+    paid_count = int(facts['paid_count'])
+    bnpl_completed = int(facts['bnpl_completed'])
+    bnpl_defaulted = int(facts['bnpl_defaulted'])
+
+    credit_score = BASE_SCORE
+    credit_score += min(paid_count * PAID_ORDER_POINTS, PAID_ORDER_CAP)
+    credit_score += min(bnpl_completed * COMPLETED_BNPL_POINTS, COMPLETED_BNPL_CAP)
+    if diaspora:
+        credit_score += DIASPORA_POINTS
+    credit_score -= bnpl_defaulted * DEFAULT_PENALTY
+
+    if bnpl_defaulted > 0:
+        tier = 'basic'
+    elif credit_score >= PREMIUM_SCORE:
+        tier = 'premium'
+    elif credit_score >= VERIFIED_SCORE:
+        tier = 'verified'
+    else:
+        tier = 'basic'
+
+    return {
+        'user_id': user_id,
+        'tier': tier,
+        'credit_score': credit_score,
+        'is_diaspora': diaspora,
+        'order_count': int(facts['order_count']),
+        'paid_count': paid_count,
+        'bnpl_completed': bnpl_completed,
+        'bnpl_defaulted': bnpl_defaulted,
+        'eligible': bnpl_defaulted == 0,  # Not eligible if has defaults
+        'reason': 'Outstanding defaulted payment' if bnpl_defaulted > 0 else None
+    }
+
+
+def compute(db, user_id):
+    """Profile straight from the database (no cache), or None for an unknown user."""
+    facts = db.execute(PROFILE_SQL, (user_id, user_id, user_id)).fetchone()
+    return score(user_id, facts) if facts else None
+
+
+def get_profile(db, user_id):
+    """
+    A user's cached profile, recomputed on a miss (caller commits the refreshed
+    row with its transaction). Returns None for an unknown user.
+    """
+    fresh_after = _timestamp(datetime.utcnow() - timedelta(seconds=PROFILE_TTL_SECONDS))
+    row = db.execute('''
+        SELECT profile FROM credit_profiles WHERE user_id = ? AND computed_at > ?
+    ''', (user_id, fresh_after)).fetchone()
+    if row:
+        _count('hits')
+        return json.loads(row['profile'])
+
+    _count('misses')
+    profile = compute(db, user_id)
+    if profile is None:
+        return None
+    # A recompute racing an invalidation can leave a stale row, but only until the TTL
+    store(db, [profile])
+    return profile
+
+
+def store(db, profiles):
+    """Cache computed profiles, one statement for the lot (caller commits)."""
+    computed_at = _timestamp()
+    db.executemany('''
+        INSERT INTO credit_profiles (user_id, profile, computed_at) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET profile = excluded.profile, computed_at = excluded.computed_at
+    ''', [(profile['user_id'], json.dumps(profile), computed_at) for profile in profiles])
+
+
+def invalidate(db, user_id):
+    """Drop a user's cached profile, inside the transaction that changed their history."""
+    db.execute('DELETE FROM credit_profiles WHERE user_id = ?', (user_id,))
+    _count('invalidations')
+
+
+def invalidate_many(db, user_ids):
+    """invalidate() for a batch of users, in one statement."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    db.execute(f'DELETE FROM credit_profiles WHERE user_id IN ({", ".join("?" * len(user_ids))})', user_ids)
+    with _counters_lock:
+        _counters['invalidations'] += len(user_ids)
+
+
+def stats(db):
+    """Cached profiles and this process's hit/miss counters (for /api/metrics)."""
+    cached = db.execute('SELECT COUNT(*) AS n FROM credit_profiles').fetchone()['n']
+    with _counters_lock:
+        process = dict(_counters)
+    lookups = process['hits'] + process['misses']
+    return {
+        'cached': cached,
+        'ttl_s': PROFILE_TTL_SECONDS,
+        'hit_rate': round(process['hits'] / lookups, 3) if lookups else None,
+        'this_process': process,
+    }
@@ -0,0 +1,161 @@
+"""
+Batch Credit Scoring - Portfolio-wide BNPL re-tiering.
+Walks users in id order CHUNK_SIZE at a time: one grouped query per chunk pulls each
+user's features, NumPy scores the whole chunk with credit_profile's formula, and the
+profiles are written back to credit_profiles in one bulk upsert. The worker queues
+rescore_all() nightly, so online eligibility checks read a precomputed tier.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import credit_profile
+import jobs
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+# Hour (UTC) after which the worker queues the nightly rescore
+RESCORE_HOUR_UTC = int(os.environ.get('CREDIT_RESCORE_HOUR', 2))
+
+TIERS = np.array(['basic', 'verified', 'premium'])
+
+_DIASPORA_SQL = ' OR '.join(
+    ["LOWER(COALESCE(u.location, '')) LIKE ?"] * len(credit_profile.DIASPORA_LOCATIONS)
+    + ["COALESCE(u.phone, '') LIKE ?"] * len(credit_profile.DIASPORA_PHONE_PREFIXES)
+)
+_DIASPORA_PATTERNS = ([f'%{word}%' for word in credit_profile.DIASPORA_LOCATIONS]
+                      + [f'{prefix}%' for prefix in credit_profile.DIASPORA_PHONE_PREFIXES])
+
+# Features for users with lo < id <= hi, aggregated per user
+FEATURES_SQL = f'''
+    SELECT u.user_id,
+           CASE WHEN {_DIASPORA_SQL} THEN 1 ELSE 0 END AS is_diaspora,
+           COALESCE(o.order_count, 0) AS order_count,
+           COALESCE(o.paid_count, 0) AS paid_count,
+           COALESCE(b.completed_count, 0) AS bnpl_completed,
+           COALESCE(b.defaulted_count, 0) AS bnpl_defaulted
+    FROM users u
+    LEFT JOIN (
+        SELECT o.user_id, COUNT(*) AS order_count,
+               SUM(CASE WHEN o.payment_status = 'paid' THEN 1 ELSE 0 END) AS paid_count
+        FROM orders o JOIN users ou ON ou.user_id = o.user_id
+        WHERE ou.id > ? AND ou.id <= ?
+        GROUP BY o.user_id
+    ) o ON o.user_id = u.user_id
+    LEFT JOIN (
+        SELECT ba.user_id,
+               SUM(CASE WHEN ba.status = 'completed' THEN 1 ELSE 0 END) AS completed_count,
+               SUM(CASE WHEN ba.status = 'defaulted' THEN 1 ELSE 0 END) AS defaulted_count
+        FROM bnpl_agreements ba JOIN users bu ON bu.user_id = ba.user_id
+        WHERE bu.id > ? AND bu.id <= ?
+        GROUP BY ba.user_id
+    ) b ON b.user_id = u.user_id
+    WHERE u.id > ? AND u.id <= ?
+    ORDER BY u.id
+'''
+
+
+def score_arrays(paid_count, bnpl_completed, bnpl_defaulted, is_diaspora):
+    """credit_profile.score() over whole arrays. Returns (credit scores, tier indexes into TIERS)."""
+    scores = (credit_profile.BASE_SCORE
+              + np.minimum(paid_count * credit_profile.PAID_ORDER_POINTS, credit_profile.PAID_ORDER_CAP)
+              + np.minimum(bnpl_completed * credit_profile.COMPLETED_BNPL_POINTS,
+                           credit_profile.COMPLETED_BNPL_CAP)
+              + is_diaspora * credit_profile.DIASPORA_POINTS
+              - bnpl_defaulted * credit_profile.DEFAULT_PENALTY)
+    tiers = np.select([bnpl_defaulted > 0, scores >= credit_profile.PREMIUM_SCORE,
+                       scores >= credit_profile.VERIFIED_SCORE], [0, 2, 1], default=0)
+    return scores, tiers
+
+
+def _column(rows, name):
+    return np.fromiter((row[name] or 0 for row in rows), dtype=np.int64, count=len(rows))
+
+
+def score_rows(rows):
+    """Profiles (as credit_profile.score() builds them) for a chunk of FEATURES_SQL rows."""
+    paid, completed, defaulted = (_column(rows, 'paid_count'), _column(rows, 'bnpl_completed'),
+                                  _column(rows, 'bnpl_defaulted'))
+    diaspora = _column(rows, 'is_diaspora')
+    scores, tiers = score_arrays(paid, completed, defaulted, diaspora)
+
+    columns = zip(rows, TIERS[tiers].tolist(), scores.tolist(), diaspora.tolist(),
+                  paid.tolist(), completed.tolist(), defaulted.tolist())
+    return [{
+        'user_id': row['user_id'],
+        'tier': tier,
+        'credit_score': credit_score,
+        'is_diaspora': bool(is_diaspora),
+        'order_count': int(row['order_count']),
+        'paid_count': paid_count,
+        'bnpl_completed': bnpl_completed,
+        'bnpl_defaulted': bnpl_defaulted,
+        'eligible': bnpl_defaulted == 0,
+        'reason': 'Outstanding defaulted payment' if bnpl_defaulted > 0 else None
+    } for row, tier, credit_score, is_diaspora, paid_count, bnpl_completed, bnpl_defaulted in columns]
+
+
+def rescore_chunk(db, after_id, chunk_size=CHUNK_SIZE):
+    """
+    Score and store the next `chunk_size` users after users.id `after_id`, and commit.
+    Returns (last id scored, tier counts), or (None, {}) when no users are left.
+    """
+    hi = db.execute('''
+        SELECT MAX(id) AS hi FROM (SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?) chunk
+    ''', (after_id, chunk_size)).fetchone()['hi']
+    if hi is None:
+        return None, {}
+
+    # Clearing the chunk's cached rows first takes SQLite's writer lock, so no
+    # invalidating event can commit between reading the features and storing the scores
+    db.execute('''
+        DELETE FROM credit_profiles WHERE user_id IN (SELECT user_id FROM users WHERE id > ? AND id <= ?)
+    ''', (after_id, hi))
+    rows = db.execute(FEATURES_SQL, (*_DIASPORA_PATTERNS, after_id, hi, after_id, hi, after_id, hi)).fetchall()
+    profiles = score_rows(rows)
+    credit_profile.store(db, profiles)
+    db.commit()
+
+    tiers, counts = np.unique([profile['tier'] for profile in profiles], return_counts=True)
+    return hi, dict(zip(tiers.tolist(), counts.tolist()))
+
+
+@jobs.task(max_attempts=3, priority=jobs.PRIORITY_LOW)
+def rescore_all(db, chunk_size=CHUNK_SIZE):
+    """Rescore every user, committing chunk by chunk. Returns a summary."""
+    start = time.perf_counter()
+    after_id, users, tiers = 0, 0, {}
+    while True:
+        last_id, counts = rescore_chunk(db, after_id, chunk_size)
+        if last_id is None:
+            break
+        after_id = last_id
+        for tier, count in counts.items():
+            tiers[tier] = tiers.get(tier, 0) + count
+            users += count
+
+    seconds = time.perf_counter() - start
+    summary = {'users': users, 'tiers': tiers, 'seconds': round(seconds, 2),
+               'users_per_second': round(users / seconds) if seconds else 0}
+    logger.info('Rescored credit profiles: %s', summary)
+    return summary
+
+
+def schedule_nightly(db, now=None):
+    """
+    Queue today's rescore once RESCORE_HOUR_UTC has passed (called from worker
+    housekeeping). The job's per-day dedupe key means every worker process can call
+    this and still only one rescore is queued a day. Commits. Returns the job id or None.
+    """
+    now = now or datetime.utcnow()
+    if now.hour < RESCORE_HOUR_UTC:
+        return None
+    job_id = rescore_all.enqueue(db, dedupe_key=f'{rescore_all.name}:{now:%Y-%m-%d}')
+    db.commit()
+    return job_id
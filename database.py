@@ -1,90 +1,297 @@
 """
 Database Configuration - Supports both SQLite and PostgreSQL
+Connections are pooled per worker process and handed out once per request via Flask g.
 """
 import os
 import sys
+import time
+import threading
+import uuid
+from contextlib import contextmanager
+
+from flask import g, has_app_context
 
 # Detect database type from environment
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Pool sizing (per gunicorn worker process)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+
+# Rows sent per round trip by executemany() on PostgreSQL
+EXECUTEMANY_PAGE_SIZE = 100
+
+# Rows fetched per round trip by iterate()
+ITERATE_BATCH_SIZE = int(os.environ.get('DB_ITERATE_BATCH_SIZE', 100))
+
 if DATABASE_URL and DATABASE_URL.startswith('postgres'):
     # PostgreSQL configuration
     DB_TYPE = 'postgresql'
-    
+
     # Fix Heroku postgres:// to postgresql://
     if DATABASE_URL.startswith('postgres://'):
         DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
-    
+
     try:
         import psycopg2
-        from psycopg2.extras import RealDictCursor
+        from psycopg2.extras import RealDictCursor, execute_batch
     except ImportError:
         print("Error: psycopg2 not installed. Run: pip install psycopg2-binary")
         sys.exit(1)
-    
-    def get_db():
-        """Get PostgreSQL database connection."""
+
+    def connect():
+        """Open a new PostgreSQL connection."""
         conn = psycopg2.connect(DATABASE_URL, sslmode='require' if 'amazonaws.com' in DATABASE_URL or 'heroku' in DATABASE_URL else 'prefer')
         conn.cursor_factory = RealDictCursor
         return conn
-    
+
     def dict_factory(cursor, row):
         """Convert PostgreSQL row to dict."""
         return dict(row)
-    
+
 else:
     # SQLite configuration (default for development)
     DB_TYPE = 'sqlite'
-    DATABASE_FILE = 'zimclassifieds.db'
-    
+    if DATABASE_URL and DATABASE_URL.startswith('sqlite:///'):
+        DATABASE_FILE = DATABASE_URL[len('sqlite:///'):]
+    else:
+        DATABASE_FILE = 'zimclassifieds.db'
+
     import sqlite3
-    
-    def get_db():
-        """Get SQLite database connection."""
-        db = sqlite3.connect(DATABASE_FILE)
+
+    def connect():
+        """Open a new SQLite connection."""
+        # Pooled connections move between threads, but only one holds a connection at a time
+        db = sqlite3.connect(DATABASE_FILE, timeout=30, check_same_thread=False)
         db.row_factory = sqlite3.Row
+        # WAL lets readers proceed while a request is writing
+        db.execute('PRAGMA journal_mode=WAL')
         return db
-    
+
     def dict_factory(cursor, row):
         """Convert SQLite row to dict."""
         return {key: row[key] for key in row.keys()}
 
 
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the timeout."""
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of database connections for one worker process.
+
+    Connections are opened lazily, so a pool created before gunicorn forks
+    does not share sockets/file handles with its children.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._created = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'discarded': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds if all are in use."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: forget the parent's connections
+                self._reset()
+
+            wait_start = None
+            while not self._idle and self._created >= self.size:
+                if wait_start is None:
+                    wait_start = time.monotonic()
+                    self._stats['waits'] += 1
+                remaining = self.timeout - (time.monotonic() - wait_start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+                self._lock.wait(remaining)
+
+            if wait_start is not None:
+                waited = time.monotonic() - wait_start
+                self._stats['total_wait'] += waited
+                self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+
+            self._stats['checkouts'] += 1
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        try:
+            return connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            conn.rollback()
+            broken = False
+        except Exception:
+            broken = True
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if broken:
+                self._created -= 1
+                self._stats['discarded'] += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle),
+                'in_use': self._created - len(self._idle),
+            })
+        total_wait = stats.pop('total_wait')
+        stats['avg_wait_ms'] = round(total_wait / stats['waits'] * 1000, 2) if stats['waits'] else 0
+        stats['max_wait_ms'] = round(stats.pop('max_wait') * 1000, 2)
+        return stats
+
+
+class PooledConnection:
+    """
+    Handle on a pooled connection.
+
+    close() is a no-op; the connection goes back to the pool when the
+    request (or `connection()` block) ends. execute() accepts '?' placeholders
+    on both backends.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, query, params=()):
+        if DB_TYPE == 'postgresql':
+            cursor = self._conn.cursor()
+            cursor.execute(query.replace('?', '%s'), params)
+            return cursor
+        return self._conn.execute(query, params)
+
+    def executemany(self, query, seq_of_params):
+        if DB_TYPE == 'postgresql':
+            # psycopg2's executemany is one round trip per row; batch them instead
+            cursor = self._conn.cursor()
+            execute_batch(cursor, query.replace('?', '%s'), seq_of_params, page_size=EXECUTEMANY_PAGE_SIZE)
+            return cursor
+        return self._conn.executemany(query, seq_of_params)
+
+    def iterate(self, query, params=(), batch_size=ITERATE_BATCH_SIZE):
+        """
+        Yield a query's rows, fetching batch_size at a time, so the result is never
+        held whole. Runs when first advanced. On PostgreSQL this is a server-side
+        (named) cursor, which lives in the connection's current transaction.
+        """
+        if DB_TYPE == 'postgresql':
+            cursor = self._conn.cursor(name=f'iterate_{uuid.uuid4().hex}')
+            cursor.execute(query.replace('?', '%s'), params)
+        else:
+            cursor = self._conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+pool = ConnectionPool()
+
+
+def get_db():
+    """
+    Get a database connection.
+
+    Inside a request this is the request's pooled connection (checked out on
+    first use, returned on teardown). Outside a request it is a private
+    connection the caller must close.
+    """
+    if has_app_context():
+        if 'db' not in g:
+            g.db = PooledConnection(pool.acquire())
+        return g.db
+    return connect()
+
+
+def close_db(exc=None):
+    """Return the request's connection to the pool (teardown handler)."""
+    db = g.pop('db', None)
+    if db is not None:
+        pool.release(db._conn)
+
+
+@contextmanager
+def connection():
+    """Check out a pooled connection for work outside a request (scripts, workers)."""
+    conn = pool.acquire()
+    try:
+        yield PooledConnection(conn)
+    finally:
+        pool.release(conn)
+
+
+def pool_stats():
+    """Connection pool counters for this worker process."""
+    return pool.stats()
+
+
+def init_app(app):
+    """Register the pool's request teardown on the Flask app."""
+    app.teardown_appcontext(close_db)
+
+
 def execute_query(query, params=None):
     """
     Execute a query and return results.
     Handles differences between SQLite and PostgreSQL.
     """
-    db = get_db()
-    
-    if DB_TYPE == 'postgresql':
-        # PostgreSQL uses %s for placeholders
-        query = query.replace('?', '%s')
-        cursor = db.cursor()
-        cursor.execute(query, params or ())
-        
-        if query.strip().upper().startswith('SELECT'):
-            results = cursor.fetchall()
-        else:
-            db.commit()
-            results = None
-        
-        cursor.close()
-        db.close()
-        return results
-    else:
-        # SQLite uses ?
-        cursor = db.cursor()
-        cursor.execute(query, params or ())
-        
+    with connection() as db:
+        cursor = db.execute(query, params or ())
+
         if query.strip().upper().startswith('SELECT'):
             results = cursor.fetchall()
         else:
             db.commit()
             results = None
-        
+
         cursor.close()
-        db.close()
         return results
 
 
@@ -94,4 +301,5 @@ def get_placeholder():
 
 
 # Export configuration
-__all__ = ['get_db', 'DB_TYPE', 'DATABASE_URL', 'execute_query', 'get_placeholder']
+__all__ = ['get_db', 'connection', 'pool_stats', 'init_app', 'DB_TYPE', 'DATABASE_URL',
+           'execute_query', 'get_placeholder']
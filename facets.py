@@ -0,0 +1,196 @@
+"""
+Browse Facets - Active product counts per category and price bucket.
+product_facets holds one row per (category, price bucket) with the number of active
+products and of those in stock. It is updated incrementally in the same transaction
+as the product writes that can move a product between rows (create, edit, delete,
+stock synced from inventory): snapshot() the products before the write, record()
+after it. Browse pages read the whole table (categories x buckets rows) and cross-
+filter it in Python, so the counts cost the same whatever the catalogue size.
+Search results are counted with one GROUP BY over the matches (search_rows()),
+which callers cache per search.
+"""
+
+from collections import defaultdict
+
+from database import DB_TYPE
+
+# Upper bounds (ZWL) of the price buckets; the last bucket is open-ended.
+# Changing these needs scripts/rebuild_facets.py.
+PRICE_BOUNDS = (50, 100, 250, 500, 1000)
+
+# Products per snapshot/record statement
+BATCH_SIZE = 500
+
+
+def bucket(price):
+    """Price bucket index of a price."""
+    for index, bound in enumerate(PRICE_BOUNDS):
+        if price < bound:
+            return index
+    return len(PRICE_BOUNDS)
+
+
+def bucket_range(index):
+    """(min, max) of a price bucket; max is None for the last."""
+    low = PRICE_BOUNDS[index - 1] if index > 0 else 0
+    high = PRICE_BOUNDS[index] if index < len(PRICE_BOUNDS) else None
+    return low, high
+
+
+def bucket_label(index):
+    low, high = bucket_range(index)
+    if high is None:
+        return f'ZWL {low:,}+'
+    if not low:
+        return f'Under ZWL {high:,}'
+    return f'ZWL {low:,} - {high:,}'
+
+
+def parse_bucket(value):
+    """Bucket index from a query string value, or None if missing or invalid."""
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index <= len(PRICE_BOUNDS) else None
+
+
+def bucket_sql(column='p.price'):
+    """SQL CASE giving the price bucket of `column`."""
+    whens = ' '.join(f'WHEN {column} < {bound} THEN {index}' for index, bound in enumerate(PRICE_BOUNDS))
+    return f'CASE {whens} ELSE {len(PRICE_BOUNDS)} END'
+
+
+def price_condition(index, column='p.price'):
+    """WHERE fragment and params restricting `column` to a price bucket."""
+    low, high = bucket_range(index)
+    if high is None:
+        return f'{column} >= ?', [low]
+    return f'{column} >= ? AND {column} < ?', [low, high]
+
+
+def init_facets(db):
+    """Backfill the summary table the first time it is found empty."""
+    if db.execute('SELECT 1 FROM product_facets LIMIT 1').fetchone():
+        return
+    rebuild(db)
+
+
+def _state(row):
+    """(category, bucket, in_stock) a product counts towards, or None if it is not listed."""
+    if row['status'] != 'active':
+        return None
+    return row['category'], bucket(row['price']), 1 if (row['stock_quantity'] or 0) > 0 else 0
+
+
+def _states(db, product_ids, lock=False):
+    ids = list(product_ids)
+    states = {}
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        # Lock the rows on PostgreSQL so a concurrent write can't slip between snapshot and record
+        rows = db.execute(f'''
+            SELECT id, category, price, status, stock_quantity FROM products
+            WHERE id IN ({', '.join('?' for _ in batch)})
+            {'FOR UPDATE' if lock and DB_TYPE == 'postgresql' else ''}
+        ''', batch).fetchall()
+        states.update((row['id'], _state(row)) for row in rows)
+    return states
+
+
+def snapshot(db, product_ids):
+    """Facet state of products (internal ids) about to be written; pass it to record() afterwards."""
+    return _states(db, product_ids, lock=True)
+
+
+def record(db, before, product_ids=()):
+    """
+    Apply the count changes of a write, in the caller's transaction. `before` is
+    snapshot() of the products written (empty for new ones, listed in product_ids);
+    products gone from the table count as deleted.
+    """
+    ids = set(before) | set(product_ids)
+    after = _states(db, ids)
+    deltas = defaultdict(lambda: [0, 0])
+    for product_id in ids:
+        old, new = before.get(product_id), after.get(product_id)
+        if old == new:
+            continue
+        if old:
+            deltas[old[:2]][0] -= 1
+            deltas[old[:2]][1] -= old[2]
+        if new:
+            deltas[new[:2]][0] += 1
+            deltas[new[:2]][1] += new[2]
+    changes = [(category, index, count, in_stock)
+               for (category, index), (count, in_stock) in deltas.items() if count or in_stock]
+    if changes:
+        db.executemany('''
+            INSERT INTO product_facets (category, price_bucket, product_count, in_stock_count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (category, price_bucket) DO UPDATE SET
+                product_count = product_facets.product_count + excluded.product_count,
+                in_stock_count = product_facets.in_stock_count + excluded.in_stock_count,
+                updated_at = CURRENT_TIMESTAMP
+        ''', changes)
+    return len(changes)
+
+
+def rebuild(db):
+    """Recompute the summary table from products. Returns the number of rows."""
+    db.execute('DELETE FROM product_facets')
+    rows = db.execute(f'''
+        INSERT INTO product_facets (category, price_bucket, product_count, in_stock_count)
+        SELECT p.category, {bucket_sql()}, COUNT(*), SUM(CASE WHEN p.stock_quantity > 0 THEN 1 ELSE 0 END)
+        FROM products p
+        WHERE p.status = 'active'
+        GROUP BY p.category, {bucket_sql()}
+        RETURNING category
+    ''').fetchall()
+    db.commit()
+    return len(rows)
+
+
+def table_rows(db):
+    """Every non-empty summary row, for summarize()."""
+    return [dict(row) for row in db.execute('''
+        SELECT category, price_bucket, product_count, in_stock_count
+        FROM product_facets WHERE product_count > 0
+    ''').fetchall()]
+
+
+def search_rows(db, search_join, params):
+    """Rows shaped like table_rows() for the active products a full-text join matches."""
+    return [dict(row) for row in db.execute(f'''
+        SELECT p.category, {bucket_sql()} AS price_bucket, COUNT(*) AS product_count,
+               SUM(CASE WHEN p.stock_quantity > 0 THEN 1 ELSE 0 END) AS in_stock_count
+        FROM products p
+        {search_join}
+        WHERE p.status = 'active'
+        GROUP BY p.category, {bucket_sql()}
+    ''', params).fetchall()]
+
+
+def summarize(rows, category=None, price_bucket=None):
+    """
+    Facet counts for a browse page: categories counted within the selected price
+    bucket, price buckets within the selected category, and the total matching both.
+    """
+    categories, prices = defaultdict(int), defaultdict(int)
+    total = 0
+    for row in rows:
+        in_category = not category or row['category'] == category
+        in_bucket = price_bucket is None or row['price_bucket'] == price_bucket
+        if in_bucket:
+            categories[row['category']] += row['product_count']
+        if in_category:
+            prices[row['price_bucket']] += row['product_count']
+        if in_category and in_bucket:
+            total += row['product_count']
+    return {
+        'total': total,
+        'categories': [{'name': name, 'count': count} for name, count in sorted(categories.items()) if count],
+        'prices': [{'bucket': index, 'label': bucket_label(index), 'min': bucket_range(index)[0],
+                    'max': bucket_range(index)[1], 'count': prices.get(index, 0)}
+                   for index in range(len(PRICE_BOUNDS) + 1)],
+    }
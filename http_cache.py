@@ -0,0 +1,144 @@
+"""
+HTTP Caching - ETags, conditional GET and Cache-Control for public pages, plus
+cached rendered fragments.
+@conditional(version) computes an ETag from a cheap version of what the page shows
+(row timestamps and counters, or page data already in cache.py) and answers a
+matching If-None-Match with 304 before the view runs its queries or renders.
+Anonymous responses are public for PUBLIC_MAX_AGE seconds; logged-in ones (whose
+navigation differs) are private and revalidated on every request.
+Templates wrap session-independent blocks in {% call cached_fragment(key) %} so a
+product grid or review list is rendered once per key, not once per request.
+"""
+
+import hashlib
+import os
+import threading
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from markupsafe import Markup
+
+import assets
+import cache
+
+# Seconds browsers and proxies may reuse an anonymous page without asking
+PUBLIC_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+
+# Pages that only change with a deploy (about, terms, privacy)
+STATIC_PAGE_MAX_AGE = int(os.environ.get('HTTP_CACHE_STATIC_MAX_AGE', 3600))
+
+# Session keys that change what a page renders (navigation, review form)
+AUDIENCE_KEYS = ('user_id', 'seller_id', 'transporter_id')
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+_counters = {'not_modified': 0, 'full': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key):
+    with _counters_lock:
+        _counters[key] += 1
+
+
+def _templates_digest():
+    """Digest of every template, so a deploy that changes markup changes every ETag."""
+    digest = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(TEMPLATES_DIR)):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()
+
+
+TEMPLATES_DIGEST = _templates_digest()
+
+
+def audience():
+    """Who the page is rendered for: () when anonymous."""
+    return tuple(session.get(key) for key in AUDIENCE_KEYS if session.get(key))
+
+
+def etag(*parts):
+    """Strong ETag over the templates and static assets, the audience, the URL and the page's version parts."""
+    raw = repr((TEMPLATES_DIGEST, assets.version(), audience(), request.full_path, parts))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def version_key(data):
+    """Short digest of page data, for keying fragments rendered from it."""
+    return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()[:16]
+
+
+def set_cache_headers(response, max_age=PUBLIC_MAX_AGE):
+    if audience():
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional(version, max_age=PUBLIC_MAX_AGE, not_modified=None):
+    """
+    Decorator for GET views. version(*args, **kwargs) returns what the page's content
+    depends on (hashable parts), or None to skip caching (e.g. not found).
+    not_modified(*args, **kwargs) runs instead of the view when answering 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            parts = version(*args, **kwargs)
+            if parts is None:
+                return view(*args, **kwargs)
+
+            tag = etag(parts)
+            if request.if_none_match.contains_weak(tag):
+                if not_modified:
+                    not_modified(*args, **kwargs)
+                _count('not_modified')
+                response = current_app.response_class(status=304)
+                response.set_etag(tag)
+                return set_cache_headers(response, max_age)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            _count('full')
+            response.set_etag(tag)
+            return set_cache_headers(response, max_age)
+        return wrapped
+    return decorator
+
+
+def static_page(view):
+    """conditional() for pages that only change with their templates."""
+    return conditional(lambda *args, **kwargs: (), max_age=STATIC_PAGE_MAX_AGE)(view)
+
+
+def cached_fragment(key, tags=(), ttl=cache.DEFAULT_TTL, caller=None):
+    """
+    Jinja call block: {% call cached_fragment('grid:' ~ grid_key) %}...{% endcall %}
+    renders the body once per key (key None: always render). The body must not
+    depend on the session; put every version it depends on in the key (e.g.
+    version_key() of its data) or in tags that writers invalidate.
+    """
+    if key is None:
+        return caller()
+    return Markup(cache.get_or_set(f'fragment:{key}', lambda: str(caller()), ttl=ttl, tags=tuple(tags)))
+
+
+def stats():
+    """This process's conditional GET counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    answered = process['not_modified'] + process['full']
+    return {
+        'not_modified_rate': round(process['not_modified'] / answered, 3) if answered else None,
+        'this_process': process,
+    }
+
+
+def init_app(app):
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
@@ -0,0 +1,288 @@
+"""
+Image Pipeline - Resized, metadata-free variants of uploaded product photos.
+Uploads are stored by uploads.py, which drops EXIF/XMP (strip_metadata()) before the
+original is hashed and published, and process_image() is queued in the same transaction
+as the product_images row; a worker (worker.py) then renders every SIZES bound as WebP
+and JPEG under static/uploads/variants, recording them on the image's blob and in
+product_images.variants (JSON). Templates call picture() for a <picture> with srcset,
+which serves the original until the variants exist.
+"""
+
+import json
+import logging
+import io
+import os
+import shutil
+import threading
+import time
+
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps
+
+from database import DB_TYPE
+import cache
+import jobs
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = 'static/uploads'
+VARIANT_FOLDER = 'variants'
+
+# Longest side (px) of each variant, smallest first
+SIZES = {'thumb': 160, 'card': 640, 'detail': 1280}
+
+# Format -> (file extension, Pillow save options); metadata is never passed on
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# How wide each size is laid out, for the browser's srcset choice
+LAYOUT_SIZES = {
+    'thumb': '80px',
+    'card': '(max-width: 576px) 50vw, (max-width: 992px) 33vw, 300px',
+    'detail': '(max-width: 768px) 100vw, 50vw',
+}
+
+# Primary (else first) image of each product `p` in a listing query
+PRIMARY_IMAGE_COLUMNS = 'pi.image_path, pi.variants AS image_variants'
+PRIMARY_IMAGE_JOIN = '''
+    LEFT JOIN product_images pi ON pi.id = (
+        SELECT id FROM product_images
+        WHERE product_id = p.id
+        ORDER BY is_primary DESC, display_order, id
+        LIMIT 1
+    )
+'''
+
+ORIENTATION_TAG = 0x0112
+
+# Originals re-saved without metadata (when they cannot just drop it), by Pillow format
+STRIP_OPTIONS = {
+    'JPEG': {'quality': 95},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 95},
+}
+
+_counters = {'processed': 0, 'failed': 0, 'process_s': 0.0,
+             'original_bytes': 0, 'variant_bytes': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def init_image_pipeline(db):
+    """Add product_images.variants (JSON, NULL until processed)."""
+    if DB_TYPE == 'postgresql':
+        db.execute('ALTER TABLE product_images ADD COLUMN IF NOT EXISTS variants TEXT')
+    else:
+        columns = [row['name'] for row in db.execute('PRAGMA table_info(product_images)').fetchall()]
+        if 'variants' not in columns:
+            db.execute('ALTER TABLE product_images ADD COLUMN variants TEXT')
+    db.commit()
+
+
+def _static_path(relative_path):
+    return os.path.join('static', relative_path)
+
+
+def _copy_jpeg_without_metadata(source, target):
+    """Copy a JPEG minus its APP1 (EXIF/XMP) and APP13 (IPTC) segments; the image data is copied untouched."""
+    target.write(source.read(2))
+    while True:
+        marker = source.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] == 0xDA:
+            target.write(marker)
+            break
+        segment = source.read(int.from_bytes(marker[2:4], 'big') - 2)
+        if marker[1] not in (0xE1, 0xED):
+            target.write(marker + segment)
+    shutil.copyfileobj(source, target)
+
+
+def strip_metadata(path, target):
+    """
+    Write the image at `path` to the file object `target` without its EXIF/XMP (GPS,
+    camera serials); returns False, writing nothing, if it carries none. Upright JPEGs
+    lose just those segments; anything else is re-saved turned upright.
+    """
+    with Image.open(path) as image:
+        options = STRIP_OPTIONS.get(image.format)
+        exif = image.getexif()
+        if options is None or not (image.info.get('exif') or image.info.get('xmp') or exif):
+            return False
+        if image.format == 'JPEG' and exif.get(ORIENTATION_TAG, 1) == 1:
+            with open(path, 'rb') as original:
+                _copy_jpeg_without_metadata(original, target)
+            return True
+        clean = ImageOps.exif_transpose(image)
+        clean.info = {}
+        # Saved to memory first: target only sees sequential writes
+        buffer = io.BytesIO()
+        clean.save(buffer, format=image.format, **options)
+    target.write(buffer.getbuffer())
+    return True
+
+
+def _flatten(image):
+    """Upright RGB copy; transparency goes onto white (JPEG has no alpha)."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(image_path):
+    """
+    Write the variants of an original. Returns the variants dict,
+    {size: {'width', 'height', 'webp', 'jpeg'}}, with paths relative to static/.
+    Sizes the original is too small for share the largest rendering instead of upscaling.
+    """
+    source = _static_path(image_path)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    folder = os.path.join(UPLOAD_FOLDER, VARIANT_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    with Image.open(source) as image:
+        # JPEG decodes at a fraction of full size when that still covers the largest variant
+        largest = max(SIZES.values())
+        image.draft('RGB', (largest, largest))
+        picture = _flatten(image)
+
+    variants, written, previous = {}, 0, None
+    # Largest first, each size resized from the previous one
+    for size, bound in sorted(SIZES.items(), key=lambda item: -item[1]):
+        if picture.width > bound or picture.height > bound:
+            picture = picture.copy()
+            picture.thumbnail((bound, bound), Image.LANCZOS)
+        elif previous is not None:
+            variants[size] = previous
+            continue
+        variant = {'width': picture.width, 'height': picture.height}
+        for fmt, (extension, options) in FORMATS.items():
+            relative = f"uploads/{VARIANT_FOLDER}/{stem}-{size}.{extension}"
+            picture.save(_static_path(relative), **options)
+            written += os.path.getsize(_static_path(relative))
+            variant[fmt] = relative
+        variants[size] = previous = variant
+
+    _count('original_bytes', os.path.getsize(source))
+    _count('variant_bytes', written)
+    return {size: variants[size] for size in SIZES}
+
+
+def variant_files(variants):
+    """Every file path (relative to static/) listed in a variants value (dict or JSON)."""
+    if isinstance(variants, str):
+        variants = json.loads(variants)
+    return sorted({variant[fmt] for variant in (variants or {}).values() for fmt in FORMATS})
+
+
+@jobs.task(max_attempts=3, priority=jobs.PRIORITY_LOW)
+def process_image(db, image_id):
+    """
+    Record a product image's variants, rendering them unless its blob already has
+    them (the same photo on another listing). Skips deleted or processed images.
+    """
+    image = db.execute('''
+        SELECT pi.image_path, pi.variants, pi.content_hash, b.variants AS blob_variants,
+               p.id AS product_pk, s.store_slug
+        FROM product_images pi
+        JOIN products p ON pi.product_id = p.id
+        JOIN sellers s ON p.seller_id = s.id
+        LEFT JOIN image_blobs b ON b.content_hash = pi.content_hash
+        WHERE pi.id = ?
+    ''', (image_id,)).fetchone()
+    if not image or image['variants']:
+        return None
+
+    variants = image['blob_variants']
+    if not variants:
+        if not os.path.exists(_static_path(image['image_path'])):
+            logger.warning('Product image %s has no file at %s', image_id, image['image_path'])
+            return None
+        start = time.perf_counter()
+        try:
+            variants = json.dumps(render_variants(image['image_path']))
+        except Exception:
+            _count('failed')
+            raise
+        _count('processed')
+        _count('process_s', time.perf_counter() - start)
+        if image['content_hash']:
+            db.execute('UPDATE image_blobs SET variants = ? WHERE content_hash = ?', (variants, image['content_hash']))
+
+    db.execute('UPDATE product_images SET variants = ? WHERE id = ?', (variants, image_id))
+    # New image URLs change the product's ETag and cached listings
+    db.execute('UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (image['product_pk'],))
+    db.commit()
+    cache.invalidate('products', f"store:{image['store_slug']}")
+    return {size: variant['width'] for size, variant in json.loads(variants).items()}
+
+
+def _srcset(variants, fmt):
+    """'url 160w, url 480w, ...' with one entry per distinct width."""
+    entries = {}
+    for variant in variants.values():
+        entries.setdefault(variant['width'], f"/static/{variant[fmt]} {variant['width']}w")
+    return ', '.join(entries[width] for width in sorted(entries))
+
+
+def picture(image_path, variants=None, size='card', alt='', **attrs):
+    """
+    <picture> for a product image: WebP and JPEG srcsets of its variants, or the
+    original while they are still being made. Extra keyword arguments become <img>
+    attributes (class_ for class). Used in templates as a global.
+    """
+    if not image_path:
+        return Markup('')
+    if isinstance(variants, str):
+        variants = json.loads(variants)
+    attrs = {key.rstrip('_').replace('_', '-'): value for key, value in attrs.items()}
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = ''.join(f' {key}="{escape(value)}"' for key, value in attrs.items())
+
+    if not variants:
+        return Markup(f'<img src="/static/{escape(image_path)}" alt="{escape(alt)}"{extra}>')
+
+    chosen = variants[size]
+    layout = LAYOUT_SIZES[size]
+    return Markup(
+        f'<picture>'
+        f'<source type="image/webp" srcset="{escape(_srcset(variants, "webp"))}" sizes="{layout}">'
+        f'<img src="/static/{escape(chosen["jpeg"])}" srcset="{escape(_srcset(variants, "jpeg"))}" '
+        f'sizes="{layout}" width="{chosen["width"]}" height="{chosen["height"]}" alt="{escape(alt)}"{extra}>'
+        f'</picture>'
+    )
+
+
+def image_url(image_path, variants=None, size='detail', fmt='jpeg'):
+    """URL of one variant (or of the original until it is processed)."""
+    if isinstance(variants, str):
+        variants = json.loads(variants)
+    if not variants:
+        return f"/static/{image_path}"
+    return f"/static/{variants[size][fmt]}"
+
+
+def stats():
+    """This process's processing counters (for /api/metrics; images are processed in worker.py)."""
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'sizes': SIZES,
+        'this_process': {key: round(value, 3) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
+
+
+def init_app(app):
+    app.jinja_env.globals['picture'] = picture
+    app.jinja_env.globals['image_url'] = image_url
@@ -0,0 +1,224 @@
+"""
+Inventory Reservations - Contention-safe stock holds for checkout.
+Every stock change is a single compare-and-set UPDATE per batch of lines, so concurrent
+checkouts can never reserve more than quantity_available - quantity_reserved.
+Holds expire back into stock after a TTL unless committed (paid) or released.
+"""
+
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import facets
+
+# Minutes a checkout may hold stock before it returns to the pool
+HOLD_MINUTES = int(os.getenv('INVENTORY_HOLD_MINUTES', 30))
+
+# Products per compare-and-set statement (keeps bound parameters well under SQLite's limit)
+BATCH_SIZE = 200
+
+# Reservation lifecycle
+HELD, COMMITTED, RELEASED, EXPIRED = 'held', 'committed', 'released', 'expired'
+
+
+class InsufficientStock(Exception):
+    """Raised by reserve(); the caller must roll back its transaction."""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Insufficient stock for products {sorted(product_ids)}')
+        self.product_ids = product_ids
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _totals(lines):
+    """Sum quantities per product from (product_id, quantity) pairs."""
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        totals[product_id] += quantity
+    return list(totals.items())
+
+
+def _batches(items):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def _case(batch):
+    """CASE product_id WHEN ? THEN ? ... END with its parameters."""
+    sql = 'CASE product_id ' + ' '.join('WHEN ? THEN ?' for _ in batch) + ' END'
+    params = [value for pair in batch for value in pair]
+    return sql, params
+
+
+def _adjust(db, totals, available_delta, reserved_delta, guard=False):
+    """
+    Apply per-product deltas to inventory in one UPDATE per batch.
+
+    `available_delta` / `reserved_delta` are -1, 0 or +1 multipliers of each
+    product's quantity. With guard=True the row only changes if that quantity is
+    still unreserved. Returns the set of product ids actually updated.
+    """
+    updated = set()
+    for batch in _batches(totals):
+        case_sql, case_params = _case(batch)
+        ids = [product_id for product_id, _ in batch]
+        sets, params = [], []
+        if available_delta:
+            sets.append(f'quantity_available = quantity_available + {available_delta} * {case_sql}')
+            params += case_params
+        if reserved_delta:
+            sets.append(f'quantity_reserved = quantity_reserved + {reserved_delta} * {case_sql}')
+            params += case_params
+        sql = f'''
+            UPDATE inventory
+            SET {', '.join(sets)}
+            WHERE product_id IN ({', '.join('?' for _ in ids)})
+        '''
+        params += ids
+        if guard:
+            sql += f' AND quantity_available - quantity_reserved >= {case_sql}'
+            params += case_params
+        rows = db.execute(sql + ' RETURNING product_id', params).fetchall()
+        updated.update(row['product_id'] for row in rows)
+    return updated
+
+
+def _sync_stock(db, product_ids):
+    """Mirror on-hand stock onto products.stock_quantity for listings (and their facet counts)."""
+    ids = list(product_ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        before = facets.snapshot(db, batch)
+        db.execute(f'''
+            UPDATE products
+            SET stock_quantity = (SELECT quantity_available FROM inventory WHERE inventory.product_id = products.id)
+            WHERE id IN ({', '.join('?' for _ in batch)})
+        ''', batch)
+        facets.record(db, before)
+
+
+def available(db, product_id, user_id=None):
+    """
+    Unreserved units of one product (internal id). With `user_id`, that user's own
+    unattached holds count as available too: checkout replaces them (see
+    release_user_holds), so they must not stop the same shopper editing their cart.
+    """
+    row = db.execute('''
+        SELECT quantity_available - quantity_reserved AS unreserved FROM inventory WHERE product_id = ?
+    ''', (product_id,)).fetchone()
+    if not row:
+        return 0
+    if user_id is None:
+        return row['unreserved']
+    own = db.execute('''
+        SELECT COALESCE(SUM(quantity), 0) AS held FROM inventory_reservations
+        WHERE product_id = ? AND user_id = ? AND order_id IS NULL AND status = ?
+    ''', (product_id, user_id, HELD)).fetchone()
+    return row['unreserved'] + own['held']
+
+
+def _take(db, lines, order_id, user_id, status, expires_at, available_delta, reserved_delta):
+    totals = _totals(lines)
+    taken = _adjust(db, totals, available_delta, reserved_delta, guard=True)
+    short = {product_id for product_id, _ in totals} - taken
+    if short:
+        raise InsufficientStock(short)
+
+    reservations = [(str(uuid.uuid4()), product_id, quantity, order_id, user_id, status, expires_at)
+                    for product_id, quantity in totals]
+    db.executemany('''
+        INSERT INTO inventory_reservations
+        (reservation_id, product_id, quantity, order_id, user_id, status, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', reservations)
+    return [reservation[0] for reservation in reservations]
+
+
+def reserve(db, lines, order_id=None, user_id=None, hold_minutes=None):
+    """
+    Hold stock for (product_id, quantity) lines inside the caller's transaction.
+
+    All-or-nothing: raises InsufficientStock if any product is short, after which
+    the caller must roll back. Returns the new reservation ids.
+    """
+    # Lapsed holds go back into stock first so this checkout can use them
+    expire_reservations(db, commit=False)
+
+    expires_at = (datetime.utcnow() + timedelta(minutes=hold_minutes or HOLD_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
+    return _take(db, lines, order_id, user_id, HELD, expires_at, 0, +1)
+
+
+def sell(db, lines, order_id, user_id=None):
+    """
+    Take stock outright for an already-paid order: reserve() and commit_order()
+    in a single compare-and-set pass. Same all-or-nothing contract as reserve().
+    """
+    expire_reservations(db, commit=False)
+
+    ids = _take(db, lines, order_id, user_id, COMMITTED, _now(), -1, 0)
+    _sync_stock(db, {product_id for product_id, _ in lines})
+    return ids
+
+
+def _transition(db, where, params, status):
+    """Move matching reservations to `status`; returns their (product_id, quantity) totals."""
+    rows = db.execute(f'''
+        UPDATE inventory_reservations
+        SET status = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE {where}
+        RETURNING product_id, quantity
+    ''', (status, *params)).fetchall()
+    return _totals((row['product_id'], row['quantity']) for row in rows)
+
+
+def commit_order(db, order_id):
+    """
+    Payment confirmed: turn an order's holds into sold stock.
+
+    Holds that already expired are re-taken if the stock is still free. Returns
+    the product ids that could not be committed (oversold; needs manual follow-up).
+    """
+    held = _transition(db, 'order_id = ? AND status = ?', (order_id, HELD), COMMITTED)
+    _adjust(db, held, -1, -1)
+
+    lapsed = db.execute('''
+        SELECT product_id, quantity FROM inventory_reservations
+        WHERE order_id = ? AND status = ?
+    ''', (order_id, EXPIRED)).fetchall()
+    taken = _adjust(db, _totals((row['product_id'], row['quantity']) for row in lapsed), -1, 0, guard=True)
+    if taken:
+        db.execute(f'''
+            UPDATE inventory_reservations
+            SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = ? AND status = ? AND product_id IN ({', '.join('?' for _ in taken)})
+        ''', (COMMITTED, order_id, EXPIRED, *taken))
+
+    _sync_stock(db, [product_id for product_id, _ in held] + list(taken))
+    return [row['product_id'] for row in lapsed if row['product_id'] not in taken]
+
+
+def release_order(db, order_id):
+    """Payment failed or order cancelled: return an order's holds to stock."""
+    released = _transition(db, 'order_id = ? AND status = ?', (order_id, HELD), RELEASED)
+    _adjust(db, released, 0, -1)
+    return len(released)
+
+
+def release_user_holds(db, user_id):
+    """Drop a user's holds that are not yet attached to an order (abandoned checkout)."""
+    released = _transition(db, 'user_id = ? AND order_id IS NULL AND status = ?', (user_id, HELD), RELEASED)
+    _adjust(db, released, 0, -1)
+    return len(released)
+
+
+def expire_reservations(db, commit=True):
+    """Return holds past their TTL to stock. Returns the number of products affected."""
+    expired = _transition(db, 'status = ? AND expires_at < ?', (HELD, _now()), EXPIRED)
+    _adjust(db, expired, 0, -1)
+    if commit:
+        db.commit()
+    return len(expired)
@@ -0,0 +1,303 @@
+"""
+Background Jobs - A persistent job queue in the application database.
+Jobs are rows in the `jobs` table, enqueued inside the caller's transaction (so a
+job exists if and only if the work that needs it was committed) and claimed by
+`worker.py` with FOR UPDATE SKIP LOCKED on PostgreSQL, or under SQLite's single
+writer lock. Failed jobs are retried with exponential backoff; no external broker.
+
+    @jobs.task(max_attempts=5)
+    def send_receipt(db, order_id):
+        ...
+
+    send_receipt.enqueue(db, order_id)               # in the caller's transaction
+    send_receipt.enqueue(db, order_id, delay=3600)   # run in an hour
+    send_receipt.delay(order_id, priority=0)         # own connection, commits
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import DB_TYPE, connection
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# Lower runs first
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 100, 200
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Retry n waits BACKOFF_BASE * 2**(n-1) seconds (+/- 20% jitter), capped
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# Seconds an idle worker thread sleeps between polls
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+
+# A running job not finished after this long is assumed lost (worker killed) and re-queued
+LOCK_TIMEOUT_SECONDS = int(os.getenv('JOB_LOCK_TIMEOUT', 900))
+
+# Finished jobs older than this are deleted by purge()
+KEEP_DONE_DAYS = 7
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# name -> Task
+TASKS = {}
+
+# Claim the most urgent due job; SKIP LOCKED lets concurrent workers pass over each other's rows
+CLAIM_SQL = f'''
+    UPDATE jobs
+    SET status = ?, locked_by = ?, locked_at = ?, started_at = ?, attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE status = ? AND run_at <= ?
+        ORDER BY priority, run_at, id
+        LIMIT 1
+        {'FOR UPDATE SKIP LOCKED' if DB_TYPE == 'postgresql' else ''}
+    )
+    RETURNING id, task, args, attempts, max_attempts, run_at, started_at
+'''
+
+# Per-process counters, reported next to the queue depth in /api/metrics
+_counters = {'completed': 0, 'retried': 0, 'failed': 0, 'wait_ms_total': 0.0, 'run_ms_total': 0.0}
+_counters_lock = threading.Lock()
+
+
+def _timestamp(moment=None):
+    return (moment or datetime.utcnow()).strftime(TIMESTAMP_FORMAT)
+
+
+def _parse(value):
+    """TIMESTAMP column -> datetime (SQLite returns text, PostgreSQL datetime)."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def init_jobs(db):
+    """Add jobs.dedupe_key (NULL for ordinary jobs) and the unique index that enforces it."""
+    if DB_TYPE == 'postgresql':
+        db.execute('ALTER TABLE jobs ADD COLUMN IF NOT EXISTS dedupe_key TEXT')
+    else:
+        columns = [row['name'] for row in db.execute('PRAGMA table_info(jobs)').fetchall()]
+        if 'dedupe_key' not in columns:
+            db.execute('ALTER TABLE jobs ADD COLUMN dedupe_key TEXT')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs(dedupe_key)')
+    db.commit()
+
+
+class Task:
+    """A registered job function; call it directly to run inline."""
+
+    def __init__(self, func, name, max_attempts, priority):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, db, *args, delay=0, priority=None, dedupe_key=None, **kwargs):
+        """Queue a run inside the caller's transaction (the caller commits)."""
+        return enqueue(db, self.name, *args, delay=delay, priority=priority, dedupe_key=dedupe_key, **kwargs)
+
+    def delay(self, *args, delay=0, priority=None, dedupe_key=None, **kwargs):
+        """Queue a run on a connection of its own and commit straight away."""
+        with connection() as db:
+            job_id = self.enqueue(db, *args, delay=delay, priority=priority, dedupe_key=dedupe_key, **kwargs)
+            db.commit()
+        return job_id
+
+
+def task(name=None, max_attempts=DEFAULT_MAX_ATTEMPTS, priority=PRIORITY_NORMAL):
+    """
+    Register a function as a job. It is called as func(db, *args, **kwargs) with a
+    pooled connection; the worker commits after it returns and rolls back if it raises.
+    Arguments must be JSON-serialisable.
+    """
+    def register(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__name__}', max_attempts, priority)
+        TASKS[registered.name] = registered
+        return registered
+    return register
+
+
+def enqueue(db, name, *args, delay=0, priority=None, dedupe_key=None, **kwargs):
+    """
+    Queue task `name` to run `delay` seconds from now. Returns the job id, or None if
+    a job with the same `dedupe_key` already exists (the unique index decides, so two
+    processes racing to queue the same key get one job between them).
+    """
+    registered = TASKS[name]
+    row = db.execute('''
+        INSERT INTO jobs (task, args, priority, status, max_attempts, run_at, created_at, dedupe_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (dedupe_key) DO NOTHING
+        RETURNING id
+    ''', (name, json.dumps({'args': args, 'kwargs': kwargs}),
+          registered.priority if priority is None else priority, QUEUED,
+          registered.max_attempts, _timestamp(datetime.utcnow() + timedelta(seconds=delay)),
+          _timestamp(), dedupe_key)).fetchone()
+    return row['id'] if row else None
+
+
+def backoff_seconds(attempts):
+    """Wait before retry number `attempts` (1-based)."""
+    wait = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return wait * random.uniform(0.8, 1.2)
+
+
+def claim(db, worker_id):
+    """Take the next due job (committed as running), or None if the queue is idle."""
+    now = _timestamp()
+    job = db.execute(CLAIM_SQL, (RUNNING, worker_id, now, now, QUEUED, now)).fetchone()
+    db.commit()
+    return job
+
+
+def _count(key, wait_ms=0.0, run_ms=0.0):
+    with _counters_lock:
+        _counters[key] += 1
+        _counters['wait_ms_total'] += wait_ms
+        _counters['run_ms_total'] += run_ms
+
+
+def run(db, job):
+    """Execute a claimed job and record the outcome. Returns True on success."""
+    wait_ms = (_parse(job['started_at']) - _parse(job['run_at'])).total_seconds() * 1000
+    start = time.perf_counter()
+    payload = json.loads(job['args'])
+
+    try:
+        registered = TASKS.get(job['task'])
+        if registered is None:
+            raise LookupError(f"Unknown task {job['task']}")
+        registered.func(db, *payload['args'], **payload['kwargs'])
+        db.execute('''
+            UPDATE jobs SET status = ?, finished_at = ?, last_error = NULL WHERE id = ?
+        ''', (DONE, _timestamp(), job['id']))
+        db.commit()
+        _count('completed', wait_ms, (time.perf_counter() - start) * 1000)
+        return True
+    except Exception as e:
+        db.rollback()
+        error = f'{type(e).__name__}: {e}'
+        if job['attempts'] < job['max_attempts']:
+            retry_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(job['attempts']))
+            db.execute('''
+                UPDATE jobs SET status = ?, run_at = ?, last_error = ?, locked_by = NULL WHERE id = ?
+            ''', (QUEUED, _timestamp(retry_at), error, job['id']))
+            _count('retried', wait_ms)
+            logger.warning('Job %s (%s) failed, retry %s at %s: %s',
+                           job['id'], job['task'], job['attempts'], retry_at, error)
+        else:
+            db.execute('''
+                UPDATE jobs SET status = ?, finished_at = ?, last_error = ? WHERE id = ?
+            ''', (FAILED, _timestamp(), error, job['id']))
+            _count('failed', wait_ms)
+            logger.error('Job %s (%s) failed permanently after %s attempts: %s',
+                         job['id'], job['task'], job['attempts'], error)
+        db.commit()
+        return False
+
+
+def requeue_stale(db):
+    """Put back jobs whose worker died mid-run. Returns how many were re-queued."""
+    cutoff = _timestamp(datetime.utcnow() - timedelta(seconds=LOCK_TIMEOUT_SECONDS))
+    requeued = db.execute('''
+        UPDATE jobs SET status = ?, locked_by = NULL, last_error = ?
+        WHERE status = ? AND locked_at < ?
+    ''', (QUEUED, 'Lock timed out', RUNNING, cutoff)).rowcount
+    db.commit()
+    return requeued
+
+
+def retry_failed(db, job_id=None):
+    """Re-queue permanently failed jobs (one, or all) with a fresh set of attempts."""
+    sql = '''
+        UPDATE jobs SET status = ?, attempts = 0, run_at = ?, locked_by = NULL, finished_at = NULL
+        WHERE status = ?
+    '''
+    params = [QUEUED, _timestamp(), FAILED]
+    if job_id is not None:
+        sql += ' AND id = ?'
+        params.append(job_id)
+    retried = db.execute(sql, params).rowcount
+    db.commit()
+    return retried
+
+
+def purge(db, days=KEEP_DONE_DAYS):
+    """Delete finished jobs older than `days`; failed jobs are kept for inspection."""
+    cutoff = _timestamp(datetime.utcnow() - timedelta(days=days))
+    purged = db.execute('DELETE FROM jobs WHERE status = ? AND finished_at < ?', (DONE, cutoff)).rowcount
+    db.commit()
+    return purged
+
+
+def work(stop, worker_id=None, poll_interval=POLL_INTERVAL):
+    """Worker thread loop: claim and run jobs until `stop` (a threading.Event) is set."""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    while not stop.is_set():
+        with connection() as db:
+            job = claim(db, worker_id)
+            if job:
+                run(db, job)
+        if not job:
+            stop.wait(poll_interval)
+
+
+def run_pending(db, limit=None):
+    """Run due jobs inline until the queue is idle (tests, scripts, cron). Returns jobs run."""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim(db, f'inline:{os.getpid()}')
+        if not job:
+            break
+        run(db, job)
+        ran += 1
+    return ran
+
+
+def stats(db):
+    """Queue depth by status, due backlog and latency (for /api/metrics)."""
+    now = datetime.utcnow()
+    depth = {row['status']: row['jobs'] for row in db.execute('''
+        SELECT status, COUNT(*) AS jobs FROM jobs GROUP BY status
+    ''').fetchall()}
+    due = db.execute('''
+        SELECT COUNT(*) AS jobs, MIN(run_at) AS oldest FROM jobs WHERE status = ? AND run_at <= ?
+    ''', (QUEUED, _timestamp(now))).fetchone()
+    recent = db.execute('''
+        SELECT run_at, started_at, finished_at FROM jobs
+        WHERE status = ? ORDER BY finished_at DESC LIMIT 100
+    ''', (DONE,)).fetchall()
+
+    waits = sorted((_parse(row['started_at']) - _parse(row['run_at'])).total_seconds() * 1000 for row in recent)
+    runs = sorted((_parse(row['finished_at']) - _parse(row['started_at'])).total_seconds() * 1000 for row in recent)
+    with _counters_lock:
+        process = {key: round(value, 1) for key, value in _counters.items()}
+
+    return {
+        'depth': {status: depth.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+        'due': due['jobs'],
+        'oldest_due_age_s': round((now - _parse(due['oldest'])).total_seconds(), 1) if due['oldest'] else 0,
+        'wait_ms_p50': round(waits[len(waits) // 2], 1) if waits else 0,
+        'wait_ms_max': round(waits[-1], 1) if waits else 0,
+        'run_ms_p50': round(runs[len(runs) // 2], 1) if runs else 0,
+        'this_process': process,
+    }
@@ -0,0 +1,91 @@
+"""
+Order Writer - Turns a cart snapshot into an order in one transaction.
+Shared by the Stripe and BNPL checkouts: the order row (id via RETURNING), all items
+(multi-row INSERT), stock reservation, seller stats, sales rollups and cart clearing
+are written together, or not at all.
+"""
+
+import uuid
+
+import inventory
+import sales_rollups
+import seller_stats
+
+# Order lines per multi-row INSERT (7 parameters each; SQLite allows 999 per statement)
+ITEMS_PER_INSERT = 100
+
+
+def cart_snapshot(db, user_id):
+    """A user's cart lines with current product prices (internal ids)."""
+    return db.execute('''
+        SELECT c.product_id, c.seller_id, c.quantity, p.price, p.name, p.product_id AS public_product_id
+        FROM cart c
+        JOIN products p ON c.product_id = p.id
+        WHERE c.user_id = ?
+        ORDER BY c.id
+    ''', (user_id,)).fetchall()
+
+
+def cart_subtotal(lines):
+    return sum(line['price'] * line['quantity'] for line in lines)
+
+
+def _insert_items(db, order_pk, lines):
+    items = [(str(uuid.uuid4()), order_pk, line['product_id'], line['seller_id'], line['quantity'],
+              line['price'], line['price'] * line['quantity']) for line in lines]
+    for start in range(0, len(items), ITEMS_PER_INSERT):
+        chunk = items[start:start + ITEMS_PER_INSERT]
+        db.execute(f'''
+            INSERT INTO order_items
+            (order_item_id, order_id, product_id, seller_id, quantity, unit_price, subtotal)
+            VALUES {', '.join(['(?, ?, ?, ?, ?, ?, ?)'] * len(chunk))}
+        ''', [value for item in chunk for value in item])
+    return items
+
+
+def create_order(db, user_id, lines, payment_method, payment_status='pending', status='pending',
+                 shipping_cost=0, tax=0, shipping_address='', shipping_city='', commit_stock=False):
+    """
+    Write an order for `lines` (from cart_snapshot) inside the caller's transaction.
+
+    Stock is held against the order, or taken outright with commit_stock=True (already
+    paid). Raises inventory.InsufficientStock if anything is short; the caller must
+    then roll back. The caller commits on success.
+
+    Returns a dict with the order's id, order_id, order_number and total_amount.
+    """
+    subtotal = cart_subtotal(lines)
+    total = subtotal + shipping_cost + tax
+    order_id = str(uuid.uuid4())
+    order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+
+    order_pk = db.execute('''
+        INSERT INTO orders
+        (order_id, user_id, order_number, total_amount, shipping_cost, shipping_address,
+         shipping_city, payment_method, payment_status, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        RETURNING id
+    ''', (order_id, user_id, order_number, total, shipping_cost, shipping_address,
+          shipping_city, payment_method, payment_status, status)).fetchone()['id']
+
+    items = _insert_items(db, order_pk, lines)
+
+    # Any checkout-time hold is swapped for one on the order (no gap for other buyers)
+    inventory.release_user_holds(db, user_id)
+    stock_lines = [(line['product_id'], line['quantity']) for line in lines]
+    if commit_stock:
+        inventory.sell(db, stock_lines, order_pk, user_id)
+    else:
+        inventory.reserve(db, stock_lines, order_id=order_pk, user_id=user_id)
+
+    seller_stats.record_order_items(db, [(item[3], item[6]) for item in items])
+    sales_rollups.record_order(db, [(item[3], item[2], item[4], item[6]) for item in items])
+
+    db.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+
+    return {
+        'id': order_pk,
+        'order_id': order_id,
+        'order_number': order_number,
+        'total_amount': total
+    }
@@ -0,0 +1,96 @@
+"""
+Keyset (cursor) Pagination
+Pages through ordered listings by seeking past the last row seen instead of OFFSET,
+so page 100 costs the same index seek as page 1.
+"""
+
+import base64
+import json
+
+from flask import request, url_for, jsonify
+
+# JSON values a cursor may hold (sort keys are strings, numbers or NULL)
+SCALARS = (str, int, float, type(None))
+
+
+def encode_cursor(values):
+    """Opaque URL-safe token for the sort key of the last row on a page."""
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Inverse of encode_cursor; returns None for a missing or malformed token,
+    including one whose values could not be bound as SQL parameters.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(value, SCALARS) for value in values):
+        return None
+    return values
+
+
+def keyset_condition(columns, descending, cursor):
+    """
+    WHERE fragment that starts a page after `cursor`.
+
+    `columns` is a list of (sql_expression, row_key) pairs forming a unique
+    sort key, e.g. [('p.created_at', 'created_at'), ('p.id', 'id')].
+    Returns (sql, params); ('', []) on the first page.
+    """
+    values = decode_cursor(cursor)
+    if values is None or len(values) != len(columns):
+        return '', []
+    exprs = ', '.join(expr for expr, _ in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    op = '<' if descending else '>'
+    return f'({exprs}) {op} ({placeholders})', values
+
+
+def order_clause(columns, descending):
+    """ORDER BY matching keyset_condition (same direction on every column)."""
+    direction = 'DESC' if descending else 'ASC'
+    return 'ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _ in columns)
+
+
+def split_page(rows, columns, per_page):
+    """
+    Trim the look-ahead row from a LIMIT per_page + 1 query.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    last = rows[-1]
+    return rows, encode_cursor([last[key] for _, key in columns])
+
+
+def next_page_url(next_cursor):
+    """URL of the current view with the cursor advanced (None on the last page)."""
+    if not next_cursor:
+        return None
+    args = request.args.to_dict()
+    args.pop('format', None)
+    args['cursor'] = next_cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def wants_json():
+    """True for infinite-scroll requests (?format=json)."""
+    return request.args.get('format') == 'json'
+
+
+def json_page(key, rows, next_cursor, **extra):
+    """JSON response for one page of rows (plus any `extra` top-level keys)."""
+    return jsonify({
+        key: [dict(row) for row in rows],
+        'next_cursor': next_cursor,
+        'next_url': next_page_url(next_cursor),
+        **extra
+    })
@@ -0,0 +1,103 @@
+"""
+Paynow Webhook Inbox - Durable, ordered ingestion of Paynow result callbacks.
+The webhook only verifies the hash and appends the raw notification here (one row
+per reference and status, so Paynow's retries are dropped on arrival); a job then
+applies each agreement's notifications in arrival order via bnpl_payments.
+Transitions are idempotent, so replay() can re-run any part of the inbox.
+"""
+
+from datetime import datetime
+
+import bnpl_payments
+import jobs
+from database import DB_TYPE
+
+
+def append(db, reference, agreement_id, installment_number, status, payload):
+    """
+    Store a verified notification and queue its agreement's consumer (caller commits).
+    Returns False if this reference already reported this status.
+    """
+    cursor = db.execute('''
+        INSERT INTO paynow_inbox (reference, agreement_id, installment_number, status, payload)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (reference, status) DO NOTHING
+    ''', (reference, agreement_id, installment_number, status.strip().lower(), payload))
+    if cursor.rowcount == 0:
+        return False
+    consume.enqueue(db, agreement_id)
+    return True
+
+
+def _lock_agreement(db, agreement_id):
+    """Serialise consumers of one agreement for the rest of the transaction."""
+    if DB_TYPE == 'postgresql':
+        db.execute('SELECT id FROM bnpl_agreements WHERE agreement_id = ? FOR UPDATE', (agreement_id,))
+    # On SQLite this first write takes the database lock
+    db.execute('''
+        UPDATE paynow_inbox SET attempts = attempts + 1
+        WHERE agreement_id = ? AND processed_at IS NULL
+    ''', (agreement_id,))
+
+
+@jobs.task(max_attempts=10, priority=jobs.PRIORITY_HIGH)
+def consume(db, agreement_id):
+    """Apply an agreement's unprocessed notifications, oldest first. Returns how many."""
+    _lock_agreement(db, agreement_id)
+    rows = db.execute('''
+        SELECT id, installment_number, status FROM paynow_inbox
+        WHERE agreement_id = ? AND processed_at IS NULL
+        ORDER BY id
+    ''', (agreement_id,)).fetchall()
+    if not rows:
+        return 0
+
+    agreement = bnpl_payments.find_agreement(db, agreement_id)
+    for row in rows:
+        if agreement:
+            outcome = bnpl_payments.apply_status(db, agreement, row['installment_number'], row['status'])
+        else:
+            outcome = 'unknown_agreement'
+        db.execute('''
+            UPDATE paynow_inbox SET processed_at = CURRENT_TIMESTAMP, outcome = ? WHERE id = ?
+        ''', (outcome, row['id']))
+    return len(rows)
+
+
+def replay(db, agreement_id=None, since=None):
+    """
+    Mark notifications unprocessed again and queue their consumers, e.g. after a
+    transition bug is fixed. Commits. Returns (notifications, agreements) queued.
+    """
+    where, params = ['1 = 1'], []
+    if agreement_id:
+        where.append('agreement_id = ?')
+        params.append(agreement_id)
+    if since:
+        where.append('received_at >= ?')
+        params.append(since)
+
+    rows = db.execute(f'''
+        UPDATE paynow_inbox SET processed_at = NULL, outcome = NULL
+        WHERE {' AND '.join(where)}
+        RETURNING agreement_id
+    ''', params).fetchall()
+    agreements = sorted({row['agreement_id'] for row in rows})
+    for agreement in agreements:
+        consume.enqueue(db, agreement)
+    db.commit()
+    return len(rows), len(agreements)
+
+
+def stats(db):
+    """Unprocessed backlog (for /api/metrics)."""
+    row = db.execute('''
+        SELECT COUNT(*) AS backlog, MIN(received_at) AS oldest FROM paynow_inbox WHERE processed_at IS NULL
+    ''').fetchone()
+    oldest = row['oldest']
+    if oldest and not isinstance(oldest, datetime):
+        oldest = datetime.strptime(str(oldest)[:19], '%Y-%m-%d %H:%M:%S')
+    return {
+        'backlog': row['backlog'],
+        'oldest_age_s': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+    }
@@ -0,0 +1,246 @@
+"""
+Paynow Status Poller - Server-side polling of outstanding mobile money payments.
+process_first_payment stores each transaction's poll_url on its bnpl_payments row;
+the worker process (worker.py) polls due rows in batches with adaptive backoff and
+writes the outcome back, so browsers only ever read the cached status from the DB
+and no web worker waits on Paynow.
+"""
+
+import hmac
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+import requests
+
+import bnpl_payments
+from database import DB_TYPE, connection
+
+logger = logging.getLogger(__name__)
+
+# First poll soon after the prompt is sent, then back off while the customer approves
+FIRST_POLL_SECONDS = 3
+BACKOFF_FACTOR = 1.5
+MAX_POLL_SECONDS = 30
+ERROR_BACKOFF_SECONDS = 60
+
+# EcoCash/OneMoney prompts time out after a few minutes; stop polling well after that
+GIVE_UP_AFTER_MINUTES = 15
+
+# Payments claimed per batch, and concurrent HTTP polls within a batch
+BATCH_SIZE = 50
+CONCURRENCY = 8
+HTTP_TIMEOUT = 10
+
+# A claimed batch is hidden from other pollers for this long
+LEASE_SECONDS = 60
+
+# Seconds the poller thread sleeps when nothing is due
+IDLE_SECONDS = 1
+
+_counters = {'polls': 0, 'errors': 0, 'paid': 0, 'failed': 0, 'gave_up': 0, 'batches': 0}
+_counters_lock = threading.Lock()
+
+
+def _timestamp(moment=None):
+    return (moment or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _parse(value):
+    return value if isinstance(value, datetime) else datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+
+
+def next_interval(attempts):
+    """Seconds until the next poll after `attempts` polls came back still pending."""
+    return min(FIRST_POLL_SECONDS * BACKOFF_FACTOR ** attempts, MAX_POLL_SECONDS)
+
+
+def register(db, payment_id, reference, poll_url):
+    """Start server-side polling for a just-initiated payment (caller commits)."""
+    db.execute('''
+        UPDATE bnpl_payments
+        SET reference = ?, poll_url = ?, paynow_status = ?, poll_attempts = 0, next_poll_at = ?
+        WHERE payment_id = ?
+    ''', (reference, poll_url, 'sent',
+          _timestamp(datetime.utcnow() + timedelta(seconds=FIRST_POLL_SECONDS)), payment_id))
+
+
+def fetch_status(poll_url, integration_key=None):
+    """
+    POST to a Paynow poll URL and return its fields (lower-cased keys).
+    Raises ValueError if the response hash is missing or does not match `integration_key`.
+    """
+    response = requests.post(poll_url, data={}, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    fields = parse_qsl(response.text, keep_blank_values=True)
+
+    if integration_key:
+        # An unsigned response is no more trustworthy than a wrongly signed one
+        received = next((value for key, value in fields if key.lower() == 'hash'), '')
+        if not hmac.compare_digest(bnpl_payments.paynow_hash(fields, integration_key), received.upper()):
+            raise ValueError('Paynow status hash mismatch')
+
+    return {key.lower(): value for key, value in fields}
+
+
+def _claim(db, limit):
+    """Lease up to `limit` due payments so concurrent pollers skip them."""
+    now = datetime.utcnow()
+    rows = db.execute(f'''
+        UPDATE bnpl_payments
+        SET next_poll_at = ?
+        WHERE id IN (
+            SELECT id FROM bnpl_payments
+            WHERE status = 'pending' AND poll_url IS NOT NULL AND next_poll_at <= ?
+            ORDER BY next_poll_at
+            LIMIT ?
+            {'FOR UPDATE SKIP LOCKED' if DB_TYPE == 'postgresql' else ''}
+        )
+        RETURNING id, agreement_id, installment_number, poll_url, poll_attempts, created_at
+    ''', (_timestamp(now + timedelta(seconds=LEASE_SECONDS)), _timestamp(now), limit)).fetchall()
+    db.commit()
+    return rows
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def poll_due(db, integration_key=None, limit=BATCH_SIZE, fetch=fetch_status):
+    """
+    Poll one batch of due payments and record the results in one transaction.
+    Returns the number of payments polled.
+    """
+    rows = _claim(db, limit)
+    if not rows:
+        return 0
+
+    def poll(row):
+        try:
+            return fetch(row['poll_url'], integration_key), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(rows))) as pool:
+        results = list(pool.map(poll, rows))
+
+    now = datetime.utcnow()
+    for row, (fields, error) in zip(rows, results):
+        attempts = row['poll_attempts'] + 1
+
+        if error is not None:
+            _count('errors')
+            logger.warning('Polling payment %s failed: %s', row['id'], error)
+            db.execute('''
+                UPDATE bnpl_payments SET poll_attempts = ?, last_polled_at = ?, next_poll_at = ? WHERE id = ?
+            ''', (attempts, _timestamp(now), _timestamp(now + timedelta(seconds=ERROR_BACKOFF_SECONDS)), row['id']))
+            continue
+
+        status = fields.get('status', '').lower()
+        outcome = 'pending'
+        if status in bnpl_payments.PAID_STATUSES or status in bnpl_payments.FAILED_STATUSES:
+            agreement = db.execute('''
+                SELECT id, agreement_id, user_id, installments, installment_amount, order_id FROM bnpl_agreements
+                WHERE id = ?
+            ''', (row['agreement_id'],)).fetchone()
+            if agreement:
+                outcome = bnpl_payments.apply_status(db, agreement, row['installment_number'], status)
+            next_poll_at = None
+        elif now - _parse(row['created_at']) > timedelta(minutes=GIVE_UP_AFTER_MINUTES):
+            # Never approved; the Paynow result webhook can still settle it
+            _count('gave_up')
+            next_poll_at = None
+        else:
+            next_poll_at = _timestamp(now + timedelta(seconds=next_interval(attempts)))
+
+        if outcome in ('paid', 'failed'):
+            _count(outcome)
+        db.execute('''
+            UPDATE bnpl_payments
+            SET paynow_status = ?, poll_attempts = ?, last_polled_at = ?, next_poll_at = ?
+            WHERE id = ?
+        ''', (status or 'unknown', attempts, _timestamp(now), next_poll_at, row['id']))
+
+    db.commit()
+    _count('polls', len(rows))
+    _count('batches')
+    return len(rows)
+
+
+def run(stop, integration_key=None):
+    """Poller thread loop for worker.py: poll batches until `stop` is set."""
+    while not stop.is_set():
+        try:
+            with connection() as db:
+                polled = poll_due(db, integration_key)
+        except Exception:
+            logger.exception('Paynow poll batch failed')
+            polled = 0
+        # A full batch means more are due right now
+        if polled < BATCH_SIZE:
+            stop.wait(IDLE_SECONDS)
+
+
+def payment_status(db, user_id, payment_id=None, poll_url=None):
+    """A user's cached payment status for the browser, or None."""
+    row = db.execute(f'''
+        SELECT bp.payment_id, bp.status, bp.paynow_status, bp.next_poll_at
+        FROM bnpl_payments bp
+        JOIN bnpl_agreements ba ON ba.id = bp.agreement_id
+        WHERE bp.{'payment_id' if payment_id else 'poll_url'} = ? AND ba.user_id = ?
+    ''', (payment_id or poll_url, user_id)).fetchone()
+    if not row:
+        return None
+
+    retry_after = MAX_POLL_SECONDS
+    if row['next_poll_at']:
+        retry_after = (_parse(row['next_poll_at']) - datetime.utcnow()).total_seconds() + 1
+    return {
+        'payment_id': row['payment_id'],
+        'status': row['paynow_status'] or row['status'],
+        'paid': row['status'] == 'completed',
+        'failed': row['status'] == 'failed',
+        'polling': row['next_poll_at'] is not None,
+        # When the browser should look again: just after the next server-side poll
+        'retry_after': max(2, min(int(retry_after), MAX_POLL_SECONDS)),
+    }
+
+
+def stats(db):
+    """Outstanding polls and this process's poller counters (for /api/metrics)."""
+    row = db.execute('''
+        SELECT COUNT(*) AS outstanding, MIN(next_poll_at) AS next_due FROM bnpl_payments
+        WHERE status = 'pending' AND next_poll_at IS NOT NULL
+    ''').fetchone()
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'outstanding': row['outstanding'],
+        'next_due': str(row['next_due']) if row['next_due'] else None,
+        'this_process': process,
+    }
+
+
+def init_paynow_poller(db):
+    """Add the polling columns to existing bnpl_payments tables."""
+    columns = {
+        'reference': 'TEXT',
+        'poll_url': 'TEXT',
+        'paynow_status': 'TEXT',
+        'poll_attempts': 'INTEGER DEFAULT 0',
+        'next_poll_at': 'TIMESTAMP',
+        'last_polled_at': 'TIMESTAMP',
+    }
+    if DB_TYPE == 'postgresql':
+        for name, sql_type in columns.items():
+            db.execute(f'ALTER TABLE bnpl_payments ADD COLUMN IF NOT EXISTS {name} {sql_type}')
+    else:
+        existing = {row[1] for row in db.execute('PRAGMA table_info(bnpl_payments)').fetchall()}
+        for name, sql_type in columns.items():
+            if name not in existing:
+                db.execute(f'ALTER TABLE bnpl_payments ADD COLUMN {name} {sql_type}')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_bnpl_payments_poll ON bnpl_payments(status, next_poll_at)')
+    db.commit()
@@ -0,0 +1,114 @@
+"""
+Product Rating Aggregates - Denormalised rating_sum / review_count / rating on products.
+Maintained incrementally in the same transaction as each review write, so listings
+never aggregate product_reviews; reconcile() repairs any drift.
+"""
+
+from database import DB_TYPE
+
+# Only reviews in this status count towards a product's rating
+COUNTED_STATUS = 'active'
+
+# SET expressions see the old row, so the new average applies the deltas itself
+APPLY_DELTA = '''
+    UPDATE products
+    SET rating_sum = rating_sum + ?,
+        review_count = review_count + ?,
+        rating = CASE WHEN review_count + ? > 0
+                      THEN (rating_sum + ?) * 1.0 / (review_count + ?)
+                      ELSE 0 END
+    WHERE id = ?
+'''
+
+
+def init_rating_aggregates(db):
+    """Add the rating_sum column to existing databases and backfill it."""
+    if DB_TYPE == 'postgresql':
+        db.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS rating_sum INTEGER DEFAULT 0')
+        db.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS review_count INTEGER DEFAULT 0')
+        db.commit()
+        return
+
+    columns = [row[1] for row in db.execute('PRAGMA table_info(products)').fetchall()]
+    if 'rating_sum' in columns:
+        return
+    db.execute('ALTER TABLE products ADD COLUMN rating_sum INTEGER DEFAULT 0')
+    reconcile(db)
+
+
+def _apply(db, product_id, rating_delta, count_delta):
+    db.execute(APPLY_DELTA, (rating_delta, count_delta, count_delta,
+                             rating_delta, count_delta, product_id))
+
+
+def review_added(db, product_id, rating, status=COUNTED_STATUS):
+    """Count a newly inserted review (internal product id)."""
+    if status == COUNTED_STATUS:
+        _apply(db, product_id, rating, 1)
+
+
+def set_review_status(db, review_id, status):
+    """Change a review's status (e.g. hide/restore), adjusting its product's aggregate."""
+    review = db.execute('''
+        SELECT product_id, rating, status FROM product_reviews WHERE review_id = ?
+    ''', (review_id,)).fetchone()
+    if not review or review['status'] == status:
+        return False
+
+    db.execute('''
+        UPDATE product_reviews SET status = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE review_id = ?
+    ''', (status, review_id))
+
+    was_counted = review['status'] == COUNTED_STATUS
+    is_counted = status == COUNTED_STATUS
+    if was_counted != is_counted:
+        sign = 1 if is_counted else -1
+        _apply(db, review['product_id'], sign * review['rating'], sign)
+    return True
+
+
+def delete_review(db, review_id):
+    """Delete a review, removing it from its product's aggregate."""
+    review = db.execute('''
+        SELECT product_id, rating, status FROM product_reviews WHERE review_id = ?
+    ''', (review_id,)).fetchone()
+    if not review:
+        return False
+
+    db.execute('DELETE FROM product_reviews WHERE review_id = ?', (review_id,))
+    if review['status'] == COUNTED_STATUS:
+        _apply(db, review['product_id'], -review['rating'], -1)
+    return True
+
+
+def reconcile(db):
+    """
+    Recompute aggregates from product_reviews for products that have drifted.
+    Returns the number of products repaired.
+    """
+    truth = '''
+        SELECT p.id,
+               COALESCE(SUM(pr.rating), 0) AS rating_sum,
+               COUNT(pr.id) AS review_count
+        FROM products p
+        LEFT JOIN product_reviews pr ON pr.product_id = p.id AND pr.status = ?
+        GROUP BY p.id
+    '''
+    drifted = db.execute(f'''
+        SELECT t.id, t.rating_sum, t.review_count
+        FROM ({truth}) t
+        JOIN products p ON p.id = t.id
+        WHERE COALESCE(p.rating_sum, -1) != t.rating_sum
+           OR COALESCE(p.review_count, -1) != t.review_count
+    ''', (COUNTED_STATUS,)).fetchall()
+
+    db.executemany('''
+        UPDATE products
+        SET rating_sum = ?, review_count = ?,
+            rating = CASE WHEN ? > 0 THEN ? * 1.0 / ? ELSE 0 END
+        WHERE id = ?
+    ''', [(row['rating_sum'], row['review_count'], row['review_count'],
+           row['rating_sum'], row['review_count'], row['id']) for row in drifted])
+    db.commit()
+    return len(drifted)
@@ -0,0 +1,264 @@
+"""
+Sales Rollups - Time-bucketed sales per seller and per product for analytics.
+Daily rows are upserted in the same transaction as each order; compact() folds days
+older than DAILY_RETENTION_DAYS into weekly and monthly tables, so analytics queries
+read a bounded number of rows however long a seller's history is.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from database import DB_TYPE
+
+# Days kept at daily granularity before compaction
+DAILY_RETENTION_DAYS = 90
+
+GRAINS = ('daily', 'weekly', 'monthly')
+
+# scope -> (table prefix, key column, extra grouping columns)
+SCOPES = {
+    'seller': ('seller_sales', 'seller_id', ()),
+    'product': ('product_sales', 'product_id', ('seller_id',)),
+}
+
+# Start of the week (Monday) / month containing a daily period_start
+BUCKETS = {
+    'postgresql': {
+        'weekly': "DATE_TRUNC('week', period_start)::date",
+        'monthly': "DATE_TRUNC('month', period_start)::date",
+    },
+    'sqlite': {
+        'weekly': "DATE(period_start, '-6 days', 'weekday 1')",
+        'monthly': "DATE(period_start, 'start of month')",
+    },
+}[DB_TYPE if DB_TYPE == 'postgresql' else 'sqlite']
+
+MEASURES = ('order_count', 'units', 'revenue')
+
+
+def _table(scope, grain):
+    return f'{SCOPES[scope][0]}_{grain}'
+
+
+def _upsert_sql(scope, grain, select_sql=None):
+    """INSERT ... ON CONFLICT that adds to an existing bucket."""
+    _, key, extra = SCOPES[scope]
+    table = _table(scope, grain)
+    columns = ', '.join((key, *extra, 'period_start', *MEASURES))
+    source = select_sql or 'VALUES (' + ', '.join('?' for _ in (key, *extra)) + ', CURRENT_DATE, ?, ?, ?)'
+    updates = ', '.join(f'{m} = {table}.{m} + excluded.{m}' for m in MEASURES)
+    return f'''
+        INSERT INTO {table} ({columns})
+        {source}
+        ON CONFLICT ({key}, period_start) DO UPDATE SET {updates}
+    '''
+
+
+def init_sales_rollups(db):
+    """Backfill rollups from order history the first time they are found empty."""
+    if db.execute('SELECT 1 FROM seller_sales_daily LIMIT 1').fetchone():
+        return
+    if db.execute('SELECT 1 FROM seller_sales_monthly LIMIT 1').fetchone():
+        return
+    if db.execute('SELECT 1 FROM order_items LIMIT 1').fetchone():
+        rebuild(db)
+
+
+def record_order(db, items):
+    """
+    Add one order's lines to today's buckets. Call inside the order transaction.
+
+    `items` is an iterable of (seller_id, product_id, quantity, subtotal).
+    """
+    sellers = defaultdict(lambda: [0, 0.0])
+    products = defaultdict(lambda: [0, 0, 0.0])
+    for seller_id, product_id, quantity, subtotal in items:
+        sellers[seller_id][0] += quantity
+        sellers[seller_id][1] += subtotal
+        line = products[(product_id, seller_id)]
+        line[0] += 1
+        line[1] += quantity
+        line[2] += subtotal
+
+    db.executemany(_upsert_sql('seller', 'daily'), [
+        (seller_id, 1, units, revenue) for seller_id, (units, revenue) in sellers.items()
+    ])
+    db.executemany(_upsert_sql('product', 'daily'), [
+        (product_id, seller_id, lines, units, revenue)
+        for (product_id, seller_id), (lines, units, revenue) in products.items()
+    ])
+
+
+def _today():
+    # CURRENT_DATE / CURRENT_TIMESTAMP are UTC in SQLite
+    return datetime.utcnow().date()
+
+
+def compaction_cutoff():
+    """Days before this date live in the weekly/monthly tables only."""
+    return _today() - timedelta(days=DAILY_RETENTION_DAYS)
+
+
+def compact(db, cutoff=None):
+    """
+    Fold daily rows older than `cutoff` into the weekly and monthly tables and
+    delete them, in one transaction. Returns the number of daily rows compacted.
+    """
+    cutoff = (cutoff or compaction_cutoff()).isoformat()
+    compacted = 0
+
+    for scope, (_, key, extra) in SCOPES.items():
+        daily = _table(scope, 'daily')
+        group = ', '.join((key, *extra))
+        for grain in ('weekly', 'monthly'):
+            bucket = BUCKETS[grain]
+            db.execute(_upsert_sql(scope, grain, f'''
+                SELECT {group}, {bucket}, SUM(order_count), SUM(units), SUM(revenue)
+                FROM {daily}
+                WHERE period_start < ?
+                GROUP BY {group}, {bucket}
+            '''), (cutoff,))
+        compacted += db.execute(f'DELETE FROM {daily} WHERE period_start < ?', (cutoff,)).rowcount
+
+    db.commit()
+    return compacted
+
+
+def rebuild(db):
+    """Recompute every rollup from order_items, then compact. Returns daily rows written."""
+    for scope in SCOPES:
+        for grain in GRAINS:
+            db.execute(f'DELETE FROM {_table(scope, grain)}')
+
+    cursor = db.execute('''
+        INSERT INTO seller_sales_daily (seller_id, period_start, order_count, units, revenue)
+        SELECT seller_id, DATE(created_at), COUNT(DISTINCT order_id), SUM(quantity), SUM(subtotal)
+        FROM order_items
+        GROUP BY seller_id, DATE(created_at)
+    ''')
+    written = cursor.rowcount
+    cursor = db.execute('''
+        INSERT INTO product_sales_daily (product_id, seller_id, period_start, order_count, units, revenue)
+        SELECT product_id, MIN(seller_id), DATE(created_at), COUNT(*), SUM(quantity), SUM(subtotal)
+        FROM order_items
+        GROUP BY product_id, DATE(created_at)
+    ''')
+    written += cursor.rowcount
+
+    compact(db)
+    return written
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+def period_starts(grain, periods, today=None):
+    """The last `periods` bucket start dates for `grain`, oldest first."""
+    today = today or _today()
+    if grain == 'daily':
+        return [today - timedelta(days=i) for i in range(periods - 1, -1, -1)]
+    if grain == 'weekly':
+        monday = today - timedelta(days=today.weekday())
+        return [monday - timedelta(weeks=i) for i in range(periods - 1, -1, -1)]
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(periods):
+        starts.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def seller_series(db, seller_id, grain='daily', periods=30):
+    """
+    Sales per bucket for the last `periods` buckets, zero-filled, oldest first.
+    Daily series only reach back DAILY_RETENTION_DAYS.
+    """
+    if grain not in GRAINS:
+        raise ValueError(f'Unknown grain: {grain}')
+    starts = period_starts(grain, periods)
+    since = starts[0].isoformat()
+
+    if grain == 'daily':
+        rows = db.execute('''
+            SELECT period_start, order_count, units, revenue
+            FROM seller_sales_daily
+            WHERE seller_id = ? AND period_start >= ?
+        ''', (seller_id, since)).fetchall()
+    else:
+        # Compacted buckets plus the still-daily tail rolled up on the fly
+        rows = db.execute(f'''
+            SELECT period_start, SUM(order_count) AS order_count,
+                   SUM(units) AS units, SUM(revenue) AS revenue
+            FROM (
+                SELECT period_start, order_count, units, revenue
+                FROM {_table('seller', grain)}
+                WHERE seller_id = ? AND period_start >= ?
+                UNION ALL
+                SELECT {BUCKETS[grain]} AS period_start, order_count, units, revenue
+                FROM seller_sales_daily
+                WHERE seller_id = ? AND period_start >= ?
+            ) t
+            GROUP BY period_start
+        ''', (seller_id, since, seller_id, since)).fetchall()
+
+    by_start = {str(row['period_start']): row for row in rows}
+    series = []
+    for start in starts:
+        row = by_start.get(start.isoformat())
+        series.append({
+            'period_start': start.isoformat(),
+            'order_count': row['order_count'] if row else 0,
+            'units': row['units'] if row else 0,
+            'revenue': float(row['revenue']) if row else 0.0,
+        })
+    return series
+
+
+def _product_window(seller_id, days):
+    """Product rollup rows for a seller covering roughly the last `days` days."""
+    since = _today() - timedelta(days=days - 1)
+    sql = '''
+        SELECT product_id, order_count, units, revenue
+        FROM product_sales_daily
+        WHERE seller_id = ? AND period_start >= ?
+    '''
+    params = [seller_id, since.isoformat()]
+    if since < compaction_cutoff():
+        # Older days are only kept per month
+        sql += '''
+            UNION ALL
+            SELECT product_id, order_count, units, revenue
+            FROM product_sales_monthly
+            WHERE seller_id = ? AND period_start >= ?
+        '''
+        params += [seller_id, since.replace(day=1).isoformat()]
+    return sql, params
+
+
+def top_products(db, seller_id, days=30, limit=10):
+    """Best-selling products by units over the last `days` days."""
+    window, params = _product_window(seller_id, days)
+    return db.execute(f'''
+        SELECT p.product_id, p.name, p.rating AS avg_rating,
+               SUM(t.order_count) AS order_count, SUM(t.units) AS units_sold,
+               SUM(t.revenue) AS revenue
+        FROM ({window}) t
+        JOIN products p ON p.id = t.product_id
+        GROUP BY p.id, p.product_id, p.name, p.rating
+        ORDER BY units_sold DESC, revenue DESC
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+
+
+def category_breakdown(db, seller_id, days=30):
+    """Order lines per product category over the last `days` days, largest first."""
+    window, params = _product_window(seller_id, days)
+    rows = db.execute(f'''
+        SELECT p.category, SUM(t.order_count) AS order_count
+        FROM ({window}) t
+        JOIN products p ON p.id = t.product_id
+        GROUP BY p.category
+        ORDER BY order_count DESC
+    ''', params).fetchall()
+    return {row['category']: row['order_count'] for row in rows}
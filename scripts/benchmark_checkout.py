@@ -0,0 +1,225 @@
+"""
+Checkout latency benchmark - order creation for 1, 10 and 100-line carts.
+Times order_writer.create_order (order, items, stock, stats, rollups, cart clearing in
+one transaction) against the same work done one statement per line, and against the
+old stripe_success loop. Uses a throwaway SQLite database unless --database-url is given.
+
+Usage: python scripts/benchmark_checkout.py [--runs 50] [--sizes 1,10,100] [--database-url URL]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=50, help='checkouts per cart size')
+    parser.add_argument('--sizes', default='1,10,100', help='comma-separated cart line counts')
+    parser.add_argument('--database-url', help='database to use (default: temporary SQLite file)')
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import math
+
+from database import connection, EXECUTEMANY_PAGE_SIZE
+import app as zimapp
+import order_writer
+
+SIZES = [int(size) for size in args.sizes.split(',')]
+
+
+def create_fixtures(db):
+    """A buyer and one seller with enough well-stocked products for the largest cart."""
+    user_id = str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, f'{user_id}@bench.test', '-', 'Bench Buyer'))
+    db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug)
+        VALUES (?, ?, ?, ?)
+    ''', (str(uuid.uuid4()), user_id, 'Bench Store', f'bench-{user_id[:8]}'))
+    seller_id = db.execute('SELECT id FROM sellers WHERE user_id = ?', (user_id,)).fetchone()['id']
+
+    products = []
+    for i in range(max(SIZES)):
+        public_id = str(uuid.uuid4())
+        db.execute('''
+            INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (public_id, seller_id, f'Bench Product {i}', 'Electronics', 5.0 + i, 10 ** 6))
+        product_id = db.execute('SELECT id FROM products WHERE product_id = ?', (public_id,)).fetchone()['id']
+        db.execute('''
+            INSERT INTO inventory (inventory_id, product_id, quantity_available)
+            VALUES (?, ?, ?)
+        ''', (str(uuid.uuid4()), product_id, 10 ** 6))
+        products.append((product_id, seller_id, 5.0 + i))
+    db.commit()
+    return user_id, products
+
+
+def fill_cart(db, user_id, products, lines):
+    db.executemany('''
+        INSERT INTO cart (cart_id, user_id, product_id, seller_id, quantity, price_at_add)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(str(uuid.uuid4()), user_id, product_id, seller_id, 1, price)
+          for product_id, seller_id, price in products[:lines]])
+    db.commit()
+
+
+def legacy_checkout(db, user_id):
+    """The previous stripe_success write path: one statement per line, id re-selected by UUID."""
+    cart_items = db.execute('''
+        SELECT c.*, p.price FROM cart c JOIN products p ON c.product_id = p.id WHERE c.user_id = ?
+    ''', (user_id,)).fetchall()
+    order_id = str(uuid.uuid4())
+    total = sum(item['price'] * item['quantity'] for item in cart_items) + 50
+    db.execute('''
+        INSERT INTO orders (order_id, user_id, order_number, total_amount, payment_method, payment_status, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (order_id, user_id, f"ORD-{uuid.uuid4().hex[:8].upper()}", total, 'stripe', 'paid', 'confirmed'))
+    order = db.execute('SELECT id FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+    for item in cart_items:
+        db.execute('''
+            INSERT INTO order_items (order_item_id, order_id, product_id, seller_id, quantity, unit_price, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), order['id'], item['product_id'], item['seller_id'],
+              item['quantity'], item['price'], item['price'] * item['quantity']))
+        db.execute('''
+            UPDATE inventory SET quantity_reserved = quantity_reserved + ? WHERE product_id = ?
+        ''', (item['quantity'], item['product_id']))
+    db.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+    db.commit()
+
+
+def per_line_checkout(db, user_id):
+    """The writer's work issued line by line (what the old loop grows into with the same guarantees)."""
+    cart_items = db.execute('''
+        SELECT c.*, p.price FROM cart c JOIN products p ON c.product_id = p.id WHERE c.user_id = ?
+    ''', (user_id,)).fetchall()
+    order_id = str(uuid.uuid4())
+    total = sum(item['price'] * item['quantity'] for item in cart_items) + 50
+    db.execute('''
+        INSERT INTO orders (order_id, user_id, order_number, total_amount, payment_method, payment_status, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (order_id, user_id, f"ORD-{uuid.uuid4().hex[:8].upper()}", total, 'stripe', 'paid', 'confirmed'))
+    order = db.execute('SELECT id FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+    for item in cart_items:
+        subtotal = item['price'] * item['quantity']
+        db.execute('''
+            INSERT INTO order_items (order_item_id, order_id, product_id, seller_id, quantity, unit_price, subtotal)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), order['id'], item['product_id'], item['seller_id'],
+              item['quantity'], item['price'], subtotal))
+        db.execute('''
+            UPDATE inventory SET quantity_available = quantity_available - ?
+            WHERE product_id = ? AND quantity_available - quantity_reserved >= ?
+        ''', (item['quantity'], item['product_id'], item['quantity']))
+        db.execute('''
+            INSERT INTO inventory_reservations (reservation_id, product_id, quantity, order_id, user_id, status, expires_at)
+            VALUES (?, ?, ?, ?, ?, 'committed', CURRENT_TIMESTAMP)
+        ''', (str(uuid.uuid4()), item['product_id'], item['quantity'], order['id'], user_id))
+        db.execute('''
+            UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?
+        ''', (item['quantity'], item['product_id']))
+        db.execute('''
+            UPDATE seller_stats SET order_count = order_count + 1, gross_sales = gross_sales + ?
+            WHERE seller_id = ?
+        ''', (subtotal, item['seller_id']))
+        db.execute('''
+            INSERT INTO product_sales_daily (product_id, seller_id, period_start, order_count, units, revenue)
+            VALUES (?, ?, CURRENT_DATE, 1, ?, ?)
+            ON CONFLICT (product_id, period_start) DO UPDATE SET
+                order_count = product_sales_daily.order_count + 1,
+                units = product_sales_daily.units + excluded.units,
+                revenue = product_sales_daily.revenue + excluded.revenue
+        ''', (item['product_id'], item['seller_id'], item['quantity'], subtotal))
+    db.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+    db.commit()
+
+
+def writer_checkout(db, user_id):
+    cart_items = order_writer.cart_snapshot(db, user_id)
+    order_writer.create_order(db, user_id, cart_items, 'stripe', payment_status='paid',
+                              status='confirmed', shipping_cost=50, commit_stock=True)
+    db.commit()
+
+
+class RoundTripCounter:
+    """Counts the statements a checkout would send to a PostgreSQL server."""
+
+    def __init__(self, db):
+        self._db = db
+        self.round_trips = 0
+
+    def execute(self, query, params=()):
+        self.round_trips += 1
+        return self._db.execute(query, params)
+
+    def executemany(self, query, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self.round_trips += math.ceil(len(seq_of_params) / EXECUTEMANY_PAGE_SIZE)
+        return self._db.executemany(query, seq_of_params)
+
+    def commit(self):
+        self.round_trips += 1
+        return self._db.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def measure(db, user_id, products, lines, checkout):
+    """Returns (p50 ms, p95 ms, round trips per checkout)."""
+    timings = []
+    for _ in range(args.runs):
+        fill_cart(db, user_id, products, lines)
+        start = time.perf_counter()
+        checkout(db, user_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    fill_cart(db, user_id, products, lines)
+    counter = RoundTripCounter(db)
+    checkout(counter, user_id)
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], counter.round_trips
+
+
+def main():
+    print(f"Database: {os.environ['DATABASE_URL']}")
+    zimapp.init_db()
+
+    with connection() as db:
+        user_id, products = create_fixtures(db)
+
+        print(f"\n{'lines':>6} | {'old loop':>16} | {'per-line':>25} | {'writer':>25}")
+        print(f"{'':>6} | {'p50':>8} {'trips':>7} | {'p50':>8} {'p95':>8} {'trips':>7} | "
+              f"{'p50':>8} {'p95':>8} {'trips':>7}")
+        print('-' * 84)
+        for lines in SIZES:
+            legacy_p50, _, legacy_trips = measure(db, user_id, products, lines, legacy_checkout)
+            per_line_p50, per_line_p95, per_line_trips = measure(db, user_id, products, lines, per_line_checkout)
+            writer_p50, writer_p95, writer_trips = measure(db, user_id, products, lines, writer_checkout)
+            print(f"{lines:>6} | {legacy_p50:>6.2f}ms {legacy_trips:>7} | "
+                  f"{per_line_p50:>6.2f}ms {per_line_p95:>6.2f}ms {per_line_trips:>7} | "
+                  f"{writer_p50:>6.2f}ms {writer_p95:>6.2f}ms {writer_trips:>7}")
+
+    print("\nold loop: the previous stripe_success (order, items, blind inventory bump only).")
+    print("per-line: the writer's guarantees (compare-and-set stock, reservations, seller")
+    print("stats, rollups) issued one statement per line.")
+    print("trips: statements sent per checkout; on PostgreSQL each is a network round trip,")
+    print("so the writer's latency stays flat as carts grow.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Image pipeline benchmark - bytes per browse page with originals vs. variants.
+Uploads camera-sized JPEGs (with EXIF and GPS) for a page of products through the
+seller form, fetches the category browse page and the images a browser would load,
+then lets a pool of job worker threads render the variants and fetches the page again.
+Reports upload latency, processing throughput and bytes per page, and checks the
+originals are published and variants rendered metadata-free. Runs against a throwaway SQLite database and upload folder.
+
+Usage: python scripts/benchmark_image_pipeline.py [--products 24] [--width 4000] [--threads 4]
+                                                  [--slot 350] [--dpr 1 2]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=24, help='products on the page, one photo each')
+    parser.add_argument('--width', type=int, default=4000, help='width of the uploaded photos (3:2)')
+    parser.add_argument('--threads', type=int, default=4, help='job worker threads')
+    parser.add_argument('--slot', type=int, default=350, help='CSS pixels a product card image is laid out at')
+    parser.add_argument('--dpr', type=float, nargs='+', default=[1, 2], help='device pixel ratios to report')
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'images.db')
+# Uploads and variants go to ./static/uploads; keep them out of the checkout
+os.chdir(WORKDIR)
+
+from database import connection
+import app as zimapp
+import image_pipeline
+import jobs
+
+PAGE_URL = '/products?category=Electronics'
+SRCSET_RE = re.compile(r'<source type="image/webp" srcset="([^"]+)"')
+SRC_RE = re.compile(r'<img src="([^"]+)"')
+
+
+def photo(seed):
+    """A 3:2 camera-like JPEG: smooth colour fields plus sensor noise, with EXIF and GPS tags."""
+    rng = np.random.default_rng(seed)
+    height = args.width * 2 // 3
+    fields = Image.fromarray(rng.integers(0, 255, (6, 9, 3), dtype=np.uint8)).resize(
+        (args.width, height), Image.BICUBIC)
+    pixels = np.asarray(fields, dtype=np.int16) + rng.normal(0, 6, (height, args.width, 3)).astype(np.int16)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    exif = Image.Exif()
+    exif[0x010F] = 'Benchmark Camera'
+    exif[0x0112] = 1
+    exif[0x8825] = {1: 'S', 2: (17.0, 49.0, 45.0), 3: 'E', 4: (31.0, 3.0, 7.0)}
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def seed_seller(db):
+    user_id, seller_id = str(uuid.uuid4()), str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', (user_id, 'seller@images.test', '-', 'Image Seller'))
+    db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+        VALUES (?, ?, 'Image Store', 'image-store', 1)
+    ''', (seller_id, user_id))
+    db.commit()
+    return user_id, seller_id
+
+
+def fetch(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    return response.data
+
+
+def image_bytes(url):
+    """Size of an uploaded image as served from /static (relative to the working directory)."""
+    return os.path.getsize(url.lstrip('/'))
+
+
+def pick(srcset, need):
+    """The candidate a browser takes: the narrowest at least `need` px wide, else the widest."""
+    candidates = sorted((int(width.rstrip('w')), url) for url, width in
+                        (entry.strip().split(' ') for entry in srcset.split(',')))
+    return next((url for width, url in candidates if width >= need), candidates[-1][1])
+
+
+def page_bytes(html, dpr):
+    """HTML plus every card image the page makes the browser download."""
+    total = len(html)
+    sources = SRCSET_RE.findall(html.decode())
+    if sources:
+        urls = [pick(srcset, args.slot * dpr) for srcset in sources]
+    else:
+        urls = SRC_RE.findall(html.decode())
+    return total + sum(image_bytes(url) for url in urls), len(urls)
+
+
+def has_metadata(path):
+    with Image.open(path) as image:
+        return bool(image.info.get('exif') or image.getexif())
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def work_queue(threads):
+    """Run queued jobs on `threads` worker threads (as worker.py does) until none are left."""
+    stop = threading.Event()
+    workers = [threading.Thread(target=jobs.work, args=(stop,), kwargs={'poll_interval': 0.05})
+               for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    while True:
+        with connection() as db:
+            if not db.execute("SELECT 1 FROM jobs WHERE status IN ('queued', 'running')").fetchone():
+                break
+        time.sleep(0.05)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    zimapp.init_db()
+    with connection() as db:
+        user_id, seller_id = seed_seller(db)
+    client = zimapp.app.test_client()
+    ok = True
+
+    print(f"=== Uploading {args.products} photos ({args.width}px wide) ===")
+    photos = [photo(i) for i in range(args.products)]
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['seller_id'] = seller_id
+    upload_times = []
+    for i, data in enumerate(photos):
+        start = time.perf_counter()
+        response = client.post('/sellers/product/new', data={
+            'name': f'Camera photo item {i}', 'category': 'Electronics', 'price': '50', 'stock_quantity': '3',
+            'images': (io.BytesIO(data), f'photo-{i}.jpg')}, content_type='multipart/form-data')
+        upload_times.append(time.perf_counter() - start)
+        assert response.status_code == 302, response.status_code
+    with client.session_transaction() as session:
+        session.clear()
+    print(f"   {sum(map(len, photos)) / len(photos) / 1e6:.2f} MB per photo, "
+          f"upload request {1000 * sum(upload_times) / len(upload_times):.1f} ms on average (no resizing inline)")
+
+    with connection() as db:
+        published = db.execute('SELECT content_hash, image_path FROM image_blobs').fetchall()
+    ok &= check("Originals are published without EXIF/GPS",
+                not any(has_metadata(os.path.join('static', row['image_path'])) for row in published))
+
+    before_html = fetch(client, PAGE_URL)
+    before, before_images = page_bytes(before_html, 1)
+
+    print(f"\n=== Rendering variants on {args.threads} worker threads ===")
+    seconds = work_queue(args.threads)
+    print(f"   {args.products} images in {seconds:.2f}s ({args.products / seconds:.1f} images/s); "
+          f"{image_pipeline.stats()['this_process']}")
+
+    after_html = fetch(client, PAGE_URL)
+    print(f"\n=== Bytes per browse page ({before_images} product images, {args.slot}px card slots) ===")
+    print(f"   originals:            {before / 1e6:8.2f} MB")
+    for dpr in args.dpr:
+        after, _ = page_bytes(after_html, dpr)
+        print(f"   variants at {dpr:g}x DPR:   {after / 1e6:8.2f} MB  ({before / after:.0f}x smaller)")
+    ok &= check("Every card offers WebP variants", len(SRCSET_RE.findall(after_html.decode())) == before_images)
+    fallback = len(after_html) + sum(image_bytes(url) for url in SRC_RE.findall(after_html.decode()))
+    print(f"   JPEG fallback (src):  {fallback / 1e6:8.2f} MB")
+
+    with connection() as db:
+        rows = db.execute('SELECT image_path, variants FROM product_images').fetchall()
+    ok &= check("Every image has variants recorded", all(row['variants'] for row in rows))
+    files = [path for row in rows for path in image_pipeline.variant_files(row['variants'])]
+    ok &= check("Variants carry no EXIF", not any(has_metadata(os.path.join('static', path)) for path in files))
+    ok &= check("Originals still match their content hash",
+                all(hashlib.sha256(open(os.path.join('static', row['image_path']), 'rb').read()).hexdigest()
+                    == row['content_hash'] for row in published))
+    largest = max(image_pipeline.SIZES.values())
+    with Image.open(os.path.join('static', json.loads(rows[0]['variants'])['detail']['webp'])) as image:
+        ok &= check("Detail variant is bounded by its size", max(image.size) == largest, image.size)
+
+    print(f"\n{'✅ All image pipeline checks passed' if ok else '❌ Image pipeline checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Streaming benchmark - time to first byte and memory of listing pages, buffered vs. streamed.
+Seeds a catalogue of products (full-text indexed) and a seller with a long order
+history, then fetches a broad search page and the seller orders page with
+streaming.render() off (the whole page rendered before the response starts) and on.
+Reports time to first byte, total time and peak Python memory per request at each
+page size, and checks both modes send the same page. Runs against a throwaway
+SQLite database.
+
+Usage: python scripts/benchmark_streaming.py [--products 50000] [--orders 5000]
+                                             [--page-sizes 24 1000] [--runs 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=50000, help='products in the catalogue')
+    parser.add_argument('--orders', type=int, default=5000, help='order items sold by the benchmark seller')
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[24, 1000], help='rows per page to compare')
+    parser.add_argument('--runs', type=int, default=5, help='timed requests per page and mode')
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'streaming.db')
+
+from database import connection
+import app as zimapp
+import search as search_index
+import seller_stats
+import sellers
+import streaming
+
+CATEGORIES = ['Electronics', 'Fashion', 'Home & Garden', 'Sports & Outdoors', 'Books', 'Toys']
+BRANDS = ['Samsung', 'Tecno', 'Itel', 'Nokia', 'Hisense', 'Defy', 'Bata', 'Nike', 'Adidas', 'Philips']
+NOUNS = ['phone', 'charger', 'speaker', 'television', 'fridge', 'stove', 'shoes', 'jacket', 'kettle',
+         'blender', 'ball', 'tent', 'novel', 'bicycle', 'radio', 'solar panel', 'battery', 'lamp']
+ADJECTIVES = ['new', 'used', 'refurbished', 'wireless', 'portable', 'large', 'compact', 'classic', 'deluxe']
+SEARCH_URL = '/products?q=new'
+
+
+def seed(db):
+    """One buyer, a few stores sharing the catalogue, and the benchmark seller's order history."""
+    rng = random.Random(7)
+    buyer_id = str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', (buyer_id, 'buyer@streaming.test', '-', 'Streaming Buyer'))
+    store_ids = []
+    for i in range(20):
+        user_id, seller_id = str(uuid.uuid4()), str(uuid.uuid4())
+        db.execute('''
+            INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+        ''', (user_id, f'seller{i}@streaming.test', '-', f'Seller {i}'))
+        db.execute('''
+            INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+            VALUES (?, ?, ?, ?, 1)
+        ''', (seller_id, user_id, f'Store {i}', f'store-{i}'))
+        store_ids.append((user_id, seller_id))
+    internal = {row['seller_id']: row['id'] for row in db.execute('SELECT id, seller_id FROM sellers').fetchall()}
+
+    db.executemany('''
+        INSERT INTO products (product_id, seller_id, category, name, description, price, stock_quantity, rating, review_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(str(uuid.uuid4()), internal[rng.choice(store_ids)[1]], rng.choice(CATEGORIES),
+           f'{rng.choice(ADJECTIVES).title()} {rng.choice(BRANDS)} {rng.choice(NOUNS)}',
+           f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} in good condition, collect in Harare or Bulawayo',
+           round(rng.uniform(5, 2000), 2), rng.randint(0, 50), round(rng.uniform(0, 5), 1), rng.randint(0, 40))
+          for _ in range(args.products)])
+    search_index.rebuild_index(db)
+
+    seller_user, seller_public = store_ids[0]
+    seller_pk = internal[seller_public]
+    products = [row['id'] for row in db.execute('SELECT id FROM products WHERE seller_id = ? LIMIT 200',
+                                                (seller_pk,)).fetchall()]
+    for start in range(0, args.orders, 1000):
+        batch = range(start, min(start + 1000, args.orders))
+        db.executemany('''
+            INSERT INTO orders (order_id, user_id, order_number, total_amount, status, payment_status)
+            VALUES (?, ?, ?, ?, 'confirmed', 'paid')
+        ''', [(str(uuid.uuid4()), buyer_id, f'ORD-{i:08d}', 100.0) for i in batch])
+        orders = db.execute('SELECT id FROM orders ORDER BY id DESC LIMIT ?', (len(batch),)).fetchall()
+        db.executemany('''
+            INSERT INTO order_items (order_item_id, order_id, product_id, seller_id, quantity, unit_price, subtotal)
+            VALUES (?, ?, ?, ?, 1, 100.0, 100.0)
+        ''', [(str(uuid.uuid4()), row['id'], rng.choice(products), seller_pk) for row in orders])
+    seller_stats.rebuild(db)
+    db.commit()
+    return seller_user, seller_public
+
+
+def fetch(client, url, measure_memory=False):
+    """(time to first body byte, total time, bytes, body) of one request read as a browser would."""
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    first, chunks = None, []
+    for chunk in response.response:
+        if chunk and first is None:
+            first = time.perf_counter() - start
+        chunks.append(chunk)
+    response.close()
+    total = time.perf_counter() - start
+    peak = None
+    if measure_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert response.status_code == 200, response.status_code
+    body = b''.join(chunks)
+    return first, total, peak, body
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    zimapp.init_db()
+    start = time.perf_counter()
+    with connection() as db:
+        seller_user, seller_public = seed(db)
+    print(f"Seeded {args.products} products and {args.orders} order items in {time.perf_counter() - start:.1f}s")
+
+    client = zimapp.app.test_client()
+    seller = zimapp.app.test_client()
+    with seller.session_transaction() as session:
+        session['user_id'] = seller_user
+        session['seller_id'] = seller_public
+    pages = [('Search "new"', client, SEARCH_URL), ('Seller orders', seller, '/sellers/orders')]
+    ok = True
+
+    for page_size in args.page_sizes:
+        zimapp.PRODUCTS_PER_PAGE = sellers.ORDERS_PER_PAGE = page_size
+        print(f"\n=== {page_size} rows per page ===")
+        print(f"{'page':<16} {'mode':<9} {'TTFB ms':>9} {'total ms':>9} {'peak MB':>8} {'KB':>7}")
+        for label, page_client, url in pages:
+            results = {}
+            for mode, enabled in (('buffered', False), ('streamed', True)):
+                streaming.ENABLED = enabled
+                fetch(page_client, url)
+                timings = [fetch(page_client, url) for _ in range(args.runs)]
+                _, _, peak, body = fetch(page_client, url, measure_memory=True)
+                ttfb = statistics.median(t[0] for t in timings) * 1000
+                total = statistics.median(t[1] for t in timings) * 1000
+                results[mode] = (ttfb, total, peak, body)
+                print(f"{label:<16} {mode:<9} {ttfb:>9.1f} {total:>9.1f} {peak / 1e6:>8.2f} {len(body) / 1024:>7.0f}")
+            buffered, streamed = results['buffered'], results['streamed']
+            ok &= check(f"{label}: same page either way", buffered[3] == streamed[3])
+            ok &= check(f"{label}: first byte sooner when streamed", streamed[0] < buffered[0],
+                        f"{streamed[0]:.1f} vs {buffered[0]:.1f} ms")
+            if page_size >= 500:
+                ok &= check(f"{label}: less memory when streamed", streamed[2] < buffered[2] / 2,
+                            f"{streamed[2] / 1e6:.2f} vs {buffered[2] / 1e6:.2f} MB")
+
+    with zimapp.app.app_context():
+        print(f"\n   {streaming.stats()}")
+    print(f"\n{'✅ All streaming checks passed' if ok else '❌ Streaming checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Build static assets - fingerprinted copies and .gz/.br variants in static/dist.
+Run before the web server starts (see Procfile) and after changing anything under
+static/ other than uploads; templates pick the new names up from the manifest.
+
+Usage: python scripts/build_assets.py [--static-folder static]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--static-folder', default=os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'static'), help='folder to build from')
+    args = parser.parse_args()
+
+    manifest = assets.build(args.static_folder)
+    dist = os.path.join(args.static_folder, assets.DIST_FOLDER)
+    for logical, hashed in sorted(manifest.items()):
+        sizes = [f"{suffix or 'raw'} {os.path.getsize(os.path.join(args.static_folder, hashed + suffix))}"
+                 for suffix in ('', '.gz', '.br')
+                 if os.path.exists(os.path.join(args.static_folder, hashed + suffix))]
+        print(f"   {logical} -> {hashed} ({', '.join(sizes)} bytes)")
+    print(f"✅ {len(manifest)} assets in {dist}{'' if assets.brotli else ' (no .br: pip install Brotli)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Compact daily sales rollups into weekly/monthly buckets (run nightly from cron).
+Usage: python scripts/compact_sales_rollups.py [--rebuild]
+  --rebuild  recompute all rollups from order_items first (backfill / repair)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import sales_rollups
+
+
+def main():
+    start = time.time()
+
+    with connection() as db:
+        if '--rebuild' in sys.argv[1:]:
+            print("Rebuilding sales rollups from order history...")
+            written = sales_rollups.rebuild(db)
+            print(f"✅ Wrote {written} daily rollup rows (compacted past {sales_rollups.DAILY_RETENTION_DAYS} days)")
+        else:
+            print(f"Compacting daily rollups older than {sales_rollups.compaction_cutoff()}...")
+            compacted = sales_rollups.compact(db)
+            print(f"✅ Compacted {compacted} daily rows")
+
+    print(f"Done in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
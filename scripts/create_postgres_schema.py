@@ -58,7 +58,10 @@ CREATE TABLE IF NOT EXISTS products (
     rating DECIMAL(3,2) DEFAULT 0,
     total_reviews INTEGER DEFAULT 0,
     total_sales INTEGER DEFAULT 0,
+    review_count INTEGER DEFAULT 0,
+    rating_sum INTEGER DEFAULT 0,
     views INTEGER DEFAULT 0,
+    search_vector TSVECTOR,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (seller_id) REFERENCES sellers(id)
@@ -71,10 +74,32 @@ CREATE TABLE IF NOT EXISTS product_images (
     image_path VARCHAR(255) NOT NULL,
     display_order INTEGER DEFAULT 0,
     is_primary BOOLEAN DEFAULT FALSE,
+    variants TEXT,
+    content_hash VARCHAR(64),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
 );
 
+-- Content-addressed image files shared by product_images rows
+CREATE TABLE IF NOT EXISTS image_blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    image_path VARCHAR(255) NOT NULL,
+    byte_size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    variants TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Browse facet counts (read model, maintained incrementally)
+CREATE TABLE IF NOT EXISTS product_facets (
+    category VARCHAR(100) NOT NULL,
+    price_bucket INTEGER NOT NULL,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    in_stock_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, price_bucket)
+);
+
 -- Inventory table
 CREATE TABLE IF NOT EXISTS inventory (
     id SERIAL PRIMARY KEY,
@@ -86,6 +111,84 @@ CREATE TABLE IF NOT EXISTS inventory (
     FOREIGN KEY (product_id) REFERENCES products(id)
 );
 
+-- Inventory reservations (checkout holds with TTL)
+CREATE TABLE IF NOT EXISTS inventory_reservations (
+    id SERIAL PRIMARY KEY,
+    reservation_id VARCHAR(100) UNIQUE NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    order_id INTEGER,
+    user_id VARCHAR(100),
+    status VARCHAR(20) DEFAULT 'held',
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES products(id),
+    FOREIGN KEY (order_id) REFERENCES orders(id)
+);
+
+-- Stripe Checkout Sessions awaiting their webhook (cart snapshot as charged)
+CREATE TABLE IF NOT EXISTS stripe_checkouts (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(255) UNIQUE NOT NULL,
+    user_id VARCHAR(100) NOT NULL,
+    lines TEXT NOT NULL,
+    shipping_cost DECIMAL(10, 2) DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'open',
+    order_id VARCHAR(100),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finalised_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+-- Stripe webhook idempotency (one row per event and per completed session)
+CREATE TABLE IF NOT EXISTS stripe_events (
+    id SERIAL PRIMARY KEY,
+    event_id VARCHAR(255) UNIQUE NOT NULL,
+    session_id VARCHAR(255) UNIQUE,
+    type VARCHAR(100) NOT NULL,
+    status VARCHAR(20) DEFAULT 'received',
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Background job queue (claimed by worker.py with FOR UPDATE SKIP LOCKED)
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    task VARCHAR(255) NOT NULL,
+    args TEXT NOT NULL,
+    priority INTEGER DEFAULT 100,
+    status VARCHAR(20) DEFAULT 'queued',
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 5,
+    run_at TIMESTAMP NOT NULL,
+    locked_by VARCHAR(255),
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    dedupe_key TEXT
+);
+
+-- Cached BNPL credit profiles (credit_profile.py; invalidated on payment events)
+CREATE TABLE IF NOT EXISTS credit_profiles (
+    user_id VARCHAR(100) PRIMARY KEY,
+    profile TEXT NOT NULL,
+    computed_at TIMESTAMP NOT NULL
+);
+
+-- Product views per 5-minute slot for "popular now" (view_counter.py)
+CREATE TABLE IF NOT EXISTS product_view_buckets (
+    product_id VARCHAR(100) NOT NULL,
+    bucket INTEGER NOT NULL,
+    views INTEGER NOT NULL,
+    PRIMARY KEY (product_id, bucket)
+);
+
 -- Cart table
 CREATE TABLE IF NOT EXISTS cart (
     id SERIAL PRIMARY KEY,
@@ -136,6 +239,82 @@ CREATE TABLE IF NOT EXISTS order_items (
     FOREIGN KEY (seller_id) REFERENCES sellers(id)
 );
 
+-- Seller dashboard stats (read model, maintained incrementally)
+CREATE TABLE IF NOT EXISTS seller_stats (
+    seller_id INTEGER PRIMARY KEY,
+    product_count INTEGER DEFAULT 0,
+    order_count INTEGER DEFAULT 0,
+    pending_count INTEGER DEFAULT 0,
+    gross_sales DECIMAL(12,2) DEFAULT 0,
+    last_order_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (seller_id) REFERENCES sellers(id)
+);
+
+-- Sales rollups (daily, compacted into weekly/monthly)
+CREATE TABLE IF NOT EXISTS seller_sales_daily (
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (seller_id, period_start),
+    FOREIGN KEY (seller_id) REFERENCES sellers(id)
+);
+
+CREATE TABLE IF NOT EXISTS seller_sales_weekly (
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (seller_id, period_start),
+    FOREIGN KEY (seller_id) REFERENCES sellers(id)
+);
+
+CREATE TABLE IF NOT EXISTS seller_sales_monthly (
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (seller_id, period_start),
+    FOREIGN KEY (seller_id) REFERENCES sellers(id)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+    product_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (product_id, period_start),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_weekly (
+    product_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (product_id, period_start),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+CREATE TABLE IF NOT EXISTS product_sales_monthly (
+    product_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    period_start DATE NOT NULL,
+    order_count INTEGER DEFAULT 0,
+    units INTEGER DEFAULT 0,
+    revenue DECIMAL(12,2) DEFAULT 0,
+    PRIMARY KEY (product_id, period_start),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
 -- Product Reviews table
 CREATE TABLE IF NOT EXISTS product_reviews (
     id SERIAL PRIMARY KEY,
@@ -261,12 +440,36 @@ CREATE TABLE IF NOT EXISTS seller_commissions (
 CREATE INDEX IF NOT EXISTS idx_products_seller ON products(seller_id);
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
 CREATE INDEX IF NOT EXISTS idx_products_status ON products(status);
+CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN(search_vector);
 CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);
 CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
 CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);
 CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images(product_id);
+CREATE INDEX IF NOT EXISTS idx_product_images_content_hash ON product_images(content_hash);
+CREATE INDEX IF NOT EXISTS idx_reservations_expiry ON inventory_reservations(status, expires_at);
+CREATE INDEX IF NOT EXISTS idx_reservations_order ON inventory_reservations(order_id, status);
+CREATE INDEX IF NOT EXISTS idx_reservations_user ON inventory_reservations(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_status ON stripe_events(status, received_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, run_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(status, finished_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs(dedupe_key);
 CREATE INDEX IF NOT EXISTS idx_deliveries_transporter ON deliveries(transporter_id);
 CREATE INDEX IF NOT EXISTS idx_deliveries_status ON deliveries(status);
+
+-- Keyset pagination (one index per listing sort order)
+CREATE INDEX IF NOT EXISTS idx_products_status_created ON products(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_status_price ON products(status, price, id);
+CREATE INDEX IF NOT EXISTS idx_products_status_rating ON products(status, rating, id);
+CREATE INDEX IF NOT EXISTS idx_products_category_created ON products(category, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_seller_created ON products(seller_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_order_items_seller_created ON order_items(seller_id, created_at, id);
+
+-- Sales rollups: a seller's products per bucket
+CREATE INDEX IF NOT EXISTS idx_product_sales_daily_seller ON product_sales_daily(seller_id, period_start);
+CREATE INDEX IF NOT EXISTS idx_product_sales_weekly_seller ON product_sales_weekly(seller_id, period_start);
+CREATE INDEX IF NOT EXISTS idx_product_sales_monthly_seller ON product_sales_monthly(seller_id, period_start);
+CREATE INDEX IF NOT EXISTS idx_product_view_buckets_bucket ON product_view_buckets(bucket);
 """
 
 if __name__ == '__main__':
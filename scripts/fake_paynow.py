@@ -0,0 +1,171 @@
+"""
+Fake Paynow server for local development and tests - no Paynow account needed.
+Implements mobile transaction initiation and poll URLs (signed like Paynow's), and
+can post result callbacks to the transaction's result URL.
+
+Outcome by phone number (Paynow's sandbox test numbers):
+    0771111111  paid after --approve-after seconds
+    0772222222  paid after 30 seconds (slow approval)
+    0773333333  cancelled by the customer
+    0774444444  failed (insufficient balance)
+    anything else: paid after --approve-after seconds
+
+Usage: python scripts/fake_paynow.py [--port 8765] [--approve-after 6] [--callbacks]
+Then:  PAYNOW_API_URL=http://localhost:8765 python app.py  (and python worker.py)
+       GET /stats for request counts.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+
+
+def parse_args():
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+    default_key = ''
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            default_key = json.load(f).get('paynow', {}).get('integration_key', '')
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--key', default=default_key, help='integration key to sign with (default: config.json)')
+    parser.add_argument('--approve-after', type=float, default=6, help='seconds before a payment is approved')
+    parser.add_argument('--callbacks', action='store_true', help='POST the final status to the result URL')
+    return parser.parse_args()
+
+
+args = parse_args()
+
+OUTCOMES = {
+    '0771111111': ('Paid', None),
+    '0772222222': ('Paid', 30),
+    '0773333333': ('Cancelled', None),
+    '0774444444': ('Failed', None),
+}
+
+transactions = {}
+lock = threading.Lock()
+stats = {'initiated': 0, 'polls': 0, 'callbacks': 0}
+
+
+def sign(fields):
+    """Paynow hash: SHA-512 of the values in order, then the (lower-cased) integration key."""
+    signed = ''.join(str(value) for key, value in fields if key.lower() != 'hash') + args.key.lower()
+    return hashlib.sha512(signed.encode('utf-8')).hexdigest().upper()
+
+
+def signed_body(fields):
+    return urlencode(fields + [('hash', sign(fields))])
+
+
+def current_status(txn):
+    if time.time() < txn['settles_at']:
+        return 'Sent'
+    return txn['outcome']
+
+
+def status_fields(guid, txn):
+    return [
+        ('reference', txn['reference']),
+        ('paynowreference', txn['paynowreference']),
+        ('amount', txn['amount']),
+        ('status', current_status(txn)),
+        ('pollurl', txn['pollurl']),
+    ]
+
+
+def send_callback(guid):
+    txn = transactions[guid]
+    time.sleep(max(0, txn['settles_at'] - time.time()) + 0.1)
+    try:
+        requests.post(txn['resulturl'], data=signed_body(status_fields(guid, txn)),
+                      headers={'Content-Type': 'application/x-www-form-urlencoded'}, timeout=10)
+        with lock:
+            stats['callbacks'] += 1
+    except requests.RequestException as e:
+        print(f"⚠️ Callback to {txn['resulturl']} failed: {e}")
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _reply(self, body, content_type='application/x-www-form-urlencoded'):
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/stats':
+            with lock:
+                self._reply(json.dumps({**stats, 'transactions': len(transactions)}), 'application/json')
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+
+        if url.path in ('/interface/remotetransaction', '/interface/initiatetransaction'):
+            outcome, delay = OUTCOMES.get(form.get('phone', ''), ('Paid', None))
+            guid = str(uuid.uuid4())
+            host = self.headers.get('Host', f'localhost:{args.port}')
+            txn = {
+                'reference': form.get('reference', ''),
+                'paynowreference': str(10000000 + len(transactions)),
+                'amount': form.get('amount', '0'),
+                'resulturl': form.get('resulturl', ''),
+                'pollurl': f'http://{host}/interface/poll?guid={guid}',
+                'outcome': outcome,
+                'settles_at': time.time() + (args.approve_after if delay is None else delay),
+            }
+            with lock:
+                transactions[guid] = txn
+                stats['initiated'] += 1
+
+            fields = [('status', 'Ok'), ('instructions', 'Dial *151*2*4# to approve'),
+                      ('paynowreference', txn['paynowreference']), ('pollurl', txn['pollurl'])]
+            self._reply(signed_body(fields))
+
+            if args.callbacks and txn['resulturl']:
+                threading.Thread(target=send_callback, args=(guid,), daemon=True).start()
+
+        elif url.path == '/interface/poll':
+            guid = dict(parse_qsl(url.query)).get('guid')
+            txn = transactions.get(guid)
+            if not txn:
+                self._reply(urlencode([('status', 'Error'), ('error', 'Invalid transaction')]))
+                return
+            with lock:
+                stats['polls'] += 1
+            self._reply(signed_body(status_fields(guid, txn)))
+
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *log_args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    print(f"✅ Fake Paynow listening on http://127.0.0.1:{args.port} "
+          f"(approve after {args.approve_after}s, callbacks {'on' if args.callbacks else 'off'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
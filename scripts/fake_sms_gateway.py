@@ -0,0 +1,130 @@
+"""
+Fake Africa's Talking SMS gateway for local development and tests - nothing is sent.
+Accepts POST /version1/messaging like the real API and answers with per-recipient
+statuses; can inject failed calls, retryable recipients, latency and rate limiting
+so sms.py's batching and retries can be exercised.
+
+Usage: python scripts/fake_sms_gateway.py [--port 8766] [--latency-ms 50] [--fail-rate 0.1]
+                                          [--retry-rate 0.05] [--max-calls-per-second 20]
+Then:  SMS_API_URL=http://localhost:8766 AFRICASTALKING_API_KEY=fake python worker.py
+       GET /stats for call and message counts.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency-ms', type=float, default=50, help='time each API call takes')
+    parser.add_argument('--fail-rate', type=float, default=0, help='fraction of calls answered with a 500')
+    parser.add_argument('--retry-rate', type=float, default=0,
+                        help='fraction of recipients answered with a retryable statusCode 500')
+    parser.add_argument('--max-calls-per-second', type=float, default=0, help='answer 429 above this rate (0: off)')
+    return parser.parse_args()
+
+
+args = parse_args()
+
+lock = threading.Lock()
+stats = {'calls': 0, 'failed_calls': 0, 'throttled_calls': 0, 'messages': 0, 'retryable': 0,
+         'max_recipients': 0, 'recipients': {}}
+call_times = []
+
+
+def throttled():
+    if not args.max_calls_per_second:
+        return False
+    now = time.monotonic()
+    with lock:
+        while call_times and call_times[0] < now - 1:
+            call_times.pop(0)
+        if len(call_times) >= args.max_calls_per_second:
+            return True
+        call_times.append(now)
+    return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/stats':
+            with lock:
+                self._reply(200, {**stats, 'recipients': len(stats['recipients']),
+                                  'max_per_recipient': max(stats['recipients'].values(), default=0)})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/version1/messaging':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(parse_qsl(self.rfile.read(length).decode('utf-8')))
+        numbers = [number for number in form.get('to', '').split(',') if number]
+
+        if not self.headers.get('apiKey'):
+            self._reply(401, {'error': 'The supplied authentication is invalid'})
+            return
+        if throttled():
+            with lock:
+                stats['throttled_calls'] += 1
+            self._reply(429, {'error': 'Too many requests'})
+            return
+
+        time.sleep(args.latency_ms / 1000)
+        with lock:
+            stats['calls'] += 1
+            stats['max_recipients'] = max(stats['max_recipients'], len(numbers))
+        if random.random() < args.fail_rate:
+            with lock:
+                stats['failed_calls'] += 1
+            self._reply(500, {'error': 'Internal error'})
+            return
+
+        recipients = []
+        for number in numbers:
+            if random.random() < args.retry_rate:
+                recipients.append({'number': number, 'statusCode': 500, 'status': 'InternalServerError',
+                                   'cost': '0', 'messageId': 'None'})
+                continue
+            recipients.append({'number': number, 'statusCode': 101, 'status': 'Success',
+                               'cost': 'USD 0.0100', 'messageId': f'ATXid_{random.getrandbits(64):x}'})
+        with lock:
+            sent = [r['number'] for r in recipients if r['statusCode'] == 101]
+            stats['messages'] += len(sent)
+            stats['retryable'] += len(numbers) - len(sent)
+            for number in sent:
+                stats['recipients'][number] = stats['recipients'].get(number, 0) + 1
+        self._reply(201, {'SMSMessageData': {'Message': f'Sent to {len(sent)}/{len(numbers)}',
+                                             'Recipients': recipients}})
+
+    def log_message(self, format, *log_args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    print(f"✅ Fake SMS gateway listening on http://127.0.0.1:{args.port} "
+          f"(latency {args.latency_ms:g}ms, fail rate {args.fail_rate:g}, retry rate {args.retry_rate:g})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
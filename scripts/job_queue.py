@@ -0,0 +1,47 @@
+"""
+Inspect and operate the background job queue.
+
+Usage: python scripts/job_queue.py stats          # depth, backlog, latency
+       python scripts/job_queue.py failed         # permanently failed jobs
+       python scripts/job_queue.py retry [JOB_ID] # re-queue failed jobs
+       python scripts/job_queue.py run            # run due jobs inline, then exit
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import app as zimapp  # registers every @jobs.task
+import jobs
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    zimapp.init_db()
+
+    with connection() as db:
+        if command == 'stats':
+            print(json.dumps(jobs.stats(db), indent=2))
+        elif command == 'failed':
+            rows = db.execute('''
+                SELECT id, task, attempts, finished_at, last_error FROM jobs
+                WHERE status = ? ORDER BY id
+            ''', (jobs.FAILED,)).fetchall()
+            for row in rows:
+                print(f"#{row['id']} {row['task']} ({row['attempts']} attempts, {row['finished_at']}): {row['last_error']}")
+            print(f"{'❌' if rows else '✅'} {len(rows)} failed job(s)")
+        elif command == 'retry':
+            job_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+            print(f"✅ Re-queued {jobs.retry_failed(db, job_id)} job(s)")
+        elif command == 'run':
+            print(f"✅ Ran {jobs.run_pending(db)} job(s)")
+        else:
+            print(__doc__)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Finalise Stripe checkouts whose webhook was recorded but never processed
+(worker restarted mid-way, database error). Safe to run at any time, e.g. from cron:
+python scripts/process_stripe_events.py [--older-than SECONDS]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import stripe_orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--older-than', type=int, default=60,
+                        help='only events received at least this many seconds ago')
+    args = parser.parse_args()
+
+    with connection() as db:
+        processed = stripe_orders.process_pending(db, older_than_seconds=args.older_than)
+        failed = db.execute('''
+            SELECT session_id, user_id, error FROM stripe_checkouts WHERE status = ?
+        ''', (stripe_orders.FAILED,)).fetchall()
+
+    print(f"✅ Processed {processed} pending Stripe event(s)")
+    if failed:
+        print(f"⚠️  {len(failed)} paid checkout(s) could not be fulfilled and need a refund:")
+        for row in failed:
+            print(f"   {row['session_id']} (user {row['user_id']}): {row['error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Rebuild the product_facets summary (browse counts per category and price bucket).
+Backfill, repair drift or apply new price buckets: python scripts/rebuild_facets.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import facets
+
+
+def main():
+    start = time.time()
+
+    with connection() as db:
+        print("Rebuilding browse facets...")
+        count = facets.rebuild(db)
+
+    print(f"✅ Rebuilt {count} facet rows in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
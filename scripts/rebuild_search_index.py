@@ -0,0 +1,28 @@
+"""
+Rebuild the full-text product search index from the products table.
+Run after bulk imports or restoring a backup: python scripts/rebuild_search_index.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection, DB_TYPE
+import search
+
+
+def main():
+    print(f"Rebuilding product search index ({DB_TYPE})...")
+    start = time.time()
+
+    with connection() as db:
+        search.init_search_index(db)
+        count = search.rebuild_index(db)
+
+    print(f"✅ Indexed {count} products in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
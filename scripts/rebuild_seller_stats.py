@@ -0,0 +1,37 @@
+"""
+Rebuild the seller_stats read model from products and order_items.
+Backfill or repair drift: python scripts/rebuild_seller_stats.py [seller_id]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import seller_stats
+
+
+def main():
+    store = sys.argv[1] if len(sys.argv) > 1 else None
+    start = time.time()
+
+    with connection() as db:
+        seller_id = None
+        if store:
+            seller = db.execute('SELECT id FROM sellers WHERE seller_id = ? OR store_slug = ?',
+                                (store, store)).fetchone()
+            if not seller:
+                print(f"❌ Seller not found: {store}")
+                sys.exit(1)
+            seller_id = seller['id']
+
+        print("Rebuilding seller stats...")
+        count = seller_stats.rebuild(db, seller_id)
+
+    print(f"✅ Rebuilt stats for {count} sellers in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""
+Reconcile denormalised product rating aggregates against product_reviews.
+Safe to run any time (e.g. nightly): python scripts/reconcile_ratings.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import ratings
+
+
+def main():
+    print("Reconciling product rating aggregates...")
+
+    with connection() as db:
+        repaired = ratings.reconcile(db)
+
+    if repaired:
+        print(f"⚠️ Repaired drift on {repaired} products")
+    else:
+        print("✅ All product ratings in sync")
+
+
+if __name__ == '__main__':
+    main()
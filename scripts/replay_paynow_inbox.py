@@ -0,0 +1,64 @@
+"""
+Re-process stored Paynow notifications, e.g. after fixing a payment transition bug.
+Transitions are idempotent, so replaying already-applied notifications is safe.
+
+Usage: python scripts/replay_paynow_inbox.py [--agreement AGREEMENT_ID] [--since 'YYYY-MM-DD HH:MM:SS']
+                                             [--inline] [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connection
+import app as zimapp  # registers every @jobs.task
+import jobs
+import paynow_inbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--agreement', help='only this agreement (public agreement_id)')
+    parser.add_argument('--since', help='only notifications received at or after this UTC time')
+    parser.add_argument('--inline', action='store_true', help='apply now instead of leaving it to the worker')
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be replayed')
+    args = parser.parse_args()
+
+    if not args.agreement and not args.since:
+        print("⚠️  Replaying the whole inbox")
+
+    zimapp.init_db()
+    with connection() as db:
+        if args.dry_run:
+            where, params = ['1 = 1'], []
+            if args.agreement:
+                where.append('agreement_id = ?')
+                params.append(args.agreement)
+            if args.since:
+                where.append('received_at >= ?')
+                params.append(args.since)
+            row = db.execute(f'''
+                SELECT COUNT(*) AS notifications, COUNT(DISTINCT agreement_id) AS agreements
+                FROM paynow_inbox WHERE {' AND '.join(where)}
+            ''', params).fetchone()
+            print(f"Would replay {row['notifications']} notification(s) for {row['agreements']} agreement(s)")
+            return
+
+        notifications, agreements = paynow_inbox.replay(db, args.agreement, args.since)
+        print(f"✅ Queued {notifications} notification(s) for {agreements} agreement(s)")
+
+        if args.inline:
+            print(f"✅ Ran {jobs.run_pending(db)} job(s)")
+
+        outcomes = db.execute('''
+            SELECT outcome, COUNT(*) AS notifications FROM paynow_inbox
+            WHERE processed_at IS NOT NULL GROUP BY outcome
+        ''').fetchall()
+        for row in outcomes:
+            print(f"   {row['outcome']}: {row['notifications']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Inventory reservation stress test - N parallel checkouts racing for scarce stock.
+Proves the compare-and-set reservations never oversell and that expired holds return
+to stock. Runs against a throwaway SQLite database unless --database-url is given.
+
+Usage: python scripts/stress_inventory.py [--checkouts 200] [--workers 32]
+                                          [--products 5] [--stock 40] [--database-url URL]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--checkouts', type=int, default=200, help='parallel checkout attempts')
+    parser.add_argument('--workers', type=int, default=32, help='concurrent threads')
+    parser.add_argument('--products', type=int, default=5, help='hot products competed for')
+    parser.add_argument('--stock', type=int, default=40, help='units of each product')
+    parser.add_argument('--abandon', type=float, default=0.2, help='fraction of checkouts that never pay')
+    parser.add_argument('--database-url', help='database to use (default: temporary SQLite file)')
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+os.environ['DB_POOL_SIZE'] = str(args.workers)
+
+from database import connection
+import app as zimapp
+import inventory
+
+
+def create_fixtures(db):
+    """One seller with `--products` products of `--stock` units each."""
+    user_id = str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug)
+        VALUES (?, ?, ?, ?)
+    ''', (str(uuid.uuid4()), user_id, 'Stress Store', f'stress-{user_id[:8]}'))
+    seller = db.execute('SELECT id FROM sellers WHERE user_id = ?', (user_id,)).fetchone()
+
+    product_ids = []
+    for i in range(args.products):
+        public_id = str(uuid.uuid4())
+        db.execute('''
+            INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (public_id, seller['id'], f'Flash Sale Item {i}', 'Electronics', 10.0, args.stock))
+        product = db.execute('SELECT id FROM products WHERE product_id = ?', (public_id,)).fetchone()
+        db.execute('''
+            INSERT INTO inventory (inventory_id, product_id, quantity_available)
+            VALUES (?, ?, ?)
+        ''', (str(uuid.uuid4()), product['id'], args.stock))
+        product_ids.append(product['id'])
+    db.commit()
+    return product_ids
+
+
+def checkout(n, product_ids, results, lock):
+    """One customer: reserve a random basket, then pay (commit) or abandon."""
+    rng = random.Random(n)
+    basket = [(product_id, rng.randint(1, 3)) for product_id in rng.sample(product_ids, rng.randint(1, len(product_ids)))]
+    abandon = rng.random() < args.abandon
+    start = time.perf_counter()
+
+    with connection() as db:
+        try:
+            # Negative ids stand in for orders so reservations can be committed per checkout
+            inventory.reserve(db, basket, order_id=-(n + 1), user_id=f'stress-{n}')
+            if not abandon:
+                inventory.commit_order(db, -(n + 1))
+            db.commit()
+            outcome = 'abandoned' if abandon else 'sold'
+        except inventory.InsufficientStock:
+            db.rollback()
+            outcome = 'rejected'
+
+    elapsed = time.perf_counter() - start
+    with lock:
+        results[outcome].append((basket, elapsed))
+
+
+def check(label, condition):
+    print(f"{'✅' if condition else '❌'} {label}")
+    return condition
+
+
+def main():
+    print(f"Database: {os.environ['DATABASE_URL']}")
+    zimapp.init_db()
+
+    with connection() as db:
+        product_ids = create_fixtures(db)
+
+    print(f"Racing {args.checkouts} checkouts on {args.workers} threads for "
+          f"{args.products} products x {args.stock} units...")
+    results = {'sold': [], 'abandoned': [], 'rejected': []}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(checkout, n, product_ids, results, lock) for n in range(args.checkouts)]
+        for future in futures:
+            future.result()  # surface worker errors (e.g. lock timeouts)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for outcome in results.values() for _, t in outcome)
+    print(f"\n{len(results['sold'])} sold, {len(results['abandoned'])} held then abandoned, "
+          f"{len(results['rejected'])} rejected in {elapsed:.2f}s "
+          f"({args.checkouts / elapsed:.0f} checkouts/s)")
+    print(f"Latency p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms")
+
+    def units(outcome):
+        totals = dict.fromkeys(product_ids, 0)
+        for basket, _ in results[outcome]:
+            for product_id, quantity in basket:
+                totals[product_id] += quantity
+        return totals
+
+    sold, held = units('sold'), units('abandoned')
+    ok = True
+
+    print("\n=== After checkout race ===")
+    with connection() as db:
+        for product_id in product_ids:
+            row = db.execute('''
+                SELECT i.quantity_available, i.quantity_reserved, p.stock_quantity
+                FROM inventory i JOIN products p ON p.id = i.product_id
+                WHERE i.product_id = ?
+            ''', (product_id,)).fetchone()
+            on_hand, reserved = row['quantity_available'], row['quantity_reserved']
+            ok &= check(f"product {product_id}: sold {sold[product_id]} + held {held[product_id]} "
+                        f"<= stock {args.stock}, on hand {on_hand}, reserved {reserved}",
+                        sold[product_id] + held[product_id] <= args.stock
+                        and on_hand == args.stock - sold[product_id]
+                        and reserved == held[product_id]
+                        and row['stock_quantity'] == on_hand)
+
+        # Abandoned holds lapse: age them past their TTL and expire
+        db.execute("UPDATE inventory_reservations SET expires_at = '2000-01-01 00:00:00' WHERE status = 'held'")
+        db.commit()
+        expired = inventory.expire_reservations(db)
+
+        print("\n=== After expiring abandoned holds ===")
+        print(f"Expired holds on {expired} products")
+        for product_id in product_ids:
+            row = db.execute('''
+                SELECT quantity_available, quantity_reserved FROM inventory WHERE product_id = ?
+            ''', (product_id,)).fetchone()
+            on_hand, reserved = row['quantity_available'], row['quantity_reserved']
+            ok &= check(f"product {product_id}: on hand {on_hand}, reserved {reserved}",
+                        on_hand == args.stock - sold[product_id] and reserved == 0)
+
+    print(f"\n{'✅ No overselling' if ok else '❌ Inventory invariants violated'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Product view counter stress test - concurrent viewers, buffered vs. per-view UPDATE.
+Records views from many threads the old way (UPDATE + commit per view) and through
+view_counter's buffer, reports views/second for both, and checks the buffered
+totals and "popular now" ordering are exact. Then checks a worker that exits flushes
+its buffer, and one that is killed loses at most FLUSH_EVENTS views.
+Runs against a throwaway SQLite database unless --database-url is given.
+
+Usage: python scripts/stress_product_views.py [--views 20000] [--workers 16] [--products 50]
+                                              [--database-url URL]
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--views', type=int, default=20000, help='views per run')
+    parser.add_argument('--workers', type=int, default=16, help='concurrent viewer threads')
+    parser.add_argument('--products', type=int, default=50, help='products viewed')
+    parser.add_argument('--database-url', help='database to use (default: temporary SQLite file)')
+    # Internal: run as a short-lived viewer process for the restart checks
+    parser.add_argument('--viewer', nargs=2, metavar=('PRODUCT_ID', 'VIEWS'), help=argparse.SUPPRESS)
+    parser.add_argument('--crash', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'views.db')
+os.environ['DB_POOL_SIZE'] = str(args.workers + 2)
+
+from database import connection
+import app as zimapp
+import view_counter
+
+
+def create_products(db, count):
+    user_id = str(uuid.uuid4())
+    seller_pk = db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug)
+        VALUES (?, ?, 'Views Store', ?) RETURNING id
+    ''', (str(uuid.uuid4()), user_id, f'views-{user_id[:8]}')).fetchone()['id']
+    product_ids = [str(uuid.uuid4()) for _ in range(count)]
+    db.executemany('''
+        INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+        VALUES (?, ?, ?, 'Electronics', 10, 5)
+    ''', [(product_id, seller_pk, f'Viewed item {i}') for i, product_id in enumerate(product_ids)])
+    db.commit()
+    return product_ids
+
+
+def workload(product_ids, views):
+    """Skewed views: product i is picked with weight 1/(i+1), so the first is the most popular."""
+    random.seed(7)
+    return random.choices(product_ids, weights=[1 / (i + 1) for i in range(len(product_ids))], k=views)
+
+
+def update_per_view(product_id):
+    with connection() as db:
+        db.execute('UPDATE products SET views = views + 1 WHERE product_id = ?', (product_id,))
+        db.commit()
+
+
+def run(record, views):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(record, views))
+    return len(views) / (time.perf_counter() - start)
+
+
+def totals(product_ids):
+    with connection() as db:
+        rows = db.execute(f'''
+            SELECT product_id, views FROM products WHERE product_id IN ({', '.join('?' * len(product_ids))})
+        ''', product_ids).fetchall()
+    return {row['product_id']: row['views'] for row in rows}
+
+
+def viewer(product_id, views, crash):
+    """Record views like a web worker, then exit normally or die without cleanup."""
+    for _ in range(views):
+        view_counter.record(product_id)
+    if crash:
+        os._exit(0)
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    zimapp.init_db()
+    ok = True
+    with connection() as db:
+        old_products = create_products(db, args.products)
+        new_products = create_products(db, args.products)
+
+    print(f"=== {args.views} views from {args.workers} threads ===")
+    per_view = run(update_per_view, workload(old_products, args.views))
+    print(f"   UPDATE per view: {per_view:.0f} views/s")
+
+    views = workload(new_products, args.views)
+    buffered = run(view_counter.record, views)
+    flush_start = time.perf_counter()
+    view_counter.flush()
+    print(f"   buffered:        {buffered:.0f} views/s (final flush {time.perf_counter() - flush_start:.3f}s)")
+    print(f"   {buffered / per_view:.0f}x faster; {view_counter.stats()}")
+
+    expected = {product_id: views.count(product_id) for product_id in new_products}
+    ok &= check("Every buffered view reached products.views", totals(new_products) == expected)
+    with connection() as db:
+        popular = [row['product_id'] for row in view_counter.trending(db, limit=5)]
+    ranked = sorted(new_products, key=lambda product_id: (-expected[product_id], product_id))
+    ok &= check("Popular now ranks by recent views",
+                [expected[product_id] for product_id in popular] == [expected[product_id] for product_id in ranked[:5]],
+                popular)
+
+    print("\n=== Worker restarts ===")
+    for crash, label in ((False, "A worker that exits flushes its buffer"),
+                         (True, "A killed worker loses at most FLUSH_EVENTS views")):
+        product_id = new_products[-1]
+        before = totals([product_id])[product_id]
+        count = view_counter.FLUSH_EVENTS * 3 + 17
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--database-url', os.environ['DATABASE_URL'],
+                        '--viewer', product_id, str(count)] + (['--crash'] if crash else []),
+                       check=True, stdout=subprocess.DEVNULL)
+        written = totals([product_id])[product_id] - before
+        lost = count - written
+        print(f"   {'killed' if crash else 'exited'}: {written} of {count} views written")
+        ok &= check(label, lost == 0 if not crash else 0 <= lost <= view_counter.FLUSH_EVENTS, lost)
+
+    print(f"\n{'✅ All view counter checks passed' if ok else '❌ View counter checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    if args.viewer:
+        viewer(args.viewer[0], int(args.viewer[1]), args.crash)
+    else:
+        main()
@@ -0,0 +1,194 @@
+"""
+BNPL reminder scheduler test - reminders, late fees, defaults and bulk SMS delivery.
+Seeds active agreements with installments due soon, overdue and long overdue, starts
+scripts/fake_sms_gateway.py (with failed calls and retryable recipients), and runs
+the scheduler until everything is delivered, checking that no customer is charged or
+texted twice, that My Agreements shows the late fee and paying an overdue installment
+collects it, and that defaulted installments can't be marked paid. Reports SMS throughput. Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_bnpl_reminders.py [--agreements 2000] [--fail-rate 0.1] [--retry-rate 0.05]
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+import requests
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTS))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--agreements', type=int, default=2000, help='active agreements to seed')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='fake gateway: fraction of failed calls')
+    parser.add_argument('--retry-rate', type=float, default=0.05, help='fake gateway: retryable recipients')
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+args = parse_args()
+PORT = free_port()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'reminders.db')
+os.environ['SMS_API_URL'] = f'http://127.0.0.1:{PORT}'
+os.environ['AFRICASTALKING_API_KEY'] = 'fake-key'
+os.environ['SMS_RATE_LIMIT'] = '50'
+
+from database import connection
+import app as zimapp
+import bnpl_installments
+import bnpl_reminders
+import sms
+
+sms.BACKOFF_SECONDS = 0.05
+
+TODAY = date.today()
+SETTINGS = bnpl_reminders.SETTINGS
+# Installment due dates by scenario, relative to today
+SCENARIOS = {
+    'reminder': TODAY + timedelta(days=1),
+    'late_fee': TODAY - timedelta(days=SETTINGS['grace_period_days'] + 2),
+    'default': TODAY - timedelta(days=SETTINGS['default_after_days'] + 5),
+    'not_due': TODAY + timedelta(days=SETTINGS['reminder_days_before'] + 7),
+}
+
+
+def seed(db, count):
+    """One user and active agreement per scenario in turn, each with one open installment."""
+    expected = dict.fromkeys(SCENARIOS, 0)
+    names = list(SCENARIOS)
+    users, agreements = [], []
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        users.append((user_id, f'{user_id}@reminders.test', '-', 'Reminder Buyer', f'07{71000000 + i}'))
+        agreements.append((user_id, names[i % len(names)]))
+    db.executemany('''
+        INSERT INTO users (user_id, email, password_hash, full_name, phone) VALUES (?, ?, ?, ?, ?)
+    ''', users)
+    for user_id, scenario in agreements:
+        pk = db.execute('''
+            INSERT INTO bnpl_agreements
+            (agreement_id, user_id, principal_amount, fee_amount, total_amount,
+             installment_amount, installments, duration_weeks, fee_percent, status)
+            VALUES (?, ?, 60, 3, 63, 31.5, 2, 2, 5, 'active') RETURNING id
+        ''', (str(uuid.uuid4()), user_id)).fetchone()['id']
+        db.executemany('''
+            INSERT INTO bnpl_installments (agreement_id, installment_number, amount, due_date, status)
+            VALUES (?, ?, 31.5, ?, ?)
+        ''', [(pk, 1, (SCENARIOS[scenario] - timedelta(days=7)).isoformat(), 'paid'),
+              (pk, 2, SCENARIOS[scenario].isoformat(), 'pending')])
+        expected[scenario] += 1
+    db.commit()
+    return expected
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    gateway = subprocess.Popen([sys.executable, os.path.join(SCRIPTS, 'fake_sms_gateway.py'), '--port', str(PORT),
+                                '--latency-ms', '20', '--fail-rate', str(args.fail_rate),
+                                '--retry-rate', str(args.retry_rate)], stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                requests.get(f'{os.environ["SMS_API_URL"]}/stats', timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+        run(gateway)
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+
+def run(gateway):
+    zimapp.init_db()
+    ok = True
+
+    with connection() as db:
+        expected = seed(db, args.agreements)
+        print(f"Seeded {args.agreements} agreements: {expected}")
+
+        print("\n=== Scheduler runs ===")
+        totals = dict.fromkeys(['late_fees', 'defaulted', 'reminders', 'overdue_notices'], 0)
+        start = time.perf_counter()
+        for attempt in range(1, 6):
+            summary = bnpl_reminders.run_once(db, TODAY)
+            print(f"   run {attempt}: {summary}")
+            for key in totals:
+                totals[key] += summary[key]
+            if not summary['undelivered']:
+                break
+        elapsed = time.perf_counter() - start
+
+        ok &= check("Late fees applied once per overdue installment", totals['late_fees'] == expected['late_fee'],
+                    totals)
+        ok &= check("Long-overdue agreements defaulted", totals['defaulted'] == expected['default'], totals)
+        ok &= check("Every reminder delivered", totals['reminders'] == expected['reminder'], totals)
+        ok &= check("Every overdue notice delivered", totals['overdue_notices'] == expected['late_fee'], totals)
+
+        again = bnpl_reminders.run_once(db, TODAY)
+        ok &= check("Another run charges and texts nobody", again['late_fees'] == again['defaulted']
+                    == again['reminders'] == again['overdue_notices'] == 0, again)
+
+        defaulted = db.execute('''
+            SELECT COUNT(*) AS n FROM bnpl_installments bi JOIN bnpl_agreements ba ON ba.id = bi.agreement_id
+            WHERE ba.status = 'defaulted' AND bi.status = 'defaulted'
+        ''').fetchone()['n']
+        ok &= check("Defaulted agreements' installments left the due index", defaulted == expected['default'])
+
+        print("\n=== Paying ===")
+        overdue, defaulted = (db.execute('''
+            SELECT ba.id, ba.agreement_id, ba.user_id, bi.installment_number, bi.amount FROM bnpl_installments bi
+            JOIN bnpl_agreements ba ON ba.id = bi.agreement_id WHERE bi.status = ? LIMIT 1
+        ''', (status,)).fetchone() for status in ('overdue', 'defaulted'))
+        client = zimapp.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = overdue['user_id']
+        page = client.get('/bnpl/my-agreements')
+        fee = f"ZWL {SETTINGS['late_fee']:.2f}"
+        ok &= check("My Agreements shows the overdue installment and its fee",
+                    page.status_code == 200 and 'Overdue' in page.text and fee in page.text, page.status_code)
+        paid = client.post(f"/bnpl/pay-installment/{overdue['agreement_id']}",
+                           json={'installment_number': overdue['installment_number']})
+        charged = db.execute('''
+            SELECT amount FROM bnpl_payments WHERE agreement_id = ? AND installment_number = ?
+        ''', (overdue['id'], overdue['installment_number'])).fetchone()
+        ok &= check("Paying an overdue installment collects the late fee",
+                    paid.json['success'] and charged['amount'] == overdue['amount'] + SETTINGS['late_fee'],
+                    (paid.json, dict(charged) if charged else None))
+        again = client.post(f"/bnpl/pay-installment/{overdue['agreement_id']}",
+                            json={'installment_number': overdue['installment_number']})
+        ok &= check("...once", again.status_code == 400, again.status_code)
+        ok &= check("Defaulted installments are not marked paid",
+                    not bnpl_installments.mark_paid(db, defaulted['id'], defaulted['installment_number']))
+        db.rollback()
+
+    stats = requests.get(f'{os.environ["SMS_API_URL"]}/stats', timeout=5).json()
+    ok &= check("No customer texted twice", stats['max_per_recipient'] == 1, stats)
+    texts = totals['reminders'] + totals['overdue_notices']
+    print(f"\n   {texts} texts in {stats['calls']} API calls (largest batch {stats['max_recipients']}), "
+          f"{stats['failed_calls']} failed calls and {stats['retryable']} retryable recipients injected")
+    print(f"   {texts / elapsed:.0f} messages/s end to end; sms stats: {sms.stats()}")
+
+    print(f"\n{'✅ All reminder checks passed' if ok else '❌ Reminder checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
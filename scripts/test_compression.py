@@ -0,0 +1,154 @@
+"""
+Compression test - gzip/br negotiation, skipped responses and streamed bodies.
+Requests pages and JSON through the Flask test client with and without
+Accept-Encoding and checks what comes back compressed, what is left alone (small
+bodies, images, precompressed static files, 304s) and that every body decompresses
+to the original. Checks repeat requests for an unchanged page reuse the compressed
+bytes, that a streamed response arrives compressed chunk by chunk, and reports
+the bytes saved. Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_compression.py
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+
+from PIL import Image
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'compression.db')
+os.environ['METRICS_TOKEN'] = 'compression-test'
+
+from flask import Response, stream_with_context
+import app as zimapp
+import assets
+import compression
+
+STATIC = os.path.join(WORKDIR, 'static')
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+METRICS = {'Authorization': 'Bearer compression-test'}
+STREAM_CHUNKS = 20
+
+
+@zimapp.app.route('/_test/stream')
+def streamed_page():
+    def rows():
+        yield '<html><body><ul>'
+        for i in range(STREAM_CHUNKS):
+            yield ''.join(f'<li class="row">Listing {i}-{j}, Harare</li>' for j in range(20))
+        yield '</ul></body></html>'
+    return Response(stream_with_context(rows()), mimetype='text/html')
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    zimapp.init_db()
+    shutil.copytree(os.path.join(REPO, 'static'), STATIC,
+                    ignore=lambda folder, names: [name for name in names if name in assets.SKIP_FOLDERS])
+    zimapp.app.static_folder = STATIC
+    client = zimapp.app.test_client()
+    ok = True
+
+    print("=== Negotiation ===")
+    for label, url in (('Home page', '/'), ('Browse page', '/products'), ('Metrics JSON', '/api/metrics')):
+        auth = METRICS if url == '/api/metrics' else {}
+        plain = client.get(url, headers=auth)
+        zipped = client.get(url, headers={**GZIP, **auth})
+        ok &= check(f"{label}: gzip when accepted",
+                    zipped.headers.get('Content-Encoding') == 'gzip'
+                    and 'Accept-Encoding' in zipped.headers.get('Vary', '')
+                    and int(zipped.headers.get('Content-Length', len(zipped.data))) == len(zipped.data),
+                    dict(zipped.headers))
+        body = gzip.decompress(zipped.data)
+        # Metrics change between requests; pages must match byte for byte
+        ok &= check(f"{label}: decompresses to the page", body == plain.data or url == '/api/metrics')
+        ok &= check(f"{label}: identity otherwise", 'Content-Encoding' not in plain.headers)
+        print(f"   {len(body)} -> {len(zipped.data)} bytes")
+    refused = client.get('/', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    ok &= check("gzip;q=0 is respected", 'Content-Encoding' not in refused.headers)
+    if compression.brotli is not None:
+        ok &= check("br preferred when installed",
+                    client.get('/', headers={'Accept-Encoding': 'gzip, br'}).headers.get('Content-Encoding') == 'br')
+    head = client.head('/', headers=GZIP)
+    ok &= check("HEAD is left alone", 'Content-Encoding' not in head.headers)
+
+    print("\n=== Left alone ===")
+    small = client.get('/cart/api/summary', headers=GZIP)
+    ok &= check(f"Bodies under {compression.MIN_SIZE} bytes",
+                len(small.data) < compression.MIN_SIZE and 'Content-Encoding' not in small.headers,
+                (len(small.data), dict(small.headers)))
+
+    picture = os.path.join(STATIC, 'uploads', 'photo.png')
+    os.makedirs(os.path.dirname(picture), exist_ok=True)
+    Image.new('RGB', (200, 200), 'white').save(picture)
+    image = client.get('/static/uploads/photo.png', headers=GZIP)
+    ok &= check("Images", image.status_code == 200 and 'Content-Encoding' not in image.headers,
+                dict(image.headers))
+
+    manifest = assets.build(STATIC)
+    css_url = '/static/' + manifest['css/base.css']
+    css = client.get(css_url, headers=GZIP)
+    ok &= check("Precompressed static files are not encoded twice",
+                css.headers.get('Content-Encoding') == 'gzip'
+                and gzip.decompress(css.data) == client.get(css_url).data,
+                dict(css.headers))
+
+    first = client.get('/', headers=GZIP)
+    etag = first.headers.get('ETag', '')
+    ok &= check("Compressed pages carry a weak ETag", etag.startswith('W/'), etag)
+    revalidated = client.get('/', headers={**GZIP, 'If-None-Match': etag})
+    ok &= check("...which still revalidates with 304",
+                revalidated.status_code == 304 and not revalidated.data, revalidated.status_code)
+
+    print("\n=== Precomputed ===")
+    before = compression.stats()['this_process']['precomputed_hits']
+    repeats = [client.get('/', headers=GZIP).data for _ in range(5)]
+    hits = compression.stats()['this_process']['precomputed_hits'] - before
+    ok &= check("Repeat requests reuse the compressed page", hits == 5 and len(set(repeats)) == 1, hits)
+
+    print("\n=== Streamed ===")
+    plain = client.get('/_test/stream')
+    response = client.get('/_test/stream', headers=GZIP, buffered=False)
+    ok &= check("Streamed bodies are compressed without a Content-Length",
+                response.headers.get('Content-Encoding') == 'gzip' and 'Content-Length' not in response.headers,
+                dict(response.headers))
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    for chunk in response.response:
+        if chunk:
+            # Every chunk is flushed, so it decodes on its own arrival
+            chunks.append(decompressor.decompress(chunk))
+    response.close()
+    ok &= check("Chunks decode as they arrive", sum(1 for chunk in chunks if chunk) >= STREAM_CHUNKS // 2,
+                [len(chunk) for chunk in chunks])
+    ok &= check("...to the whole page", b''.join(chunks) + decompressor.flush() == plain.data)
+
+    stats = compression.stats()
+    print(f"\n   {stats}")
+    ok &= check("Metrics report bytes saved", stats['bytes_saved'] > 0 and 0 < stats['ratio'] < 1, stats['ratio'])
+
+    print(f"\n{'✅ All compression checks passed' if ok else '❌ Compression checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
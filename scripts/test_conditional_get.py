@@ -0,0 +1,150 @@
+"""
+Conditional GET test - ETags, 304s, Cache-Control and cached fragments.
+Requests public pages through the Flask test client, repeats them with
+If-None-Match, and checks that unchanged pages answer 304 (still counting product
+views) while seller, stock and review writes change the ETag. Reports bytes saved.
+Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_conditional_get.py [--products 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=200, help='products to seed')
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'conditional.db')
+
+from database import connection
+import app as zimapp
+import cache
+import http_cache
+import view_counter
+
+
+def seed(db, products):
+    """A verified seller with `products` listings and a buyer who bought the first one."""
+    seller_user, seller_id, buyer = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+    db.executemany('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', [(seller_user, 'seller@conditional.test', '-', 'Seller'), (buyer, 'buyer@conditional.test', '-', 'Buyer')])
+    seller_pk = db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+        VALUES (?, ?, 'Etag Store', 'etag-store', 1) RETURNING id
+    ''', (seller_id, seller_user)).fetchone()['id']
+    product_ids = [str(uuid.uuid4()) for _ in range(products)]
+    db.executemany('''
+        INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+        VALUES (?, ?, ?, 'Electronics', 25, 5)
+    ''', [(product_id, seller_pk, f'Listed item {i}') for i, product_id in enumerate(product_ids)])
+    order_pk = db.execute('''
+        INSERT INTO orders (order_id, user_id, order_number, total_amount, payment_status)
+        VALUES (?, ?, 'ETAG-1', 25, 'paid') RETURNING id
+    ''', (str(uuid.uuid4()), buyer)).fetchone()['id']
+    product_pk = db.execute('SELECT id FROM products WHERE product_id = ?', (product_ids[0],)).fetchone()['id']
+    db.execute('''
+        INSERT INTO order_items (order_item_id, order_id, product_id, seller_id, quantity, unit_price, subtotal)
+        VALUES (?, ?, ?, ?, 1, 25, 25)
+    ''', (str(uuid.uuid4()), order_pk, product_pk, seller_pk))
+    db.commit()
+    return seller_user, seller_id, buyer, product_ids[0]
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def product_etag(product_id):
+    # Product pages need datetime columns (PostgreSQL) to render, so take the ETag from the helper
+    with zimapp.app.test_request_context(f'/product/{product_id}'):
+        return http_cache.etag(zimapp.product_version(product_id))
+
+
+def views(product_id):
+    with connection() as db:
+        return db.execute('SELECT views FROM products WHERE product_id = ?', (product_id,)).fetchone()['views']
+
+
+def main():
+    zimapp.init_db()
+    with connection() as db:
+        seller_user, seller_id, buyer, product_id = seed(db, args.products)
+    client = zimapp.app.test_client()
+    ok = True
+
+    print("=== Unchanged pages answer 304 ===")
+    full_bytes = saved_bytes = 0
+    etags = {}
+    for url in ['/', '/about', '/terms', '/privacy', '/seller/etag-store?format=json',
+                '/sellers/etag-store?format=json']:
+        first = client.get(url)
+        etags[url] = first.headers.get('ETag')
+        again = client.get(url, headers={'If-None-Match': etags[url]})
+        full_bytes += len(first.data)
+        saved_bytes += len(first.data) - len(again.data)
+        ok &= check(f"{url}: 200 then 304", first.status_code == 200 and again.status_code == 304,
+                    (first.status_code, again.status_code))
+        ok &= check(f"{url}: public Cache-Control", first.headers.get('Cache-Control', '').startswith('public'),
+                    first.headers.get('Cache-Control'))
+    print(f"   {saved_bytes} of {full_bytes} bytes not resent on revalidation")
+
+    computes = cache.stats()['this_process']['computes']
+    ok &= check("Repeat visit renders from cached data and fragments",
+                client.get('/').status_code == 200 and cache.stats()['this_process']['computes'] == computes)
+
+    tag = product_etag(product_id)
+    before = views(product_id)
+    response = client.get(f'/product/{product_id}', headers={'If-None-Match': tag})
+    ok &= check("Product page answers 304", response.status_code == 304, response.status_code)
+    view_counter.flush()
+    ok &= check("A 304 still counts the view", views(product_id) == before + 1)
+    ok &= check("Counting views keeps the ETag", product_etag(product_id) == tag)
+
+    print("\n=== Writes change ETags ===")
+    with client.session_transaction() as session:
+        session['user_id'] = seller_user
+        session['seller_id'] = seller_id
+    logged_in = client.get('/')
+    ok &= check("Logged-in pages are private", logged_in.headers.get('Cache-Control') == 'private, no-cache',
+                logged_in.headers.get('Cache-Control'))
+    ok &= check("Logged-in pages get their own ETag", logged_in.headers.get('ETag') != etags['/'])
+    client.post('/sellers/product/new', data={'name': 'Brand new kettle', 'category': 'Electronics',
+                                              'price': '30', 'stock_quantity': '2'})
+    with client.session_transaction() as session:
+        session.clear()
+    for url in ['/', '/seller/etag-store?format=json', '/sellers/etag-store?format=json']:
+        response = client.get(url, headers={'If-None-Match': etags[url]})
+        ok &= check(f"{url}: new product sends the page again", response.status_code == 200, response.status_code)
+    ok &= check("Home page shows the new product", b'Brand new kettle' in client.get('/').data)
+
+    with client.session_transaction() as session:
+        session['user_id'] = buyer
+    response = client.post('/api/product-review', json={'product_id': product_id, 'rating': 4,
+                                                         'title': 'Good', 'comment': 'Works well'})
+    ok &= check("Buyer reviewed the product", response.status_code == 200, response.status_code)
+    ok &= check("A review changes the product ETag", product_etag(product_id) != tag)
+
+    with connection() as db:
+        db.execute('UPDATE products SET stock_quantity = 0 WHERE product_id = ?', (product_id,))
+        db.commit()
+    ok &= check("A stock change changes the product ETag", product_etag(product_id) != tag)
+
+    print(f"\n   {http_cache.stats()}")
+    print(f"\n{'✅ All conditional GET checks passed' if ok else '❌ Conditional GET checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Facet test - browse counts per category and price bucket, kept current incrementally.
+Seeds a catalogue, then checks the facet counts /products returns (with and without
+category, price and search filters) against GROUP BY queries, edits, deactivates and
+deletes listings through the seller form and sells stock out from racing threads,
+checking the summary table still matches a full recount. Times the facet read
+against the GROUP BY it replaces. Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_facets.py [--products 50000] [--threads 8] [--sales 400] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=50000, help='products in the catalogue')
+    parser.add_argument('--threads', type=int, default=8, help='threads selling stock')
+    parser.add_argument('--sales', type=int, default=400, help='single-unit sales across the threads')
+    parser.add_argument('--runs', type=int, default=20, help='timed facet reads per method')
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'facets.db')
+os.environ['DB_POOL_SIZE'] = str(args.threads + 2)
+
+from database import connection
+import app as zimapp
+import facets
+import inventory
+import search as search_index
+
+CATEGORIES = ['Electronics', 'Fashion', 'Home & Garden', 'Sports & Outdoors', 'Books & Media', 'Furniture']
+NOUNS = ['phone', 'charger', 'speaker', 'fridge', 'stove', 'shoes', 'jacket', 'kettle', 'novel', 'bicycle']
+ADJECTIVES = ['new', 'used', 'refurbished', 'wireless', 'portable', 'compact']
+
+
+def seed(db):
+    """Sellers and a catalogue with some inactive and sold-out listings, bulk loaded then summarised."""
+    rng = random.Random(3)
+    sellers = []
+    for i in range(10):
+        user_id, seller_id = str(uuid.uuid4()), str(uuid.uuid4())
+        db.execute('''
+            INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+        ''', (user_id, f'seller{i}@facets.test', '-', f'Seller {i}'))
+        db.execute('''
+            INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+            VALUES (?, ?, ?, ?, 1)
+        ''', (seller_id, user_id, f'Facet Store {i}', f'facet-store-{i}'))
+        sellers.append((user_id, seller_id))
+    internal = {row['seller_id']: row['id'] for row in db.execute('SELECT id, seller_id FROM sellers').fetchall()}
+
+    db.executemany('''
+        INSERT INTO products (product_id, seller_id, category, name, price, stock_quantity, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(str(uuid.uuid4()), internal[rng.choice(sellers)[1]], rng.choice(CATEGORIES),
+           f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)}', round(rng.uniform(5, 2000), 2),
+           rng.choice([0, 1, 2, 3, 10]), 'active' if rng.random() < 0.9 else 'inactive')
+          for _ in range(args.products)])
+    db.execute('''
+        INSERT INTO inventory (inventory_id, product_id, quantity_available)
+        SELECT 'inv-' || id, id, stock_quantity FROM products
+    ''')
+    search_index.rebuild_index(db)
+    db.commit()
+    facets.rebuild(db)
+    return sellers
+
+
+def truth(db, category=None, price_bucket=None, search=None):
+    """Facet counts straight from products, as summarize() shapes them."""
+    search_join, params = search_index.match_join(search) if search else ('', [])
+    rows = [dict(row) for row in db.execute(f'''
+        SELECT p.category, {facets.bucket_sql()} AS price_bucket, COUNT(*) AS product_count,
+               SUM(CASE WHEN p.stock_quantity > 0 THEN 1 ELSE 0 END) AS in_stock_count
+        FROM products p
+        {search_join}
+        WHERE p.status = 'active'
+        GROUP BY p.category, {facets.bucket_sql()}
+    ''', params).fetchall()]
+    return facets.summarize(rows, category, price_bucket)
+
+
+def table_matches_recount(db):
+    """(matches, detail): product_facets against a recount of every row."""
+    expected = {(row['category'], row['price_bucket']): (row['product_count'], row['in_stock_count'])
+                for row in db.execute(f'''
+                    SELECT p.category, {facets.bucket_sql()} AS price_bucket, COUNT(*) AS product_count,
+                           SUM(CASE WHEN p.stock_quantity > 0 THEN 1 ELSE 0 END) AS in_stock_count
+                    FROM products p WHERE p.status = 'active'
+                    GROUP BY p.category, {facets.bucket_sql()}
+                ''').fetchall()}
+    actual = {(row['category'], row['price_bucket']): (row['product_count'], row['in_stock_count'])
+              for row in facets.table_rows(db)}
+    wrong = {key: (actual.get(key), expected.get(key)) for key in set(expected) | set(actual)
+             if actual.get(key) != expected.get(key)}
+    return not wrong, wrong
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def seller_client(user_id, seller_id):
+    client = zimapp.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['seller_id'] = seller_id
+    return client
+
+
+def main():
+    zimapp.init_db()
+    with connection() as db:
+        sellers = seed(db)
+    client = zimapp.app.test_client()
+    ok = True
+
+    print(f"=== /products facets on {args.products} products ===")
+    cases = [({}, None, None, None), ({'category': 'Fashion'}, 'Fashion', None, None),
+             ({'price': '2'}, None, 2, None), ({'category': 'Furniture', 'price': '5'}, 'Furniture', 5, None),
+             ({'q': 'wireless'}, None, None, 'wireless'), ({'q': 'new phone', 'price': '0'}, None, 0, 'new phone')]
+    for query, category, price_bucket, search in cases:
+        response = client.get('/products', query_string={**query, 'format': 'json'})
+        with connection() as db:
+            expected = truth(db, category, price_bucket, search)
+        ok &= check(f"Facets for {query or 'everything'}: {response.json['facets']['total']} listed",
+                    response.json['facets'] == expected, (response.json['facets'], expected))
+    page = client.get('/products', query_string={'category': 'Fashion', 'price': '1'}).data.decode()
+    ok &= check("Browse page shows counts", 'Fashion (' in page and f"{facets.bucket_label(1)} (" in page)
+    prices = [row['price'] for row in client.get('/products', query_string={'price': '1', 'format': 'json'}).json['products']]
+    low, high = facets.bucket_range(1)
+    ok &= check("Price bucket filters the listing", prices and all(low <= price < high for price in prices), prices[:5])
+
+    print("\n=== Seller writes ===")
+    user_id, seller_id = sellers[0]
+    seller = seller_client(user_id, seller_id)
+    response = seller.post('/sellers/product/new', data={
+        'name': 'Facet lamp', 'category': 'Lighting', 'price': '75', 'stock_quantity': '4'})
+    with connection() as db:
+        product_id = db.execute("SELECT product_id FROM products WHERE name = 'Facet lamp'").fetchone()['product_id']
+        matches, wrong = table_matches_recount(db)
+    ok &= check("New listing counted", response.status_code == 302 and matches, wrong)
+
+    edits = [('Price moves it to another bucket', {'price': '600', 'stock_quantity': '4', 'status': 'active'}),
+             ('Stock to zero keeps it listed, not in stock', {'price': '600', 'stock_quantity': '0', 'status': 'active'}),
+             ('Deactivating drops it', {'price': '600', 'stock_quantity': '0', 'status': 'inactive'}),
+             ('Reactivating brings it back', {'price': '20', 'stock_quantity': '2', 'status': 'active'})]
+    for label, form in edits:
+        seller.post(f'/sellers/product/{product_id}/edit', data={'name': 'Facet lamp', **form})
+        with connection() as db:
+            matches, wrong = table_matches_recount(db)
+        ok &= check(label, matches, wrong)
+    seller.post(f'/sellers/product/{product_id}/delete')
+    with connection() as db:
+        matches, wrong = table_matches_recount(db)
+    ok &= check("Deleting drops it", matches, wrong)
+
+    print(f"\n=== {args.threads} threads selling {args.sales} units ===")
+    with connection() as db:
+        scarce = [row['id'] for row in db.execute('''
+            SELECT id FROM products WHERE status = 'active' AND stock_quantity BETWEEN 1 AND 3 LIMIT 60
+        ''').fetchall()]
+    errors, sold = [], [0]
+    lock = threading.Lock()
+
+    def sell(seed):
+        rng = random.Random(seed)
+        for _ in range(args.sales // args.threads):
+            with connection() as db:
+                try:
+                    inventory.sell(db, [(rng.choice(scarce), 1)], None)
+                    db.commit()
+                    with lock:
+                        sold[0] += 1
+                except inventory.InsufficientStock:
+                    db.rollback()
+                except Exception as e:
+                    db.rollback()
+                    errors.append(e)
+
+    threads = [threading.Thread(target=sell, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with connection() as db:
+        sold_out = db.execute(f'''
+            SELECT COUNT(*) AS n FROM products WHERE stock_quantity = 0 AND id IN ({', '.join('?' for _ in scarce)})
+        ''', scarce).fetchone()['n']
+        matches, wrong = table_matches_recount(db)
+    print(f"   {sold[0]} units sold, {sold_out} of {len(scarce)} listings sold out")
+    ok &= check("No sale failed", not errors, errors[:3])
+    ok &= check("In-stock counts follow the sales", sold_out and matches, wrong)
+
+    print("\n=== Cost per request ===")
+    with connection() as db:
+        def timed(read):
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                read()
+                times.append(time.perf_counter() - start)
+            return statistics.median(times) * 1000
+
+        summary_ms = timed(lambda: facets.summarize(facets.table_rows(db), 'Fashion', 2))
+        recount_ms = timed(lambda: truth(db, 'Fashion', 2))
+        search_ms = timed(lambda: truth(db, None, None, 'wireless'))
+    client.get('/products', query_string={'q': 'wireless'})
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        client.get('/products', query_string={'q': 'wireless', 'format': 'json'})
+    cached_ms = (time.perf_counter() - start) / args.runs * 1000
+    print(f"   summary table: {summary_ms:.2f} ms, GROUP BY over products: {recount_ms:.2f} ms")
+    print(f"   search facets: {search_ms:.2f} ms counted, whole cached JSON request {cached_ms:.2f} ms")
+    ok &= check("Summary read is cheaper than the GROUP BY", summary_ms * 10 < recount_ms, (summary_ms, recount_ms))
+
+    print(f"\n{'✅ All facet checks passed' if ok else '❌ Facet checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Page cache test - hit rate, write invalidation and stampede protection.
+Serves the home page and category browse through the Flask test client (cached vs
+uncached throughput), checks a seller's new product shows up at once, then releases
+a crowd of threads - and of processes sharing the sqlite backend - on one expired
+key and checks it is recomputed once. Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_page_cache.py [--products 2000] [--requests 500] [--concurrency 32]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--products', type=int, default=2000, help='products to seed')
+    parser.add_argument('--requests', type=int, default=500, help='page requests per throughput run')
+    parser.add_argument('--concurrency', type=int, default=32, help='threads/processes racing on one key')
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'cache.db')
+
+from database import connection
+import app as zimapp
+import cache
+
+CATEGORIES = ['Electronics', 'Fashion', 'Home & Garden', 'Vehicles']
+SLOW_COMPUTE_SECONDS = 0.2
+
+
+def seed(db, products):
+    """One verified seller (logged in later) with `products` active listings."""
+    user_id, seller_id = str(uuid.uuid4()), str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', (user_id, 'seller@cache.test', '-', 'Cache Seller'))
+    seller_pk = db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+        VALUES (?, ?, 'Cache Store', 'cache-store', 1) RETURNING id
+    ''', (seller_id, user_id)).fetchone()['id']
+    db.executemany('''
+        INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(str(uuid.uuid4()), seller_pk, f'Seeded item {i}', CATEGORIES[i % len(CATEGORIES)], 10 + i % 90, 5)
+          for i in range(products)])
+    db.commit()
+    return user_id, seller_id
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def counters():
+    return cache.stats()['this_process']
+
+
+def throughput(client, urls, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        assert client.get(urls[i % len(urls)]).status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def race(get, workers):
+    """Start `workers` threads calling get() together; returns their results."""
+    barrier = threading.Barrier(workers)
+    results = [None] * workers
+
+    def worker(i):
+        barrier.wait()
+        results[i] = get()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def slow_compute(computed, value):
+    def compute():
+        with computed.get_lock():
+            computed.value += 1
+        time.sleep(SLOW_COMPUTE_SECONDS)
+        return value
+    return compute
+
+
+def shared_worker(path, barrier, computed, results):
+    cache.configure(cache.SQLiteBackend(path))
+    barrier.wait()
+    results.put(cache.get_or_set('shared', slow_compute(computed, 'from-one-process'), ttl=30, tags=('t',)))
+
+
+def main():
+    zimapp.init_db()
+    with connection() as db:
+        user_id, seller_id = seed(db, args.products)
+    client = zimapp.app.test_client()
+    ok = True
+    urls = ['/'] + [f'/products?category={category}' for category in CATEGORIES]
+
+    print(f"=== Throughput ({args.requests} requests over {len(urls)} pages) ===")
+    cache.configure(None)
+    uncached = throughput(client, urls, args.requests)
+    cache.configure(cache.MemoryBackend())
+    throughput(client, urls, len(urls))
+    before = counters()
+    cached = throughput(client, urls, args.requests)
+    after = counters()
+    print(f"   uncached {uncached:.0f} req/s, cached {cached:.0f} req/s ({cached / uncached:.1f}x)")
+    ok &= check("Nothing recomputed after the first visit", after['computes'] == before['computes'], after)
+    ok &= check("Hit rate above 95%", cache.stats()['hit_rate'] > 0.95, cache.stats())
+
+    print("\n=== Invalidation ===")
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['seller_id'] = seller_id
+    client.get('/seller/cache-store?format=json')
+    response = client.post('/sellers/product/new', data={
+        'name': 'Freshly listed solar panel', 'category': 'Electronics', 'price': '120', 'stock_quantity': '3'})
+    ok &= check("Seller listed a product", response.status_code == 302, response.status_code)
+    ok &= check("Home page shows it at once", b'Freshly listed solar panel' in client.get('/').data)
+    browse = client.get('/products?category=Electronics&format=json').get_json()
+    ok &= check("Category browse shows it at once",
+                browse['products'][0]['name'] == 'Freshly listed solar panel', browse['products'][:1])
+    store = client.get('/seller/cache-store?format=json').get_json()
+    ok &= check("Store page shows it at once",
+                store['products'][0]['name'] == 'Freshly listed solar panel', store['products'][:1])
+
+    print(f"\n=== Stampede: {args.concurrency} threads on one key ===")
+    cache.configure(cache.MemoryBackend())
+    computed = multiprocessing.Value('i', 0)
+    results = race(lambda: cache.get_or_set('hot', slow_compute(computed, 'v1'), ttl=0.5), args.concurrency)
+    ok &= check("Cold key computed once", computed.value == 1, computed.value)
+    ok &= check("Every caller got the value", set(results) == {'v1'}, set(results))
+
+    time.sleep(0.6)
+    computed.value = 0
+    before = counters()
+    results = race(lambda: cache.get_or_set('hot', slow_compute(computed, 'v2'), ttl=0.5), args.concurrency)
+    after = counters()
+    ok &= check("Expired key recomputed once", computed.value == 1, computed.value)
+    ok &= check("Others served the stale value meanwhile",
+                after['stale_hits'] - before['stale_hits'] == args.concurrency - 1 and results.count('v1') >= 1,
+                after)
+
+    print(f"\n=== Stampede: {args.concurrency} processes sharing the sqlite backend ===")
+    path = os.path.join(WORKDIR, 'shared-cache.db')
+    cache.SQLiteBackend(path)
+    context = multiprocessing.get_context('fork')
+    barrier, computed, queue = context.Barrier(args.concurrency), context.Value('i', 0), context.Queue()
+    processes = [context.Process(target=shared_worker, args=(path, barrier, computed, queue))
+                 for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+    print(f"   {args.concurrency} processes served in {time.perf_counter() - start:.2f}s")
+    ok &= check("Computed once across processes", computed.value == 1, computed.value)
+    ok &= check("Every process got the value", set(results) == {'from-one-process'}, set(results))
+
+    writer, reader = cache.SQLiteBackend(path), cache.SQLiteBackend(path)
+    cache.configure(writer)
+    cache.invalidate('t')
+    cache.configure(reader)
+    ok &= check("Invalidation reaches other processes", reader.get('shared') is None)
+
+    print(f"\n{'✅ All cache checks passed' if ok else '❌ Cache checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
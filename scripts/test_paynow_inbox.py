@@ -0,0 +1,208 @@
+"""
+Paynow webhook inbox test - duplicate, out-of-order and replayed callbacks.
+Posts signed notifications to /bnpl/payment-webhook, runs the inbox consumer and
+checks every payment, agreement, order and stock transition happened exactly once,
+and that money arriving for a defaulted agreement is recorded without reviving it.
+Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_paynow_inbox.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'inbox.db')
+
+from database import connection
+import app as zimapp
+import bnpl
+import bnpl_payments
+import jobs
+import order_writer
+import paynow_inbox
+
+INTEGRATION_KEY = 'test-integration-key'
+bnpl.PAYNOW_INTEGRATION_KEY = INTEGRATION_KEY
+
+STOCK = 10
+
+
+def create_agreement(db, installments=2):
+    """A buyer's pending BNPL agreement for one product (3 units held) with a first-payment attempt."""
+    user_id = str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', (user_id, f'{user_id}@inbox.test', '-', 'Inbox Buyer'))
+    db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug) VALUES (?, ?, ?, ?)
+    ''', (str(uuid.uuid4()), user_id, 'Inbox Store', f'inbox-{user_id[:8]}'))
+    seller_id = db.execute('SELECT id FROM sellers WHERE user_id = ?', (user_id,)).fetchone()['id']
+    product_id = db.execute('''
+        INSERT INTO products (product_id, seller_id, name, category, price, stock_quantity)
+        VALUES (?, ?, ?, ?, ?, ?) RETURNING id
+    ''', (str(uuid.uuid4()), seller_id, 'Inbox Product', 'Electronics', 20.0, STOCK)).fetchone()['id']
+    db.execute('''
+        INSERT INTO inventory (inventory_id, product_id, quantity_available) VALUES (?, ?, ?)
+    ''', (str(uuid.uuid4()), product_id, STOCK))
+
+    lines = [{'product_id': product_id, 'seller_id': seller_id, 'quantity': 3, 'price': 20.0}]
+    order = order_writer.create_order(db, user_id, lines, 'bnpl')
+
+    agreement_id = str(uuid.uuid4())
+    agreement_pk = db.execute('''
+        INSERT INTO bnpl_agreements
+        (agreement_id, user_id, order_id, principal_amount, fee_amount, total_amount,
+         installment_amount, installments, duration_weeks, fee_percent, status)
+        VALUES (?, ?, ?, 60, 0, 60, ?, ?, 4, 0, 'pending') RETURNING id
+    ''', (agreement_id, user_id, order['id'], 60 / installments, installments)).fetchone()['id']
+    db.execute('''
+        INSERT INTO bnpl_payments (payment_id, agreement_id, installment_number, amount, status)
+        VALUES (?, ?, 1, ?, 'pending')
+    ''', (str(uuid.uuid4()), agreement_pk, 60 / installments))
+    db.commit()
+    return agreement_id, product_id
+
+
+def notify(client, agreement_id, installment, status, key=INTEGRATION_KEY):
+    fields = [('reference', bnpl_payments.make_reference(agreement_id, installment)),
+              ('paynowreference', '1234567'), ('amount', '30.00'), ('status', status),
+              ('pollurl', 'https://www.paynow.co.zw/interface/poll?guid=test')]
+    fields.append(('hash', bnpl_payments.paynow_hash(fields, key)))
+    return client.post('/bnpl/payment-webhook', data=urlencode(fields),
+                       content_type='application/x-www-form-urlencoded')
+
+
+def state(db, agreement_id, product_id):
+    agreement = db.execute('''
+        SELECT ba.id, ba.status, o.status AS order_status, o.payment_status
+        FROM bnpl_agreements ba JOIN orders o ON o.id = ba.order_id
+        WHERE ba.agreement_id = ?
+    ''', (agreement_id,)).fetchone()
+    payments = db.execute('''
+        SELECT installment_number, status FROM bnpl_payments WHERE agreement_id = ? ORDER BY id
+    ''', (agreement['id'],)).fetchall()
+    stock = db.execute('''
+        SELECT quantity_available, quantity_reserved FROM inventory WHERE product_id = ?
+    ''', (product_id,)).fetchone()
+    return {
+        'agreement': agreement['status'],
+        'order': (agreement['order_status'], agreement['payment_status']),
+        'payments': [(row['installment_number'], row['status']) for row in payments],
+        'stock': (stock['quantity_available'], stock['quantity_reserved']),
+    }
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    zimapp.init_db()
+    client = zimapp.app.test_client()
+    ok = True
+
+    with connection() as db:
+        print("\n=== Signature ===")
+        agreement_id, product_id = create_agreement(db)
+        response = notify(client, agreement_id, 1, 'Paid', key='wrong-key')
+        inbox = db.execute('SELECT COUNT(*) AS n FROM paynow_inbox').fetchone()['n']
+        ok &= check("Bad hash rejected and not stored", response.status_code == 403 and inbox == 0)
+
+        print("\n=== Duplicate callbacks ===")
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            response = notify(client, agreement_id, 1, 'Paid')
+            timings.append((time.perf_counter() - start) * 1000)
+            ok &= check("Webhook acknowledged", response.status_code == 200)
+        inbox = db.execute('SELECT COUNT(*) AS n FROM paynow_inbox WHERE agreement_id = ?',
+                           (agreement_id,)).fetchone()['n']
+        ok &= check("Duplicates stored once", inbox == 1, f'{inbox} rows')
+        jobs.run_pending(db)
+        result = state(db, agreement_id, product_id)
+        ok &= check("First payment applied once", result == {
+            'agreement': 'active', 'order': ('confirmed', 'partial'),
+            'payments': [(1, 'completed')], 'stock': (STOCK - 3, 0)}, result)
+        print(f"   webhook latency: {sorted(timings)[1]:.1f}ms median (inbox append only)")
+
+        print("\n=== Out-of-order callbacks ===")
+        # Stale statuses arriving after Paid, and installment 2 before a late duplicate of 1
+        for installment, status in [(1, 'Sent'), (1, 'Cancelled'), (2, 'Paid'), (1, 'Awaiting Delivery')]:
+            notify(client, agreement_id, installment, status)
+        jobs.run_pending(db)
+        result = state(db, agreement_id, product_id)
+        ok &= check("Stale statuses ignored, installment 2 completes the agreement", result == {
+            'agreement': 'completed', 'order': ('confirmed', 'paid'),
+            'payments': [(1, 'completed'), (2, 'completed')], 'stock': (STOCK - 3, 0)}, result)
+        outcomes = [row['outcome'] for row in db.execute('''
+            SELECT outcome FROM paynow_inbox WHERE agreement_id = ? ORDER BY id
+        ''', (agreement_id,)).fetchall()]
+        ok &= check("Applied in arrival order", outcomes == ['paid', 'pending', 'duplicate', 'paid', 'duplicate'],
+                    outcomes)
+
+        print("\n=== Cancelled, then paid on retry ===")
+        other_id, other_product = create_agreement(db)
+        notify(client, other_id, 1, 'Cancelled')
+        jobs.run_pending(db)
+        result = state(db, other_id, other_product)
+        ok &= check("Cancellation releases the held stock", result['payments'] == [(1, 'failed')]
+                    and result['stock'] == (STOCK, 0), result)
+
+        # Both callbacks queued before the consumer runs: applied in arrival order
+        third_id, third_product = create_agreement(db)
+        notify(client, third_id, 1, 'Cancelled')
+        notify(client, third_id, 1, 'Paid')
+        jobs.run_pending(db)
+        result = state(db, third_id, third_product)
+        ok &= check("Cancelled then Paid ends paid", result['agreement'] == 'active'
+                    and result['payments'][-1] == (1, 'completed'), result)
+
+        print("\n=== Paid after default ===")
+        defaulted_id, defaulted_product = create_agreement(db)
+        notify(client, defaulted_id, 1, 'Paid')
+        jobs.run_pending(db)
+        pk = db.execute('SELECT id FROM bnpl_agreements WHERE agreement_id = ?', (defaulted_id,)).fetchone()['id']
+        db.execute('''
+            INSERT INTO bnpl_installments (agreement_id, installment_number, amount, due_date, status)
+            VALUES (?, 1, 30, '2020-01-01', 'paid'), (?, 2, 30, '2020-01-08', 'defaulted')
+        ''', (pk, pk))
+        db.execute("UPDATE bnpl_agreements SET status = 'defaulted' WHERE id = ?", (pk,))
+        db.commit()
+        notify(client, defaulted_id, 2, 'Paid')
+        jobs.run_pending(db)
+        result = state(db, defaulted_id, defaulted_product)
+        outcome = db.execute('''
+            SELECT outcome FROM paynow_inbox WHERE agreement_id = ? ORDER BY id DESC LIMIT 1
+        ''', (defaulted_id,)).fetchone()['outcome']
+        installment = db.execute('''
+            SELECT status FROM bnpl_installments WHERE agreement_id = ? AND installment_number = 2
+        ''', (pk,)).fetchone()['status']
+        ok &= check("Payment recorded, agreement stays defaulted", outcome == 'not_open'
+                    and result['agreement'] == 'defaulted' and result['order'][1] == 'partial'
+                    and result['payments'][-1] == (2, 'completed') and installment == 'defaulted',
+                    (outcome, installment, result))
+
+        print("\n=== Replay ===")
+        before = [state(db, a, p) for a, p in
+                  [(agreement_id, product_id), (other_id, other_product), (third_id, third_product)]]
+        notifications, agreements = paynow_inbox.replay(db)
+        jobs.run_pending(db)
+        after = [state(db, a, p) for a, p in
+                 [(agreement_id, product_id), (other_id, other_product), (third_id, third_product)]]
+        ok &= check(f"Replaying {notifications} notifications for {agreements} agreements changes nothing",
+                    before == after, after)
+        ok &= check("Inbox drained", paynow_inbox.stats(db)['backlog'] == 0)
+
+    print(f"\n{'✅ All inbox checks passed' if ok else '❌ Inbox checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
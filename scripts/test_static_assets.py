@@ -0,0 +1,146 @@
+"""
+Static asset test - fingerprinted URLs, immutable caching and precompressed variants.
+Builds a copy of static/ into a temporary folder, renders the home page through the
+Flask test client and checks it links fingerprinted CSS/JS served with a year-long
+immutable Cache-Control and as .gz/.br when accepted. Then changes a stylesheet,
+rebuilds, and checks the URL and the page ETag move on while the old file stays.
+Checks only content-addressed upload blobs are immutable and temp uploads are not served.
+Reports first- and repeat-visit bytes and requests. Runs against a throwaway SQLite database.
+
+Usage: python scripts/test_static_assets.py
+"""
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'assets.db')
+
+import app as zimapp
+import assets
+
+STATIC = os.path.join(WORKDIR, 'static')
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+\.(?:css|js))"')
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def copy_static():
+    shutil.copytree(os.path.join(REPO, 'static'), STATIC,
+                    ignore=lambda folder, names: [name for name in names if name in assets.SKIP_FOLDERS])
+
+
+def main():
+    zimapp.init_db()
+    copy_static()
+    zimapp.app.static_folder = STATIC
+    client = zimapp.app.test_client()
+    ok = True
+
+    print("=== Before a build ===")
+    page = client.get('/').data.decode()
+    ok &= check("Templates link plain static URLs", '/static/css/base.css' in page)
+    response = client.get('/static/css/base.css')
+    ok &= check("...which revalidate", 'immutable' not in response.headers.get('Cache-Control', ''),
+                response.headers.get('Cache-Control'))
+
+    print("\n=== After a build ===")
+    manifest = assets.build(STATIC)
+    first = client.get('/')
+    urls = ASSET_RE.findall(first.data.decode())
+    ok &= check("Templates link fingerprinted URLs",
+                urls and all(url.startswith('/static/dist/') for url in urls), urls)
+
+    first_visit = len(first.data)
+    for url in urls:
+        plain = client.get(url)
+        zipped = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        first_visit += len(zipped.data)
+        ok &= check(f"{url}: immutable for a year",
+                    plain.headers.get('Cache-Control') == f'public, max-age={assets.IMMUTABLE_MAX_AGE}, immutable',
+                    plain.headers.get('Cache-Control'))
+        if os.path.exists(os.path.join(STATIC, url[len('/static/'):] + '.gz')):
+            ok &= check(f"{url}: gzip when accepted",
+                        zipped.headers.get('Content-Encoding') == 'gzip'
+                        and gzip.decompress(zipped.data) == plain.data
+                        and 'Accept-Encoding' in zipped.headers.get('Vary', ''),
+                        dict(zipped.headers))
+            ok &= check(f"{url}: identity otherwise", 'Content-Encoding' not in plain.headers)
+        if assets.brotli:
+            brotli = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+            ok &= check(f"{url}: br preferred when accepted", brotli.headers.get('Content-Encoding') == 'br')
+        etag = plain.headers.get('ETag')
+        ok &= check(f"{url}: revalidates with 304", client.get(url, headers={'If-None-Match': etag}).status_code == 304)
+
+    upload = os.path.join(STATIC, 'uploads', 'ab', 'ab' + '0' * 62 + '.jpg')
+    os.makedirs(os.path.dirname(upload), exist_ok=True)
+    with open(upload, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xd9')
+    response = client.get('/static/uploads/ab/' + os.path.basename(upload))
+    ok &= check("Content-addressed uploads are immutable", 'immutable' in response.headers.get('Cache-Control', ''),
+                response.headers.get('Cache-Control'))
+    for label, relative in (('Variants', 'uploads/variants/' + 'ab' + '0' * 62 + '-card.jpg'),
+                            ('Uploads from before blobs', 'uploads/0f8fad5b-d9cb-469f-a165-70867728950e.jpg')):
+        os.makedirs(os.path.dirname(os.path.join(STATIC, relative)), exist_ok=True)
+        with open(os.path.join(STATIC, relative), 'wb') as f:
+            f.write(b'\xff\xd8\xff\xd9')
+        response = client.get('/static/' + relative)
+        ok &= check(f"{label} revalidate", response.status_code == 200
+                    and 'immutable' not in response.headers.get('Cache-Control', ''),
+                    (response.status_code, response.headers.get('Cache-Control')))
+    temporary = os.path.join(STATIC, 'uploads', 'tmp', 'upload-abc123')
+    os.makedirs(os.path.dirname(temporary), exist_ok=True)
+    with open(temporary, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xd9')
+    ok &= check("Uploads in progress are not served",
+                all(client.get(url).status_code == 404 for url in
+                    ('/static/uploads/tmp/upload-abc123', '/static/uploads/./tmp/upload-abc123')))
+
+    # A browser holding immutable copies only asks for the page itself
+    repeat_visit = len(client.get('/').data)
+    print(f"   first visit: {first_visit} bytes in {1 + len(urls)} requests; "
+          f"repeat visit: {repeat_visit} bytes in 1 request "
+          f"(was {repeat_visit + sum(len(client.get(url).data) for url in urls)} bytes with inline CSS/JS)")
+
+    print("\n=== Changing an asset ===")
+    old_url = '/static/' + manifest['css/base.css']
+    old_etag = first.headers.get('ETag')
+    with open(os.path.join(STATIC, 'css', 'base.css'), 'a') as f:
+        f.write('\n.changed { color: red; }\n')
+    manifest = assets.build(STATIC)
+    again = client.get('/')
+    ok &= check("Page links the new fingerprint", '/static/' + manifest['css/base.css'] in again.data.decode()
+                and old_url not in again.data.decode())
+    ok &= check("Page ETag changed", again.headers.get('ETag') != old_etag)
+    ok &= check("Previous build's file still served", client.get(old_url).status_code == 200)
+    with open(os.path.join(STATIC, 'css', 'base.css'), 'a') as f:
+        f.write('\n.changed-again { color: blue; }\n')
+    assets.build(STATIC)
+    ok &= check("Files two builds old are deleted", client.get(old_url).status_code == 404)
+
+    with zimapp.app.app_context():
+        print(f"\n   {assets.stats()}")
+    print(f"\n{'✅ All static asset checks passed' if ok else '❌ Static asset checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Upload storage test - streamed hashing, deduplication, reference counts and GC.
+Posts the same photo to many listings through the seller form and checks it is
+stored once, measures Python memory used while a large upload is parsed, races
+threads listing and deleting the same photo, checks photos carrying EXIF/GPS are
+published without it under the hash of what is stored, then deletes listings and checks the
+blob row goes with the last reference, its files stay through a rolled-back delete and
+sweep() removes them (and its variants) once nothing references them. Runs against a throwaway SQLite
+database and upload folder.
+
+Usage: python scripts/test_uploads.py [--listings 10] [--size-mb 5] [--threads 8]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--listings', type=int, default=10, help='listings sharing one photo')
+    parser.add_argument('--size-mb', type=float, default=5, help='size of the large upload')
+    parser.add_argument('--threads', type=int, default=8, help='threads racing on one photo')
+    return parser.parse_args()
+
+
+args = parse_args()
+WORKDIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'uploads.db')
+os.environ['DB_POOL_SIZE'] = str(args.threads + 2)
+# Blobs go to ./static/uploads; keep them out of the checkout
+os.chdir(WORKDIR)
+
+from flask import request
+from database import connection
+import app as zimapp
+import image_pipeline
+import jobs
+import uploads
+
+peaks = []
+
+
+@zimapp.app.before_request
+def start_measuring():
+    if request.method == 'POST':
+        tracemalloc.reset_peak()
+        request.environ['memory_before'] = tracemalloc.get_traced_memory()[0]
+
+
+@zimapp.app.after_request
+def stop_measuring(response):
+    if 'memory_before' in request.environ:
+        peaks.append(tracemalloc.get_traced_memory()[1] - request.environ['memory_before'])
+    return response
+
+
+def photo(seed, megabytes=None, orientation=None, fmt='JPEG'):
+    """A noisy image; with `megabytes`, sized to roughly that many bytes; with `orientation`, portrait with EXIF and GPS tags."""
+    rng = np.random.default_rng(seed)
+    side = int(1200 * (megabytes or 0.3) ** 0.5)
+    image = Image.fromarray(rng.integers(0, 255, (side, side * 3 // 4 if orientation else side, 3), dtype=np.uint8))
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x010F] = 'Upload Camera'
+        exif[0x0112] = orientation
+        exif[0x8825] = {1: 'S', 2: (17.0, 49.0, 45.0), 3: 'E', 4: (31.0, 3.0, 7.0)}
+        options['exif'] = exif
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **({'quality': 75} if fmt == 'JPEG' else {}), **options)
+    return buffer.getvalue()
+
+
+def has_metadata(path):
+    with Image.open(path) as image:
+        return bool(image.info.get('exif') or image.getexif())
+
+
+def file_hash(relative_path):
+    with open(os.path.join('static', relative_path), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def seller_client(db):
+    user_id, seller_id = str(uuid.uuid4()), str(uuid.uuid4())
+    db.execute('''
+        INSERT INTO users (user_id, email, password_hash, full_name) VALUES (?, ?, ?, ?)
+    ''', (user_id, f'{user_id[:8]}@uploads.test', '-', 'Upload Seller'))
+    db.execute('''
+        INSERT INTO sellers (seller_id, user_id, store_name, store_slug, is_verified)
+        VALUES (?, ?, 'Upload Store', ?, 1)
+    ''', (seller_id, user_id, f'upload-{user_id[:8]}'))
+    db.commit()
+    client = zimapp.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['seller_id'] = seller_id
+    return client
+
+
+def list_product(client, data, name='Shared photo item', filename='photo.jpg'):
+    """Create a listing with one image; returns its product_id."""
+    response = client.post('/sellers/product/new', data={
+        'name': name, 'category': 'Electronics', 'price': '10', 'stock_quantity': '1',
+        'images': (io.BytesIO(data), filename)}, content_type='multipart/form-data')
+    assert response.status_code == 302, response.status_code
+    with connection() as db:
+        row = db.execute('SELECT product_id FROM products WHERE name = ? ORDER BY id DESC LIMIT 1',
+                         (name,)).fetchone()
+    return row['product_id']
+
+
+def delete_product(client, product_id):
+    assert client.post(f'/sellers/product/{product_id}/delete').status_code == 200
+
+
+def blob(content_hash):
+    with connection() as db:
+        return db.execute('SELECT * FROM image_blobs WHERE content_hash = ?', (content_hash,)).fetchone()
+
+
+def references(content_hash):
+    with connection() as db:
+        return db.execute('SELECT COUNT(*) AS n FROM product_images WHERE content_hash = ?',
+                          (content_hash,)).fetchone()['n']
+
+
+def files_under(folder):
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(folder) for name in names)
+
+
+def check(label, condition, detail=''):
+    print(f"{'✅' if condition else '❌'} {label}{f' - {detail}' if detail and not condition else ''}")
+    return condition
+
+
+def main():
+    zimapp.init_db()
+    with connection() as db:
+        client = seller_client(db)
+    ok = True
+
+    print(f"=== One photo, {args.listings} listings ===")
+    data = photo(1)
+    content_hash = hashlib.sha256(data).hexdigest()
+    product_ids = [list_product(client, data, filename=f'copy-{i}.jpeg') for i in range(args.listings)]
+    row = blob(content_hash)
+    ok &= check("Stored once, under its SHA-256", row is not None and row['image_path'].endswith(f'{content_hash}.jpg'),
+                dict(row) if row else None)
+    ok &= check(f"ref_count is {args.listings}", row['ref_count'] == args.listings == references(content_hash),
+                row['ref_count'])
+    blob_files = [path for path in files_under(uploads.UPLOAD_FOLDER) if content_hash in path]
+    ok &= check("One file on disk", len(blob_files) == 1, blob_files)
+    ok &= check("No temp files left", files_under(uploads.TMP_FOLDER) == [], files_under(uploads.TMP_FOLDER))
+    with connection() as db:
+        print(f"   {uploads.stats(db)['this_process']}")
+        jobs.run_pending(db)
+    counters = image_pipeline.stats()['this_process']
+    ok &= check("Variants rendered once for every listing", counters['processed'] == 1, counters)
+    with connection() as db:
+        unprocessed = db.execute('SELECT COUNT(*) AS n FROM product_images WHERE variants IS NULL').fetchone()['n']
+    ok &= check("Every listing got the variants", unprocessed == 0, unprocessed)
+    variant_paths = [os.path.join('static', path) for path in image_pipeline.variant_files(blob(content_hash)['variants'])]
+
+    print("\n=== Rejected uploads ===")
+    list_product(client, b'not really a jpeg' * 100, name='Fake photo', filename='fake.jpg')
+    with connection() as db:
+        images = db.execute('''
+            SELECT COUNT(*) AS n FROM product_images pi JOIN products p ON pi.product_id = p.id
+            WHERE p.name = 'Fake photo'
+        ''').fetchone()['n']
+    ok &= check("A non-image with an image extension is not stored", images == 0, images)
+
+    print(f"\n=== Streaming a {args.size_mb:g} MB upload ===")
+    large = photo(2, args.size_mb)
+    tracemalloc.start()
+    peaks.clear()
+    list_product(client, large, name='Large photo')
+    tracemalloc.stop()
+    print(f"   {len(large) / 1e6:.1f} MB upload, {peaks[-1] / 1e6:.2f} MB peak Python memory in the request")
+    ok &= check("Upload is not buffered in memory", peaks[-1] < len(large) / 4, peaks[-1])
+    ok &= check("Hash matches the bytes sent", blob(hashlib.sha256(large).hexdigest()) is not None)
+
+    print("\n=== Photo metadata ===")
+    cases = [('Upright JPEG', photo(4, orientation=1), 'gps.jpg'),
+             ('Rotated JPEG', photo(5, orientation=6), 'rotated.jpg'),
+             ('PNG', photo(6, orientation=1, fmt='PNG'), 'gps.png')]
+    for label, sent, filename in cases:
+        list_product(client, sent, name=f'{label} item', filename=filename)
+        with connection() as db:
+            row = db.execute('''
+                SELECT b.* FROM image_blobs b JOIN product_images pi ON pi.content_hash = b.content_hash
+                JOIN products p ON pi.product_id = p.id WHERE p.name = ?
+            ''', (f'{label} item',)).fetchone()
+        ok &= check(f"{label}: published without EXIF/GPS", row and not has_metadata(os.path.join('static', row['image_path'])))
+        ok &= check(f"{label}: stored under the hash of the stored bytes",
+                    row['content_hash'] == file_hash(row['image_path']) != hashlib.sha256(sent).hexdigest())
+    with connection() as db:
+        jobs.run_pending(db)
+        rows = db.execute('SELECT content_hash, image_path FROM image_blobs').fetchall()
+    ok &= check("Processing leaves every original matching its hash",
+                all(file_hash(row['image_path']) == row['content_hash'] for row in rows))
+    with connection() as db:
+        rotated = db.execute('''
+            SELECT b.image_path FROM image_blobs b JOIN product_images pi ON pi.content_hash = b.content_hash
+            JOIN products p ON pi.product_id = p.id WHERE p.name = 'Rotated JPEG item'
+        ''').fetchone()
+    with Image.open(os.path.join('static', rotated['image_path'])) as image:
+        ok &= check("A rotated photo is stored upright", image.width > image.height, image.size)
+
+    print(f"\n=== {args.threads} threads listing and deleting one photo ===")
+    raced = photo(3)
+    raced_hash = hashlib.sha256(raced).hexdigest()
+    with connection() as db:
+        clients = [seller_client(db) for _ in range(args.threads)]
+    errors = []
+
+    def churn(racer, seed):
+        rng = random.Random(seed)
+        try:
+            for round_ in range(6):
+                product_id = list_product(racer, raced, name=f'Raced {seed}-{round_}')
+                time.sleep(rng.random() / 100)
+                if round_ < 5:
+                    delete_product(racer, product_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=churn, args=(racer, i)) for i, racer in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    row = blob(raced_hash)
+    ok &= check("No request failed", not errors, errors[:3])
+    ok &= check("ref_count matches the listings left", row and row['ref_count'] == references(raced_hash) == args.threads,
+                (row['ref_count'] if row else None, references(raced_hash)))
+    ok &= check("The shared file survived", row and os.path.exists(os.path.join('static', row['image_path'])))
+
+    print("\n=== Garbage collection ===")
+    with connection() as db:
+        image_ids = [r['id'] for r in db.execute('''
+            SELECT pi.id FROM product_images pi JOIN products p ON pi.product_id = p.id WHERE p.product_id = ?
+        ''', (product_ids[0],)).fetchall()]
+    response = client.post(f'/sellers/product/{product_ids[0]}/image/{image_ids[0]}/delete')
+    ok &= check("Deleting one listing's image keeps the blob",
+                response.status_code == 200 and blob(content_hash)['ref_count'] == args.listings - 1
+                and os.path.exists(blob_files[0]))
+    for product_id in product_ids[1:-1]:
+        delete_product(client, product_id)
+    ok &= check("Deleting all but one listing keeps the blob",
+                blob(content_hash)['ref_count'] == 1 and os.path.exists(blob_files[0]))
+    with connection() as db:
+        image = db.execute('''
+            SELECT pi.* FROM product_images pi JOIN products p ON pi.product_id = p.id WHERE p.product_id = ?
+        ''', (product_ids[-1],)).fetchone()
+        db.execute('DELETE FROM product_images WHERE id = ?', (image['id'],))
+        uploads.release(db, image)
+        db.rollback()
+    ok &= check("A rolled-back last delete keeps the row and its files",
+                blob(content_hash)['ref_count'] == 1 and os.path.exists(blob_files[0])
+                and all(os.path.exists(path) for path in variant_paths))
+    delete_product(client, product_ids[-1])
+    ok &= check("The last delete removes the blob row", blob(content_hash) is None)
+    ok &= check("...but leaves its files to sweep()", os.path.exists(blob_files[0]))
+    with connection() as db:
+        swept = uploads.sweep(db, older_than=0)
+    ok &= check("sweep() deletes its file", swept and not os.path.exists(blob_files[0]), swept)
+    ok &= check("...and its variants", variant_paths and not any(os.path.exists(path) for path in variant_paths),
+                variant_paths)
+    raced_row = blob(raced_hash)
+    ok &= check("...but not the files of blobs still in use",
+                all(os.path.exists(os.path.join('static', path))
+                    for path in [raced_row['image_path']] + image_pipeline.variant_files(raced_row['variants'])))
+
+    orphan = os.path.join(uploads.UPLOAD_FOLDER, 'ab', 'ab' + '0' * 62 + '.jpg')
+    os.makedirs(os.path.dirname(orphan), exist_ok=True)
+    with open(orphan, 'wb') as f:
+        f.write(data)
+    os.utime(orphan, (time.time() - 2 * uploads.SWEEP_AGE_SECONDS,) * 2)
+    with connection() as db:
+        swept = uploads.sweep(db)
+    ok &= check("sweep() deletes files no blob owns", swept == 1 and not os.path.exists(orphan), swept)
+    ok &= check("...and keeps the ones blobs own",
+                os.path.exists(os.path.join('static', blob(raced_hash)['image_path'])))
+
+    print(f"\n{'✅ All upload checks passed' if ok else '❌ Upload checks failed'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Product Search - Full-text index over product name, description, category and store name.
+Uses FTS5 (ranked with BM25) on SQLite and a GIN-indexed tsvector (ranked with ts_rank) on PostgreSQL.
+"""
+
+import re
+
+from database import DB_TYPE
+
+# BM25 column weights: name, description, category, store_name
+BM25_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Weighted document: name (A) > store, category (B) > description (C)
+PG_UPDATE_VECTOR = '''
+    UPDATE products p
+    SET search_vector =
+        setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(s.store_name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p.category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+    FROM sellers s
+    WHERE s.id = p.seller_id
+'''
+
+FTS_INSERT = '''
+    INSERT INTO products_fts (rowid, name, description, category, store_name)
+    SELECT p.id, p.name, COALESCE(p.description, ''), p.category, s.store_name
+    FROM products p
+    JOIN sellers s ON p.seller_id = s.id
+'''
+
+
+def init_search_index(db):
+    """Create the full-text index if missing, populating it from existing products."""
+    if DB_TYPE == 'postgresql':
+        db.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN(search_vector)')
+        db.commit()
+        return
+
+    exists = db.execute('''
+        SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'
+    ''').fetchone()
+    if exists:
+        return
+
+    db.execute('''
+        CREATE VIRTUAL TABLE products_fts USING fts5(
+            name, description, category, store_name,
+            tokenize = 'porter unicode61'
+        )
+    ''')
+    rebuild_index(db)
+
+
+def index_product(db, product_id):
+    """(Re)index one product by internal id. Call inside the writing transaction."""
+    if DB_TYPE == 'postgresql':
+        db.execute(PG_UPDATE_VECTOR + ' AND p.id = ?', (product_id,))
+        return
+
+    db.execute('DELETE FROM products_fts WHERE rowid = ?', (product_id,))
+    db.execute(FTS_INSERT + ' WHERE p.id = ?', (product_id,))
+
+
+def remove_product(db, product_id):
+    """Drop one product (internal id) from the index."""
+    if DB_TYPE == 'postgresql':
+        # The tsvector lives on the product row and goes with it
+        return
+    db.execute('DELETE FROM products_fts WHERE rowid = ?', (product_id,))
+
+
+def rebuild_index(db):
+    """Rebuild the whole index from the products table. Returns rows indexed."""
+    if DB_TYPE == 'postgresql':
+        cursor = db.execute(PG_UPDATE_VECTOR)
+        db.commit()
+        return cursor.rowcount
+
+    db.execute('DELETE FROM products_fts')
+    cursor = db.execute(FTS_INSERT)
+    db.commit()
+    return cursor.rowcount
+
+
+def to_fts_query(text):
+    """Turn free text into an FTS5 query: every word must match (as a prefix)."""
+    tokens = TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def match_join(text):
+    """
+    SQL JOIN restricting products `p` to full-text matches for `text`.
+
+    Returns (join_sql, params). The joined `fts.rank` column orders results by
+    relevance ascending (best first). Returns ('', []) when `text` has no words.
+    """
+    if DB_TYPE == 'postgresql':
+        if not TOKEN_RE.search(text or ''):
+            return '', []
+        return '''
+            JOIN (
+                SELECT id AS rowid, -ts_rank(search_vector, q) AS rank
+                FROM products, websearch_to_tsquery('english', ?) q
+                WHERE search_vector @@ q
+            ) fts ON fts.rowid = p.id
+        ''', [text]
+
+    query = to_fts_query(text)
+    if not query:
+        return '', []
+    # Weighted BM25 via FTS5's rank column (usable inside joins, unlike bm25())
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    return '''
+        JOIN (
+            SELECT rowid, rank
+            FROM products_fts
+            WHERE products_fts MATCH ? AND rank MATCH ?
+        ) fts ON fts.rowid = p.id
+    ''', [query, f'bm25({weights})']
@@ -0,0 +1,134 @@
+"""
+Seller Stats Read Model - One seller_stats row per seller with dashboard counters.
+Updated incrementally in the same transaction as product, order and fulfilment writes,
+so the seller dashboard and analytics pages read a single row instead of aggregating.
+"""
+
+from collections import defaultdict
+
+EMPTY_STATS = {
+    'product_count': 0,
+    'order_count': 0,
+    'pending_count': 0,
+    'gross_sales': 0,
+    'last_order_at': None,
+}
+
+
+def _ensure_row(db, seller_id):
+    db.execute('''
+        INSERT INTO seller_stats (seller_id) VALUES (?)
+        ON CONFLICT (seller_id) DO NOTHING
+    ''', (seller_id,))
+
+
+def init_seller_stats(db):
+    """Backfill the read model the first time it is found empty."""
+    if db.execute('SELECT 1 FROM seller_stats LIMIT 1').fetchone():
+        return
+    rebuild(db)
+
+
+def get_stats(db, seller_id):
+    """Stats for one seller (internal id); zeros if nothing recorded yet."""
+    row = db.execute('SELECT * FROM seller_stats WHERE seller_id = ?', (seller_id,)).fetchone()
+    return dict(row) if row else dict(EMPTY_STATS, seller_id=seller_id)
+
+
+def product_added(db, seller_id, count=1):
+    """Record new product(s) for a seller."""
+    db.execute('''
+        INSERT INTO seller_stats (seller_id, product_count) VALUES (?, ?)
+        ON CONFLICT (seller_id) DO UPDATE SET
+            product_count = seller_stats.product_count + excluded.product_count,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (seller_id, count))
+
+
+def product_removed(db, seller_id, count=1):
+    """Record deleted product(s) for a seller."""
+    product_added(db, seller_id, -count)
+
+
+def record_order_items(db, items):
+    """
+    Record newly created order items.
+
+    `items` is an iterable of (seller_id, subtotal) pairs; one upsert is issued
+    per seller, not per line.
+    """
+    per_seller = defaultdict(lambda: [0, 0.0])
+    for seller_id, subtotal in items:
+        per_seller[seller_id][0] += 1
+        per_seller[seller_id][1] += subtotal
+
+    db.executemany('''
+        INSERT INTO seller_stats (seller_id, order_count, pending_count, gross_sales, last_order_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (seller_id) DO UPDATE SET
+            order_count = seller_stats.order_count + excluded.order_count,
+            pending_count = seller_stats.pending_count + excluded.pending_count,
+            gross_sales = seller_stats.gross_sales + excluded.gross_sales,
+            last_order_at = excluded.last_order_at,
+            updated_at = CURRENT_TIMESTAMP
+    ''', [(seller_id, count, count, sales) for seller_id, (count, sales) in per_seller.items()])
+
+
+def record_fulfillment(db, seller_id, previous_status):
+    """Record an order item leaving the 'pending' fulfilment state."""
+    if previous_status != 'pending':
+        return
+    _ensure_row(db, seller_id)
+    db.execute('''
+        UPDATE seller_stats
+        SET pending_count = pending_count - 1, updated_at = CURRENT_TIMESTAMP
+        WHERE seller_id = ?
+    ''', (seller_id,))
+
+
+def rebuild(db, seller_id=None):
+    """
+    Recompute stats from products and order_items (all sellers, or one).
+    Returns the number of sellers rebuilt.
+    """
+    where = 'WHERE s.id = ?' if seller_id is not None else ''
+    params = (seller_id,) if seller_id is not None else ()
+
+    rows = db.execute(f'''
+        SELECT s.id AS seller_id,
+               COALESCE(p.product_count, 0) AS product_count,
+               COALESCE(oi.order_count, 0) AS order_count,
+               COALESCE(oi.pending_count, 0) AS pending_count,
+               COALESCE(oi.gross_sales, 0) AS gross_sales,
+               oi.last_order_at
+        FROM sellers s
+        LEFT JOIN (
+            SELECT seller_id, COUNT(*) AS product_count
+            FROM products GROUP BY seller_id
+        ) p ON p.seller_id = s.id
+        LEFT JOIN (
+            SELECT seller_id,
+                   COUNT(*) AS order_count,
+                   SUM(CASE WHEN fulfillment_status = 'pending' THEN 1 ELSE 0 END) AS pending_count,
+                   SUM(subtotal) AS gross_sales,
+                   MAX(created_at) AS last_order_at
+            FROM order_items GROUP BY seller_id
+        ) oi ON oi.seller_id = s.id
+        {where}
+    ''', params).fetchall()
+
+    db.executemany('''
+        INSERT INTO seller_stats
+            (seller_id, product_count, order_count, pending_count, gross_sales, last_order_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (seller_id) DO UPDATE SET
+            product_count = excluded.product_count,
+            order_count = excluded.order_count,
+            pending_count = excluded.pending_count,
+            gross_sales = excluded.gross_sales,
+            last_order_at = excluded.last_order_at,
+            updated_at = excluded.updated_at
+    ''', [(row['seller_id'], row['product_count'], row['order_count'], row['pending_count'],
+           row['gross_sales'], row['last_order_at']) for row in rows])
+    db.commit()
+    return len(rows)
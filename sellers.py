@@ -8,19 +8,32 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
 from pathlib import Path
-import sqlite3
+from datetime import datetime
 import uuid
 import re
 import os
 
+from database import get_db
+import search as search_index
+import pagination
+import seller_stats
+import sales_rollups
+import cache
+import http_cache
+import image_pipeline
+import uploads
+import streaming
+import facets
+
 sellers_bp = Blueprint('sellers', __name__, url_prefix='/sellers')
 
+# Listing page sizes (keyset paginated)
+PRODUCTS_PER_PAGE = 24
+ORDERS_PER_PAGE = 50
 
-def get_db():
-    """Local DB helper to avoid circular import."""
-    db = sqlite3.connect('zimclassifieds.db')
-    db.row_factory = sqlite3.Row
-    return db
+# Analytics window (days) and platform commission on seller revenue
+ANALYTICS_DAYS = 30
+COMMISSION_RATE = 0.15
 
 
 def seller_required(f):
@@ -47,23 +60,31 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def save_uploaded_file(file):
-    """Save uploaded file and return relative path."""
+def save_uploaded_file(db, file):
+    """Store an uploaded image as a shared blob (see uploads.store); returns the blob row."""
     if not file or file.filename == '':
         return None
     
     if not allowed_file(file.filename):
         return None
     
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"{uuid.uuid4()}.{ext}"
-    
-    upload_folder = 'static/uploads'
-    os.makedirs(upload_folder, exist_ok=True)
-    
-    filepath = os.path.join(upload_folder, filename)
-    file.save(filepath)
-    return f"uploads/{filename}"
+    return uploads.store(db, file)
+
+
+def add_product_image(db, product_pk, blob, display_order, is_primary):
+    """Record a stored image; its variants are queued (rendered by the worker once committed) unless the blob has them."""
+    image_id = db.execute('''
+        INSERT INTO product_images (product_id, image_path, display_order, is_primary, content_hash, variants)
+        VALUES (?, ?, ?, ?, ?, ?) RETURNING id
+    ''', (product_pk, blob['image_path'], display_order, is_primary, blob['content_hash'],
+          blob['variants'])).fetchone()['id']
+    if not blob['variants']:
+        image_pipeline.process_image.enqueue(db, image_id)
+
+
+def catalogue_changed(store_slug):
+    """Drop cached listings and store pages after a seller's product write has committed."""
+    cache.invalidate('products', f'store:{store_slug}')
 
 
 @sellers_bp.route('/register', methods=['GET', 'POST'])
@@ -119,6 +140,7 @@ def register():
             
             db.commit()
             db.close()
+            cache.invalidate(f'store:{store_slug}')
             
             # Auto-login
             session['user_id'] = user_id
@@ -145,24 +167,8 @@ def dashboard():
     # Get seller info
     seller = db.execute('SELECT * FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     
-    # Get stats
-    products_count = db.execute('SELECT COUNT(*) as count FROM products WHERE seller_id = (SELECT id FROM sellers WHERE seller_id = ?)', (seller_id,)).fetchone()['count']
-    
-    total_orders = db.execute('''
-        SELECT COUNT(*) as count FROM order_items
-        WHERE seller_id = (SELECT id FROM sellers WHERE seller_id = ?)
-    ''', (seller_id,)).fetchone()['count']
-    
-    pending_orders = db.execute('''
-        SELECT COUNT(*) as count FROM order_items
-        WHERE seller_id = (SELECT id FROM sellers WHERE seller_id = ?)
-        AND fulfillment_status = 'pending'
-    ''', (seller_id,)).fetchone()['count']
-    
-    total_sales = db.execute('''
-        SELECT SUM(subtotal) as total FROM order_items
-        WHERE seller_id = (SELECT id FROM sellers WHERE seller_id = ?)
-    ''', (seller_id,)).fetchone()['total'] or 0
+    # Get stats (single row from the seller_stats read model)
+    stats = seller_stats.get_stats(db, seller['id'])
     
     # Recent orders
     recent_orders = db.execute('''
@@ -171,19 +177,19 @@ def dashboard():
         JOIN orders o ON oi.order_id = o.id
         JOIN users u ON o.user_id = u.user_id
         JOIN products p ON oi.product_id = p.id
-        WHERE oi.seller_id = (SELECT id FROM sellers WHERE seller_id = ?)
-        ORDER BY o.created_at DESC
+        WHERE oi.seller_id = ?
+        ORDER BY oi.created_at DESC, oi.id DESC
         LIMIT 10
-    ''', (seller_id,)).fetchall()
+    ''', (seller['id'],)).fetchall()
     
     db.close()
     
     return render_template('sellers/dashboard.html',
                          seller=seller,
-                         products_count=products_count,
-                         total_orders=total_orders,
-                         pending_orders=pending_orders,
-                         total_sales=total_sales,
+                         products_count=stats['product_count'],
+                         total_orders=stats['order_count'],
+                         pending_orders=stats['pending_count'],
+                         total_sales=stats['gross_sales'] or 0,
                          recent_orders=recent_orders)
 
 
@@ -219,7 +225,7 @@ def new_product():
         seller_id = session['seller_id']
         
         # Get seller's internal ID
-        seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
+        seller_data = db.execute('SELECT id, store_slug FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
         seller_internal_id = seller_data['id'] if seller_data else None
         
         name = request.form.get('name')
@@ -266,12 +272,9 @@ def new_product():
         if uploaded_files:
             for idx, file in enumerate(uploaded_files[:10]):  # Limit to 10 images
                 if file and file.filename and allowed_file(file.filename):
-                    image_path = save_uploaded_file(file)
-                    if image_path:
-                        db.execute('''
-                            INSERT INTO product_images (product_id, image_path, display_order, is_primary)
-                            VALUES (?, ?, ?, ?)
-                        ''', (product_internal_id, image_path, idx, 1 if idx == 0 else 0))
+                    blob = save_uploaded_file(db, file)
+                    if blob:
+                        add_product_image(db, product_internal_id, blob, idx, 1 if idx == 0 else 0)
         
         # Create inventory record
         inventory_id = str(uuid.uuid4())
@@ -280,8 +283,13 @@ def new_product():
             VALUES (?, ?, ?)
         ''', (inventory_id, product_internal_id, stock_quantity))
         
+        search_index.index_product(db, product_internal_id)
+        seller_stats.product_added(db, seller_internal_id)
+        facets.record(db, {}, [product_internal_id])
+        
         db.commit()
         db.close()
+        catalogue_changed(seller_data['store_slug'])
         
         return redirect(url_for('sellers.products'))
     
@@ -296,7 +304,7 @@ def edit_product(product_id):
     seller_id = session['seller_id']
     
     # Get seller's internal ID
-    seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
+    seller_data = db.execute('SELECT id, store_slug FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     seller_internal_id = seller_data['id'] if seller_data else None
     
     product = db.execute('SELECT * FROM products WHERE product_id = ? AND seller_id = ?', (product_id, seller_internal_id)).fetchone()
@@ -324,6 +332,7 @@ def edit_product(product_id):
             error = 'Invalid input.'
         
         if not error:
+            facets_before = facets.snapshot(db, [product['id']])
             db.execute('''
                 UPDATE products
                 SET name = ?, description = ?, price = ?, stock_quantity = ?, status = ?, updated_at = CURRENT_TIMESTAMP
@@ -336,6 +345,9 @@ def edit_product(product_id):
                 WHERE product_id = (SELECT id FROM products WHERE product_id = ?)
             ''', (stock_quantity, product_id))
             
+            search_index.index_product(db, product['id'])
+            facets.record(db, facets_before)
+            
             # Handle new image uploads
             uploaded_files = request.files.getlist('images')
             if uploaded_files:
@@ -348,17 +360,15 @@ def edit_product(product_id):
                         break
                     
                     if file and file.filename and allowed_file(file.filename):
-                        image_path = save_uploaded_file(file)
-                        if image_path:
+                        blob = save_uploaded_file(db, file)
+                        if blob:
                             # If no images exist, make this the primary
                             is_primary = 1 if current_count == 0 and idx == 0 else 0
-                            db.execute('''
-                                INSERT INTO product_images (product_id, image_path, display_order, is_primary)
-                                VALUES (?, ?, ?, ?)
-                            ''', (product['id'], image_path, current_count + idx, is_primary))
+                            add_product_image(db, product['id'], blob, current_count + idx, is_primary)
             
             db.commit()
             db.close()
+            catalogue_changed(seller_data['store_slug'])
             
             return redirect(url_for('sellers.products'))
         
@@ -378,7 +388,7 @@ def delete_product(product_id):
     seller_id = session['seller_id']
     
     # Get seller's internal ID
-    seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
+    seller_data = db.execute('SELECT id, store_slug FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     seller_internal_id = seller_data['id'] if seller_data else None
     
     product = db.execute('SELECT * FROM products WHERE product_id = ? AND seller_id = ?', (product_id, seller_internal_id)).fetchone()
@@ -387,9 +397,20 @@ def delete_product(product_id):
         db.close()
         return jsonify({'success': False, 'message': 'Product not found'}), 404
     
+    # Release the product's images (uploads.sweep() deletes files once nothing uses them)
+    images = db.execute('SELECT * FROM product_images WHERE product_id = ?', (product['id'],)).fetchall()
+    db.execute('DELETE FROM product_images WHERE product_id = ?', (product['id'],))
+    for image in images:
+        uploads.release(db, image)
+    
+    facets_before = facets.snapshot(db, [product['id']])
     db.execute('DELETE FROM products WHERE product_id = ?', (product_id,))
+    search_index.remove_product(db, product['id'])
+    seller_stats.product_removed(db, seller_internal_id)
+    facets.record(db, facets_before)
     db.commit()
     db.close()
+    catalogue_changed(seller_data['store_slug'])
     
     return jsonify({'success': True, 'message': 'Product deleted'})
 
@@ -402,7 +423,7 @@ def delete_product_image(product_id, image_id):
     seller_id = session['seller_id']
     
     # Verify ownership
-    seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
+    seller_data = db.execute('SELECT id, store_slug FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     product = db.execute('SELECT * FROM products WHERE product_id = ? AND seller_id = ?', 
                         (product_id, seller_data['id'])).fetchone()
     
@@ -418,16 +439,9 @@ def delete_product_image(product_id, image_id):
         db.close()
         return jsonify({'success': False, 'error': 'Image not found'}), 404
     
-    # Delete file
-    try:
-        filepath = os.path.join('static', image['image_path'])
-        if os.path.exists(filepath):
-            os.remove(filepath)
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-    
-    # Delete from database
+    # Delete from database (the file is swept once no other listing uses it)
     db.execute('DELETE FROM product_images WHERE id = ?', (image_id,))
+    uploads.release(db, image)
     
     # If this was primary, make another image primary
     if image['is_primary']:
@@ -441,8 +455,11 @@ def delete_product_image(product_id, image_id):
         if next_image:
             db.execute('UPDATE product_images SET is_primary = 1 WHERE id = ?', (next_image['id'],))
     
+    db.execute('UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (product['id'],))
+    
     db.commit()
     db.close()
+    catalogue_changed(seller_data['store_slug'])
     
     return jsonify({'success': True})
 
@@ -455,7 +472,7 @@ def set_primary_image(product_id, image_id):
     seller_id = session['seller_id']
     
     # Verify ownership
-    seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
+    seller_data = db.execute('SELECT id, store_slug FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     product = db.execute('SELECT * FROM products WHERE product_id = ? AND seller_id = ?', 
                         (product_id, seller_data['id'])).fetchone()
     
@@ -470,8 +487,11 @@ def set_primary_image(product_id, image_id):
     db.execute('UPDATE product_images SET is_primary = 1 WHERE id = ? AND product_id = ?', 
               (image_id, product['id']))
     
+    db.execute('UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (product['id'],))
+    
     db.commit()
     db.close()
+    catalogue_changed(seller_data['store_slug'])
     
     return jsonify({'success': True})
 
@@ -487,20 +507,35 @@ def orders():
     seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     seller_internal_id = seller_data['id'] if seller_data else None
     
-    # Get seller's order items
-    order_items = db.execute('''
-        SELECT oi.*, o.order_number, o.created_at as order_date, u.full_name as customer_name, p.name as product_name
+    # Get seller's order items (newest first, keyset paginated)
+    sort_columns = [('oi.created_at', 'created_at'), ('oi.id', 'id')]
+    after, after_params = pagination.keyset_condition(sort_columns, True, request.args.get('cursor'))
+    query = f'''
+        SELECT oi.*, o.order_number, o.created_at as order_date, u.full_name as customer_name, p.name as product_name,
+               oi.fulfillment_status as status, oi.subtotal as total_amount, oi.quantity as item_count,
+               o.shipping_address, o.shipping_city, o.shipping_suburb
         FROM order_items oi
         JOIN orders o ON oi.order_id = o.id
         JOIN users u ON o.user_id = u.user_id
         JOIN products p ON oi.product_id = p.id
-        WHERE oi.seller_id = ?
-        ORDER BY o.created_at DESC
-    ''', (seller_internal_id,)).fetchall()
+        WHERE oi.seller_id = ? {'AND ' + after if after else ''}
+        {pagination.order_clause(sort_columns, True)}
+        LIMIT ?
+    '''
+    params = (seller_internal_id, *after_params, ORDERS_PER_PAGE + 1)
+    
+    if pagination.wants_json():
+        rows = db.execute(query, params).fetchall()
+        order_items, next_cursor = pagination.split_page(rows, sort_columns, ORDERS_PER_PAGE)
+        db.close()
+        return pagination.json_page('orders', order_items, next_cursor)
     
-    db.close()
+    total_orders = seller_stats.get_stats(db, seller_internal_id)['order_count']
     
-    return render_template('sellers/orders.html', orders=order_items)
+    # Rows are read off the cursor while the page streams
+    return streaming.render('sellers/orders.html',
+                            orders=streaming.Page(db.iterate(query, params), sort_columns, ORDERS_PER_PAGE),
+                            total_orders=total_orders)
 
 
 @sellers_bp.route('/order/<int:order_item_id>/fulfill', methods=['POST'])
@@ -524,11 +559,15 @@ def fulfill_order(order_item_id):
         db.close()
         return jsonify({'success': False, 'message': 'Order not found'}), 404
     
-    db.execute('''
+    # Conditional on the status we read, so a concurrent fulfil can't double-count
+    updated = db.execute('''
         UPDATE order_items
         SET fulfillment_status = 'shipped', tracking_number = ?, shipped_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (tracking_number, order_item_id))
+        WHERE id = ? AND fulfillment_status = ?
+    ''', (tracking_number, order_item_id, order_item['fulfillment_status'])).rowcount
+    
+    if updated:
+        seller_stats.record_fulfillment(db, seller_internal_id, order_item['fulfillment_status'])
     
     db.commit()
     db.close()
@@ -547,73 +586,138 @@ def analytics():
     seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (seller_id,)).fetchone()
     seller_internal_id = seller_data['id'] if seller_data else None
     
-    # Total sales
-    total_sales = db.execute('''
-        SELECT SUM(subtotal) as total FROM order_items
-        WHERE seller_id = ?
-    ''', (seller_internal_id,)).fetchone()['total'] or 0
-    
-    # Total orders
-    total_orders = db.execute('''
-        SELECT COUNT(*) as count FROM order_items WHERE seller_id = ?
-    ''', (seller_internal_id,)).fetchone()['count']
-    
-    # Top products
-    top_products = db.execute('''
-        SELECT p.name, COUNT(oi.id) as qty_sold, SUM(oi.subtotal) as sales
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        WHERE oi.seller_id = ?
-        GROUP BY p.id
-        ORDER BY qty_sold DESC
-        LIMIT 10
-    ''', (seller_internal_id,)).fetchall()
-    
-    # Monthly sales (last 6 months)
-    monthly_sales = db.execute('''
-        SELECT DATE(oi.created_at) as sale_date, SUM(oi.subtotal) as daily_total
-        FROM order_items oi
-        WHERE oi.seller_id = ? AND oi.created_at >= date('now', '-6 months')
-        GROUP BY DATE(oi.created_at)
-        ORDER BY oi.created_at DESC
-    ''', (seller_internal_id,)).fetchall()
+    # All figures come from the seller_stats row and the sales rollups
+    stats = seller_stats.get_stats(db, seller_internal_id)
+    daily = sales_rollups.seller_series(db, seller_internal_id, 'daily', ANALYTICS_DAYS)
+    monthly = sales_rollups.seller_series(db, seller_internal_id, 'monthly', 6)
+    top_products = sales_rollups.top_products(db, seller_internal_id, ANALYTICS_DAYS)
+    sales_by_category = sales_rollups.category_breakdown(db, seller_internal_id, ANALYTICS_DAYS)
     
     db.close()
     
+    period_sales = sum(day['revenue'] for day in daily)
+    period_orders = sum(day['order_count'] for day in daily)
+    metrics = {
+        'total_sales': period_sales,
+        'total_orders': period_orders,
+        'pending_orders': stats['pending_count'],
+        'avg_order_value': period_sales / period_orders if period_orders else 0,
+        'total_commission': period_sales * COMMISSION_RATE,
+        'sales_by_category': sales_by_category
+    }
+    
+    top_products = [dict(product, commission=(product['revenue'] or 0) * COMMISSION_RATE)
+                    for product in top_products]
+    
+    monthly_summary = [{
+        'month': datetime.strptime(month['period_start'], '%Y-%m-%d').strftime('%B %Y'),
+        'orders': month['order_count'],
+        'revenue': month['revenue'],
+        'commission': month['revenue'] * COMMISSION_RATE,
+        'net_revenue': month['revenue'] * (1 - COMMISSION_RATE)
+    } for month in reversed(monthly)]
+    
     return render_template('sellers/analytics.html',
-                         total_sales=total_sales,
-                         total_orders=total_orders,
+                         metrics=metrics,
                          top_products=top_products,
-                         monthly_sales=monthly_sales)
+                         monthly_summary=monthly_summary,
+                         revenue_series=daily)
 
 
-@sellers_bp.route('/<store_slug>')
-def view_store(store_slug):
-    """Public seller store page."""
+@sellers_bp.route('/api/analytics')
+@seller_required
+def analytics_api():
+    """Sales analytics as JSON (?grain=daily|weekly|monthly&periods=N&days=N)."""
+    grain = request.args.get('grain', 'daily')
+    if grain not in sales_rollups.GRAINS:
+        return jsonify({'success': False, 'message': 'grain must be daily, weekly or monthly'}), 400
+    periods = min(max(request.args.get('periods', ANALYTICS_DAYS, type=int), 1), 366)
+    days = min(max(request.args.get('days', ANALYTICS_DAYS, type=int), 1), 3660)
+    
     db = get_db()
+    seller_data = db.execute('SELECT id FROM sellers WHERE seller_id = ?', (session['seller_id'],)).fetchone()
+    seller_internal_id = seller_data['id'] if seller_data else None
+    
+    stats = seller_stats.get_stats(db, seller_internal_id)
+    series = sales_rollups.seller_series(db, seller_internal_id, grain, periods)
+    top_products = sales_rollups.top_products(db, seller_internal_id, days)
+    categories = sales_rollups.category_breakdown(db, seller_internal_id, days)
     
-    seller = db.execute('SELECT * FROM sellers WHERE store_slug = ?', (store_slug,)).fetchone()
+    db.close()
     
-    if not seller:
+    return jsonify({
+        'success': True,
+        'totals': {
+            'product_count': stats['product_count'],
+            'order_count': stats['order_count'],
+            'pending_count': stats['pending_count'],
+            'gross_sales': float(stats['gross_sales'] or 0),
+            'last_order_at': str(stats['last_order_at']) if stats['last_order_at'] else None
+        },
+        'grain': grain,
+        'series': series,
+        'top_products': [dict(product) for product in top_products],
+        'categories': categories
+    })
+
+
+def store_page(store_slug, cursor=None):
+    """A store's seller, product page (at cursor) and rating summary, or None if there is no such store."""
+    def load():
+        db = get_db()
+        seller = db.execute('SELECT * FROM sellers WHERE store_slug = ?', (store_slug,)).fetchone()
+        
+        if not seller:
+            db.close()
+            return None
+        
+        # Get seller's products (newest first, keyset paginated)
+        sort_columns = [('p.created_at', 'created_at'), ('p.id', 'id')]
+        after, after_params = pagination.keyset_condition(sort_columns, True, cursor)
+        rows = db.execute(f'''
+            SELECT p.*, {image_pipeline.PRIMARY_IMAGE_COLUMNS}
+            FROM products p
+            {image_pipeline.PRIMARY_IMAGE_JOIN}
+            WHERE p.seller_id = ? AND p.status = 'active' {'AND ' + after if after else ''}
+            {pagination.order_clause(sort_columns, True)}
+            LIMIT ?
+        ''', (seller['id'], *after_params, PRODUCTS_PER_PAGE + 1)).fetchall()
+        products, next_cursor = pagination.split_page(rows, sort_columns, PRODUCTS_PER_PAGE)
+        
+        # Get seller's ratings
+        ratings = db.execute('''
+            SELECT AVG(rating) as avg_rating, COUNT(*) as review_count
+            FROM seller_ratings WHERE seller_id = ?
+        ''', (seller['id'],)).fetchone()
         db.close()
-        return 'Store not found', 404
+        
+        return {
+            'seller': dict(seller),
+            'products': [dict(row) for row in products],
+            'next_cursor': next_cursor,
+            'avg_rating': ratings['avg_rating'] if ratings else 0,
+            'review_count': ratings['review_count'] if ratings else 0
+        }
     
-    # Get seller's products
-    products = db.execute('''
-        SELECT * FROM products WHERE seller_id = ? AND status = 'active'
-        ORDER BY created_at DESC
-    ''', (seller['id'],)).fetchall()
+    return cache.get_or_set(f'seller-page:{store_slug}:{cursor or ""}', load, tags=(f'store:{store_slug}',))
+
+
+@sellers_bp.route('/<store_slug>')
+@http_cache.conditional(lambda store_slug: store_page(store_slug, request.args.get('cursor')))
+def view_store(store_slug):
+    """Public seller store page."""
+    page = store_page(store_slug, request.args.get('cursor'))
     
-    # Get seller's ratings
-    ratings = db.execute('''
-        SELECT AVG(rating) as avg_rating, COUNT(*) as review_count
-        FROM seller_ratings WHERE seller_id = ?
-    ''', (seller['id'],)).fetchone()
+    if not page:
+        return 'Store not found', 404
     
-    db.close()
+    if pagination.wants_json():
+        return pagination.json_page('products', page['products'], page['next_cursor'])
     
     return render_template('sellers/store.html',
-                         seller=seller,
-                         products=products,
-                         avg_rating=ratings['avg_rating'] if ratings else 0,
-                         review_count=ratings['review_count'] if ratings else 0)
+                         seller=page['seller'],
+                         products=page['products'],
+                         avg_rating=page['avg_rating'],
+                         review_count=page['review_count'],
+                         grid_key=http_cache.version_key(page['products']),
+                         next_url=pagination.next_page_url(page['next_cursor']))
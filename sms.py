@@ -0,0 +1,161 @@
+"""
+SMS - Bulk text messages through Africa's Talking.
+One API call carries the same message to up to BATCH_SIZE recipients. Calls are
+rate limited per process, and failed calls (network errors, 429, 5xx) or
+recipients the gateway could not reach yet are retried with backoff.
+Set SMS_API_URL to point at another compatible host (e.g. scripts/fake_sms_gateway.py).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Recipients per API call (one message text per call)
+BATCH_SIZE = 100
+
+# API calls per second from this process
+RATE_LIMIT_PER_SECOND = float(os.environ.get('SMS_RATE_LIMIT', 5))
+
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1
+HTTP_TIMEOUT = 15
+
+# Per-recipient statusCodes: delivered to the network, or worth sending again
+SENT_CODES = {100, 101, 102}
+RETRY_CODES = {500, 501}
+
+ZIMBABWE_DIALLING_CODE = '263'
+
+
+def _load_config():
+    config_path = os.path.join(os.path.dirname(__file__), 'config.json')
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config = json.load(f).get('africastalking', {})
+    username = os.environ.get('AFRICASTALKING_USERNAME', config.get('username', 'sandbox'))
+    api_key = os.environ.get('AFRICASTALKING_API_KEY', config.get('api_key', ''))
+    default_url = ('https://api.sandbox.africastalking.com' if username == 'sandbox'
+                   else 'https://api.africastalking.com')
+    return {
+        'username': username,
+        'api_key': '' if api_key.startswith('YOUR_') else api_key,
+        'sender_id': os.environ.get('SMS_SENDER_ID', config.get('sender_id', '')),
+        'url': os.environ.get('SMS_API_URL', default_url).rstrip('/') + '/version1/messaging',
+    }
+
+
+CONFIG = _load_config()
+
+_counters = {'calls': 0, 'retries': 0, 'sent': 0, 'failed': 0, 'throttled_s': 0.0, 'send_s': 0.0}
+_counters_lock = threading.Lock()
+_next_call_at = [0.0]
+_rate_lock = threading.Lock()
+
+
+def configured():
+    return bool(CONFIG['api_key'])
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def normalise_number(phone):
+    """'0771 234 567' / '263771234567' / '+263...' -> '+263771234567'; None if unusable."""
+    digits = ''.join(ch for ch in (phone or '') if ch.isdigit() or ch == '+')
+    if digits.startswith('+'):
+        number = digits
+    elif digits.startswith('00'):
+        number = '+' + digits[2:]
+    elif digits.startswith('0'):
+        number = '+' + ZIMBABWE_DIALLING_CODE + digits[1:]
+    elif digits.startswith(ZIMBABWE_DIALLING_CODE):
+        number = '+' + digits
+    else:
+        return None
+    return number if 10 <= len(number) <= 16 and '+' not in number[1:] else None
+
+
+def _throttle():
+    """Block until this process may make its next API call."""
+    with _rate_lock:
+        now = time.monotonic()
+        wait = max(0.0, _next_call_at[0] - now)
+        _next_call_at[0] = max(now, _next_call_at[0]) + 1 / RATE_LIMIT_PER_SECOND
+    if wait:
+        _count('throttled_s', wait)
+        time.sleep(wait)
+
+
+def _post(message, numbers):
+    """One API call. Returns {number: statusCode}; raises on transport or HTTP errors."""
+    _throttle()
+    _count('calls')
+    data = {'username': CONFIG['username'], 'to': ','.join(numbers), 'message': message}
+    if CONFIG['sender_id']:
+        data['from'] = CONFIG['sender_id']
+    response = requests.post(CONFIG['url'], data=data, timeout=HTTP_TIMEOUT,
+                             headers={'apiKey': CONFIG['api_key'], 'Accept': 'application/json'})
+    if response.status_code == 429 or response.status_code >= 500:
+        raise requests.HTTPError(f'{response.status_code} from SMS gateway', response=response)
+    response.raise_for_status()
+    recipients = response.json().get('SMSMessageData', {}).get('Recipients', [])
+    return {recipient.get('number'): int(recipient.get('statusCode', 0)) for recipient in recipients}
+
+
+def _send_batch(message, numbers):
+    """Send one batch, retrying what can be retried. Returns (sent, failed) number lists."""
+    sent, pending = [], list(numbers)
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            _count('retries')
+            time.sleep(BACKOFF_SECONDS * 2 ** (attempt - 1))
+        try:
+            statuses = _post(message, pending)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning('SMS batch of %s failed (attempt %s): %s', len(pending), attempt + 1, e)
+            continue
+        sent += [number for number in pending if statuses.get(number) in SENT_CODES]
+        pending = [number for number in pending if statuses.get(number) in RETRY_CODES]
+        if not pending:
+            break
+    delivered = set(sent)
+    return sent, [number for number in numbers if number not in delivered]
+
+
+def send_bulk(message, numbers):
+    """
+    Send `message` to every number (E.164), BATCH_SIZE recipients per API call.
+    Returns (sent, failed) lists of numbers.
+    """
+    start = time.perf_counter()
+    sent, failed = [], []
+    numbers = list(dict.fromkeys(numbers))
+    for i in range(0, len(numbers), BATCH_SIZE):
+        batch_sent, batch_failed = _send_batch(message, numbers[i:i + BATCH_SIZE])
+        sent += batch_sent
+        failed += batch_failed
+    _count('sent', len(sent))
+    _count('failed', len(failed))
+    _count('send_s', time.perf_counter() - start)
+    return sent, failed
+
+
+def stats():
+    """This process's SMS counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'configured': configured(),
+        'messages_per_second': round(process['sent'] / process['send_s'], 1) if process['send_s'] else 0,
+        'this_process': {key: round(value, 2) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
@@ -0,0 +1,13 @@
+function showAlert(message, type = 'info') {
+    const alertHtml = `<div class="alert alert-${type}">${message}</div>`;
+    document.body.insertAdjacentHTML('afterbegin', alertHtml);
+    setTimeout(() => {
+        document.querySelector('.alert').remove();
+    }, 3000);
+}
+
+function confirmDelete(event) {
+    if (!confirm('Are you sure you want to delete this?')) {
+        event.preventDefault();
+    }
+}
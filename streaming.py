@@ -0,0 +1,155 @@
+"""
+Streaming Pages - Listing pages rendered and sent while their rows are read.
+render() streams a template (flask.stream_template) instead of building the whole
+page first: markup up to a {{ stream_flush() }} marker (base.html puts one after the
+navigation) is sent before the page's query runs, and the rest goes out in chunks of
+about CHUNK_BYTES as rows come off the cursor. Page wraps a keyset page's rows
+(db.iterate() of a LIMIT per_page + 1 query, or rows already loaded) for the template
+to loop over once; its next_url is known when the loop ends. So time to first byte
+does not wait for the query, and memory holds a chunk of markup and a batch of rows
+rather than the page. Headers are sent before the rows are read: a query that fails
+mid-page cuts the response short instead of turning it into an error page.
+"""
+
+import os
+import threading
+import time
+
+from flask import current_app, render_template, stream_template
+from markupsafe import Markup
+
+import pagination
+
+ENABLED = os.environ.get('STREAM_PAGES', '1') != '0'
+
+# Markup buffered before a chunk is sent (compression flushes per chunk, so not too small)
+CHUNK_BYTES = int(os.environ.get('STREAM_CHUNK_BYTES', 8192))
+
+FLUSH_MARKER = '<!--stream-flush-->'
+
+_counters = {'pages': 0, 'rows': 0, 'chunks': 0, 'bytes': 0, 'first_chunk_s': 0.0, 'render_s': 0.0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+class Page:
+    """
+    One keyset page of rows, read as the template iterates it (once).
+    rows yields up to per_page + 1 rows in sort order; the extra row only tells
+    there is a next page. Truthiness reads the first row.
+    """
+
+    def __init__(self, rows, sort_columns, per_page, next_cursor=None):
+        self._rows = iter(rows)
+        self._peeked = []
+        self.sort_columns = sort_columns
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+
+    @classmethod
+    def loaded(cls, rows, next_cursor):
+        """A page already read, e.g. from the page cache."""
+        return cls(rows, None, len(rows), next_cursor)
+
+    def _next(self):
+        if self._peeked:
+            return self._peeked.pop()
+        return next(self._rows, None)
+
+    def __bool__(self):
+        if not self._peeked:
+            row = next(self._rows, None)
+            if row is None:
+                return False
+            self._peeked.append(row)
+        return True
+
+    def __iter__(self):
+        count, last = 0, None
+        try:
+            while count < self.per_page:
+                row = self._next()
+                if row is None:
+                    return
+                count += 1
+                last = row
+                yield row
+            if self._next() is not None and self.sort_columns:
+                self.next_cursor = pagination.encode_cursor([last[key] for _, key in self.sort_columns])
+        finally:
+            _count('rows', count)
+            if hasattr(self._rows, 'close'):
+                self._rows.close()
+
+    @property
+    def next_url(self):
+        """URL of the next page (None on the last page); read it after the loop."""
+        return pagination.next_page_url(self.next_cursor)
+
+
+def _flush():
+    return Markup(FLUSH_MARKER)
+
+
+def _chunked(parts):
+    """Join template output into chunks of about CHUNK_BYTES, cutting early at flush markers."""
+    start = time.perf_counter()
+    buffer, size, sent = [], 0, 0
+
+    def take():
+        nonlocal buffer, size, sent
+        chunk = ''.join(buffer)
+        buffer, size = [], 0
+        if not sent:
+            _count('first_chunk_s', time.perf_counter() - start)
+        sent += 1
+        _count('bytes', len(chunk))
+        return chunk
+
+    try:
+        for part in parts:
+            cut = FLUSH_MARKER in part
+            if cut:
+                part = str(part).replace(FLUSH_MARKER, '')
+            buffer.append(part)
+            size += len(part)
+            if size and (cut or size >= CHUNK_BYTES):
+                yield take()
+        if size:
+            yield take()
+    finally:
+        _count('chunks', sent)
+        _count('render_s', time.perf_counter() - start)
+
+
+def render(template_name, **context):
+    """render_template, streamed when STREAM_PAGES is on (pass Page objects for the rows)."""
+    if not ENABLED:
+        return render_template(template_name, **context)
+    _count('pages')
+    parts = stream_template(template_name, stream_flush=_flush, **context)
+    return current_app.response_class(_chunked(parts), mimetype='text/html')
+
+
+def stats():
+    """This process's streamed page counters (for /api/metrics)."""
+    with _counters_lock:
+        process = dict(_counters)
+    pages = process['pages']
+    return {
+        'enabled': ENABLED,
+        'chunk_bytes': CHUNK_BYTES,
+        'avg_first_chunk_ms': round(process['first_chunk_s'] / pages * 1000, 2) if pages else None,
+        'avg_render_ms': round(process['render_s'] / pages * 1000, 2) if pages else None,
+        'this_process': {key: round(value, 3) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
+
+
+def init_app(app):
+    # Outside render() (render_template, cached fragments) the marker is nothing
+    app.jinja_env.globals['stream_flush'] = lambda: ''
@@ -0,0 +1,137 @@
+"""
+Stripe Orders - Webhook-driven finalisation of paid Stripe checkouts.
+The cart is snapshotted when the Checkout Session is created; Stripe's
+checkout.session.completed webhook then turns that snapshot into an order exactly
+once, however many times the event is delivered. The success page only looks the
+order up, so a refresh or a lost redirect can never create a second order.
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+import credit_profile
+import inventory
+import jobs
+import order_writer
+
+logger = logging.getLogger(__name__)
+
+# Checkout lifecycle
+OPEN, FINALISED, FAILED = 'open', 'finalised', 'failed'
+
+# Event processing states
+RECEIVED, PROCESSED, IGNORED = 'received', 'processed', 'ignored'
+
+COMPLETED_EVENT = 'checkout.session.completed'
+
+
+def open_checkout(db, session_id, user_id, lines, shipping_cost=0):
+    """Remember what a Checkout Session is paying for (the cart as it was charged)."""
+    snapshot = [{
+        'product_id': line['product_id'],
+        'seller_id': line['seller_id'],
+        'quantity': line['quantity'],
+        'price': line['price'],
+    } for line in lines]
+    db.execute('''
+        INSERT INTO stripe_checkouts (session_id, user_id, lines, shipping_cost, status)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (session_id, user_id, json.dumps(snapshot), shipping_cost, OPEN))
+
+
+def record_event(db, event_id, session_id, event_type):
+    """
+    Store a webhook delivery in the idempotency table.
+
+    Returns False if this event, or another completion of the same session, was
+    already recorded (Stripe retries and duplicate deliveries are acknowledged only).
+    """
+    cursor = db.execute('''
+        INSERT INTO stripe_events (event_id, session_id, type, status)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (event_id, session_id, event_type, RECEIVED))
+    return cursor.rowcount > 0
+
+
+def _finish_event(db, session_id, status, error=None):
+    db.execute('''
+        UPDATE stripe_events
+        SET status = ?, last_error = ?, attempts = attempts + 1, processed_at = CURRENT_TIMESTAMP
+        WHERE session_id = ?
+    ''', (status, error, session_id))
+
+
+@jobs.task(max_attempts=8, priority=jobs.PRIORITY_HIGH)
+def finalise(db, session_id):
+    """
+    Create the order for a paid session. Safe to call any number of times.
+
+    Claiming the checkout (open -> finalised) and writing the order share one
+    transaction, so a concurrent or repeated call finds nothing to claim and a
+    crash part-way leaves the checkout open for a retry. Commits. Returns the
+    checkout's status afterwards, or None for an unknown session.
+    """
+    checkout = db.execute('''
+        UPDATE stripe_checkouts
+        SET status = ?, finalised_at = CURRENT_TIMESTAMP
+        WHERE session_id = ? AND status = ?
+        RETURNING user_id, lines, shipping_cost
+    ''', (FINALISED, session_id, OPEN)).fetchone()
+
+    if not checkout:
+        row = db.execute('SELECT status FROM stripe_checkouts WHERE session_id = ?', (session_id,)).fetchone()
+        _finish_event(db, session_id, PROCESSED if row else IGNORED, None if row else 'Unknown session')
+        db.commit()
+        return row['status'] if row else None
+
+    try:
+        order = order_writer.create_order(db, checkout['user_id'], json.loads(checkout['lines']), 'stripe',
+                                          payment_status='paid', status='confirmed',
+                                          shipping_cost=checkout['shipping_cost'], commit_stock=True)
+    except inventory.InsufficientStock as e:
+        # Paid but sold out in the meantime: keep the record for a refund
+        db.rollback()
+        db.execute('''
+            UPDATE stripe_checkouts
+            SET status = ?, error = ?, finalised_at = CURRENT_TIMESTAMP
+            WHERE session_id = ?
+        ''', (FAILED, str(e), session_id))
+        _finish_event(db, session_id, PROCESSED, str(e))
+        db.commit()
+        logger.warning('Stripe session %s paid but out of stock: %s', session_id, e)
+        return FAILED
+
+    db.execute('UPDATE stripe_checkouts SET order_id = ? WHERE session_id = ?', (order['order_id'], session_id))
+    credit_profile.invalidate(db, checkout['user_id'])
+    _finish_event(db, session_id, PROCESSED)
+    db.commit()
+    return FINALISED
+
+
+def process_pending(db, older_than_seconds=60):
+    """
+    Finalise recorded events still unprocessed (no worker running, or their job
+    exhausted its retries). Returns the number of sessions processed.
+    """
+    rows = db.execute('''
+        SELECT session_id FROM stripe_events
+        WHERE status = ? AND received_at < ?
+        ORDER BY received_at
+    ''', (RECEIVED, _seconds_ago(older_than_seconds))).fetchall()
+    for row in rows:
+        finalise(db, row['session_id'])
+    return len(rows)
+
+
+def _seconds_ago(seconds):
+    return (datetime.utcnow() - timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def checkout_status(db, session_id, user_id):
+    """A user's checkout (status, order_id, error) by session id, or None."""
+    return db.execute('''
+        SELECT status, order_id, error FROM stripe_checkouts
+        WHERE session_id = ? AND user_id = ?
+    ''', (session_id, user_id)).fetchone()
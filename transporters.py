@@ -6,18 +6,12 @@ Handles transporter registration, delivery assignments, and tracking for local a
 from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
-import sqlite3
 import uuid
 import re
 
-transporters_bp = Blueprint('transporters', __name__, url_prefix='/transporters')
-
+from database import get_db
 
-def get_db():
-    """Local DB helper to avoid circular import."""
-    db = sqlite3.connect('zimclassifieds.db')
-    db.row_factory = sqlite3.Row
-    return db
+transporters_bp = Blueprint('transporters', __name__, url_prefix='/transporters')
 
 
 def transporter_required(f):
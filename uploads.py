@@ -0,0 +1,261 @@
+"""
+Uploads - Streamed, content-addressed storage for product images.
+UploadRequest streams every multipart file part straight to a temp file under
+static/uploads/tmp, hashing it (SHA-256) as it is written, so an upload is never
+held in memory or read twice. store() drops the photo's EXIF/XMP (GPS, camera serials)
+first, so what is hashed and published never carries it, and keeps one blob per distinct
+upload (hash of the stored bytes) at uploads/<hash[:2]>/<hash>.<ext>, counted in image_blobs.ref_count
+by the product_images rows (content_hash) that use it; release() drops a reference
+and deletes the blob's row with the last one. Blob rows are written before files are
+placed, inside the caller's transaction, so the row lock orders an upload against a
+concurrent delete of the same image. Files are only deleted by sweep(), once no row
+references them, so a rolled-back delete never leaves rows pointing at missing files.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flask import Request
+from PIL import Image
+
+from database import DB_TYPE
+import image_pipeline
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = 'static/uploads'
+TMP_FOLDER = os.path.join(UPLOAD_FOLDER, 'tmp')
+
+# Pillow format -> stored extension (the upload's own name is not trusted)
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# sweep() leaves files younger than this alone (their transaction may still commit)
+SWEEP_AGE_SECONDS = 3600
+
+_counters = {'stored': 0, 'deduplicated': 0, 'rejected': 0, 'stripped': 0, 'released': 0, 'collected': 0,
+             'bytes_stored': 0, 'bytes_deduplicated': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def init_uploads(db):
+    """Add product_images.content_hash (NULL for images uploaded before blobs) and its index."""
+    if DB_TYPE == 'postgresql':
+        db.execute('ALTER TABLE product_images ADD COLUMN IF NOT EXISTS content_hash TEXT')
+    else:
+        columns = [row['name'] for row in db.execute('PRAGMA table_info(product_images)').fetchall()]
+        if 'content_hash' not in columns:
+            db.execute('ALTER TABLE product_images ADD COLUMN content_hash TEXT')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_product_images_content_hash ON product_images(content_hash)')
+    db.commit()
+
+
+class HashingFile:
+    """A temp file in TMP_FOLDER that hashes what is written to it (deleted when closed)."""
+
+    def __init__(self):
+        os.makedirs(TMP_FOLDER, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=TMP_FOLDER, prefix='upload-')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request whose multipart file parts are streamed to HashingFiles in chunks."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile()
+
+
+def _spooled(file):
+    """The upload's HashingFile, copying it into one if it was not parsed by UploadRequest."""
+    if isinstance(file.stream, HashingFile):
+        return file.stream
+    spooled = HashingFile()
+    file.stream.seek(0)
+    shutil.copyfileobj(file.stream, spooled)
+    file.stream = spooled
+    return spooled
+
+
+def _without_metadata(stream):
+    """The upload as it will be published: a stripped HashingFile copy, or `stream` if it had no metadata."""
+    clean = HashingFile()
+    try:
+        stripped = image_pipeline.strip_metadata(stream.name, clean)
+    except Exception:
+        clean.close()
+        raise
+    if not stripped:
+        clean.close()
+        return stream
+    clean.flush()
+    _count('stripped')
+    return clean
+
+
+def _static_path(relative_path):
+    return os.path.join('static', relative_path)
+
+
+def _place(source, relative_path):
+    """Put the temp file at the blob's path (hard link, else copy), atomically."""
+    path = _static_path(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, temporary)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, path)
+
+
+def store(db, file):
+    """
+    Store an uploaded image and add a reference to its blob, in the caller's transaction.
+    Returns the image_blobs row (content_hash, image_path, variants), or None if the
+    file is not an image in an allowed format. Pair with a product_images row.
+    """
+    stream = _spooled(file)
+    stream.flush()
+    try:
+        with Image.open(stream.name) as image:
+            image.verify()
+            extension = EXTENSIONS.get(image.format)
+        published = _without_metadata(stream) if extension else None
+    except Exception:
+        extension = None
+    if extension is None:
+        _count('rejected')
+        return None
+
+    try:
+        content_hash = published.sha256.hexdigest()
+        blob = db.execute('''
+            INSERT INTO image_blobs (content_hash, image_path, byte_size, ref_count)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (content_hash) DO UPDATE SET ref_count = image_blobs.ref_count + 1
+            RETURNING content_hash, image_path, variants, ref_count
+        ''', (content_hash, f"uploads/{content_hash[:2]}/{content_hash}.{extension}", published.size)).fetchone()
+
+        if blob['ref_count'] > 1 and os.path.exists(_static_path(blob['image_path'])):
+            _count('deduplicated')
+            _count('bytes_deduplicated', published.size)
+        else:
+            _place(published.name, blob['image_path'])
+            _count('stored')
+            _count('bytes_stored', published.size)
+        return blob
+    finally:
+        if published is not stream:
+            published.close()
+
+
+def release(db, image):
+    """
+    Drop a product_images row's reference to its blob (the caller deletes the row and
+    commits); the last reference deletes the blob's row. Files stay until sweep()
+    finds nothing referencing them.
+    """
+    if not image['content_hash']:
+        return
+    blob = db.execute('''
+        UPDATE image_blobs SET ref_count = ref_count - 1
+        WHERE content_hash = ?
+        RETURNING ref_count
+    ''', (image['content_hash'],)).fetchone()
+    _count('released')
+    if blob and blob['ref_count'] <= 0:
+        db.execute('DELETE FROM image_blobs WHERE content_hash = ? AND ref_count <= 0', (image['content_hash'],))
+        _count('collected')
+
+
+def _referenced(db):
+    """Every file (relative to static/) an image_blobs or product_images row points at."""
+    paths = set()
+    for row in db.iterate('''
+        SELECT image_path, variants FROM image_blobs
+        UNION ALL
+        SELECT image_path, variants FROM product_images
+    '''):
+        paths.add(row['image_path'])
+        if row['variants']:
+            paths.update(image_pipeline.variant_files(row['variants']))
+    return paths
+
+
+def _swept_folder(folder):
+    """Whether sweep() looks at a folder: blob folders, variants, temp files and pre-blob originals."""
+    if folder == UPLOAD_FOLDER:
+        return True
+    name = os.path.basename(folder)
+    return os.path.dirname(folder) == UPLOAD_FOLDER and (
+        len(name) == 2 or name == image_pipeline.VARIANT_FOLDER or folder == TMP_FOLDER)
+
+
+def sweep(db, older_than=SWEEP_AGE_SECONDS):
+    """
+    Delete image files no row references (originals and variants of deleted images,
+    blobs placed by uploads whose transaction rolled back) and temp files left by
+    killed workers. Returns files deleted.
+    """
+    cutoff = time.time() - older_than
+    known = _referenced(db)
+    removed = 0
+    for folder, _, filenames in os.walk(UPLOAD_FOLDER):
+        if not _swept_folder(folder):
+            continue
+        is_tmp = folder == TMP_FOLDER
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            relative = os.path.relpath(path, 'static').replace(os.sep, '/')
+            try:
+                if (is_tmp or relative not in known) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('Could not delete image file %s: %s', relative, e)
+    return removed
+
+
+def stats(db):
+    """Blob totals and this process's upload counters (for /api/metrics)."""
+    row = db.execute('''
+        SELECT COUNT(*) AS blobs, COALESCE(SUM(byte_size), 0) AS blob_bytes,
+               COALESCE(SUM(ref_count), 0) AS refs
+        FROM image_blobs
+    ''').fetchone()
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'blobs': row['blobs'],
+        'blob_bytes': row['blob_bytes'],
+        'references': row['refs'],
+        'this_process': process,
+    }
+
+
+def init_app(app):
+    app.request_class = UploadRequest
@@ -0,0 +1,177 @@
+"""
+Product View Counter - Buffered page-view counts and "popular now" trending.
+record() only bumps an in-memory counter, so viewing a product never takes the
+database write lock. Each worker process flushes its buffer in one transaction
+every FLUSH_INTERVAL_SECONDS (or sooner once FLUSH_EVENTS views are waiting):
+one batched UPDATE of products.views plus per-product counts for the current
+BUCKET_SECONDS slot in product_view_buckets, which trending() sums over a window.
+The buffer is also flushed at interpreter exit (gunicorn restarts, max_requests);
+a worker that is killed loses at most one interval's, and about FLUSH_EVENTS, views.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from database import connection
+import image_pipeline
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('VIEW_FLUSH_INTERVAL', 5))
+FLUSH_EVENTS = int(os.environ.get('VIEW_FLUSH_EVENTS', 1000))
+
+# Trending counts are kept per product per slot of this many seconds
+BUCKET_SECONDS = 300
+TRENDING_WINDOW_SECONDS = int(os.environ.get('TRENDING_WINDOW', 3600))
+# Slots older than this are deleted as flushes go by
+BUCKET_RETENTION_SECONDS = 7 * 24 * 3600
+
+_pending = Counter()
+_pending_total = [0]
+_pending_lock = threading.Lock()
+# Serialises flushes within the process (flush thread, full buffer, exit)
+_flush_lock = threading.Lock()
+_flusher = {'pid': None, 'pruned_at': 0.0}
+_flusher_lock = threading.Lock()
+
+_counters = {'recorded': 0, 'flushed': 0, 'flushes': 0, 'flush_s': 0.0, 'failed_flushes': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def bucket_of(timestamp):
+    return int(timestamp) // BUCKET_SECONDS
+
+
+def record(product_id):
+    """Count one view of a product (public product_id)."""
+    _ensure_flusher()
+    with _pending_lock:
+        _pending[product_id] += 1
+        _pending_total[0] += 1
+        waiting = _pending_total[0]
+    _count('recorded')
+    # The viewer that fills the buffer flushes it, unless a flush is already under way
+    if waiting >= FLUSH_EVENTS and _flush_lock.acquire(blocking=False):
+        try:
+            _flush()
+        finally:
+            _flush_lock.release()
+
+
+def flush(db=None):
+    """Write this process's buffered views. Returns the number of views written."""
+    with _flush_lock:
+        return _flush(db)
+
+
+def _flush(db=None):
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _pending_total[0] = 0
+    if not batch:
+        return 0
+
+    start = time.perf_counter()
+    try:
+        if db is None:
+            with connection() as conn:
+                _write(conn, batch)
+        else:
+            _write(db, batch)
+    except Exception:
+        # Put the views back for the next flush
+        logger.exception('Flushing %s product views failed', sum(batch.values()))
+        with _pending_lock:
+            _pending.update(batch)
+            _pending_total[0] += sum(batch.values())
+        _count('failed_flushes')
+        return 0
+
+    views = sum(batch.values())
+    _count('flushed', views)
+    _count('flushes')
+    _count('flush_s', time.perf_counter() - start)
+    return views
+
+
+def _write(db, batch):
+    now = time.time()
+    items = sorted(batch.items())
+    db.executemany('UPDATE products SET views = views + ? WHERE product_id = ?',
+                   [(count, product_id) for product_id, count in items])
+    db.executemany('''
+        INSERT INTO product_view_buckets (product_id, bucket, views) VALUES (?, ?, ?)
+        ON CONFLICT (product_id, bucket) DO UPDATE SET views = product_view_buckets.views + excluded.views
+    ''', [(product_id, bucket_of(now), count) for product_id, count in items])
+    # Drop expired slots once per slot rather than on every flush
+    if now - _flusher['pruned_at'] >= BUCKET_SECONDS:
+        db.execute('DELETE FROM product_view_buckets WHERE bucket < ?',
+                   (bucket_of(now - BUCKET_RETENTION_SECONDS),))
+        _flusher['pruned_at'] = now
+    db.commit()
+
+
+def _run():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush()
+        except Exception:
+            logger.exception('Product view flush failed')
+
+
+def _ensure_flusher():
+    """Start this process's flush thread (gunicorn workers fork after import)."""
+    if _flusher['pid'] == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        _flusher['pid'] = os.getpid()
+        threading.Thread(target=_run, name='view-counter', daemon=True).start()
+
+
+atexit.register(flush)
+
+
+def trending(db, limit=8, window_seconds=TRENDING_WINDOW_SECONDS):
+    """Active products with the most views in the last window_seconds, busiest first."""
+    return db.execute(f'''
+        SELECT p.*, s.store_name, s.store_slug, v.recent_views, {image_pipeline.PRIMARY_IMAGE_COLUMNS}
+        FROM (
+            SELECT product_id, SUM(views) AS recent_views
+            FROM product_view_buckets
+            WHERE bucket >= ?
+            GROUP BY product_id
+        ) v
+        JOIN products p ON p.product_id = v.product_id
+        JOIN sellers s ON p.seller_id = s.id
+        {image_pipeline.PRIMARY_IMAGE_JOIN}
+        WHERE p.status = 'active'
+        ORDER BY v.recent_views DESC, p.id DESC
+        LIMIT ?
+    ''', (bucket_of(time.time() - window_seconds), limit)).fetchall()
+
+
+def stats():
+    """This process's buffer and flush counters (for /api/metrics)."""
+    with _pending_lock:
+        pending = _pending_total[0]
+    with _counters_lock:
+        process = dict(_counters)
+    return {
+        'pending': pending,
+        'flush_interval_s': FLUSH_INTERVAL_SECONDS,
+        'this_process': {key: round(value, 3) if isinstance(value, float) else value
+                         for key, value in process.items()},
+    }
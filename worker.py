@@ -0,0 +1,114 @@
+"""
+Background job worker - runs queued jobs from the `jobs` table (see jobs.py).
+Procfile: worker: python worker.py --threads 4 --processes 1
+
+Each process runs `--threads` claiming threads, the Paynow status poller, the
+BNPL reminder/late-fee scheduler, and housekeeping (re-queueing jobs from dead
+workers, purging old finished jobs and orphaned upload files, queueing the nightly
+credit rescore).
+Stop with Ctrl+C / SIGTERM.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=int(os.getenv('JOB_WORKER_THREADS', 4)),
+                        help='worker threads per process')
+    parser.add_argument('--processes', type=int, default=int(os.getenv('JOB_WORKER_PROCESSES', 1)),
+                        help='worker processes')
+    parser.add_argument('--poll-interval', type=float, help='seconds an idle thread waits between polls')
+    parser.add_argument('--no-paynow-poller', action='store_true', help='do not poll outstanding Paynow payments')
+    parser.add_argument('--no-reminders', action='store_true', help='do not run the BNPL reminder/late-fee scheduler')
+    return parser.parse_args()
+
+
+args = parse_args()
+# One connection per worker thread plus the poller, reminders and housekeeping
+os.environ.setdefault('DB_POOL_SIZE', str(args.threads + 3))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import app as zimapp  # registers every @jobs.task (blueprints included)
+import bnpl
+import bnpl_reminders
+import credit_scoring
+import jobs
+import paynow_poller
+import uploads
+from database import connection
+
+HOUSEKEEPING_INTERVAL = 60
+PURGE_INTERVAL = 3600
+
+logger = logging.getLogger('worker')
+
+
+def run_process():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    poll_interval = args.poll_interval or jobs.POLL_INTERVAL
+    threads = [threading.Thread(target=jobs.work, args=(stop,), kwargs={'poll_interval': poll_interval},
+                                name=f'jobs-{n}', daemon=True) for n in range(args.threads)]
+    if not args.no_paynow_poller:
+        threads.append(threading.Thread(target=paynow_poller.run, args=(stop, bnpl.PAYNOW_INTEGRATION_KEY),
+                                        name='paynow-poller', daemon=True))
+    if not args.no_reminders:
+        threads.append(threading.Thread(target=bnpl_reminders.run, args=(stop,), name='bnpl-reminders', daemon=True))
+    for thread in threads:
+        thread.start()
+    logger.info('Worker %s running %s threads', os.getpid(), args.threads)
+
+    since_purge = PURGE_INTERVAL
+    while not stop.wait(HOUSEKEEPING_INTERVAL):
+        with connection() as db:
+            requeued = jobs.requeue_stale(db)
+            if requeued:
+                logger.warning('Re-queued %s jobs from dead workers', requeued)
+            if credit_scoring.schedule_nightly(db):
+                logger.info('Queued the nightly credit rescore')
+            since_purge += HOUSEKEEPING_INTERVAL
+            if since_purge >= PURGE_INTERVAL:
+                jobs.purge(db)
+                swept = uploads.sweep(db)
+                if swept:
+                    logger.info('Deleted %s orphaned upload files', swept)
+                since_purge = 0
+
+    for thread in threads:
+        thread.join()
+    logger.info('Worker %s stopped', os.getpid())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+    zimapp.init_db()
+
+    if args.processes <= 1:
+        run_process()
+        return
+
+    children = [multiprocessing.Process(target=run_process, name=f'worker-{n}') for n in range(args.processes)]
+    for child in children:
+        child.start()
+    # Ctrl+C reaches the children directly; SIGTERM (Heroku/Render) is forwarded
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [child.terminate() for child in children])
+    for child in children:
+        child.join()
+    sys.exit(max(child.exitcode or 0 for child in children))
+
+
+if __name__ == '__main__':
+    main()